@@ -3,13 +3,33 @@ import os
 from abc import ABC, abstractmethod
 from datetime import datetime
 
+import numpy as np
+
 from Attacks.BaseAttack import BaseAttack
-from Ulitities.Image import Picture
+from Ulitities.Image.Picture import Picture
+from Ulitities.Visualizers.AsyncVisualizer import AsyncVisualizer
+from Ulitities.io.metrics import MetricsStream
 
 
 class BaseIterativeAttack(BaseAttack, ABC):
     name = "Base Iterative Attack"
 
+    # how often (# steps) should the state of the attack be saved into the checkpoint file of the debug folder?
+    # 0 -> never
+    checkpoint_interval = 10
+
+    # name of the checkpoint file inside the debug folder
+    checkpoint_file = "checkpoint.npz"
+
+    # render the step-visualizations in a background process with its own detector instead of blocking the attack
+    async_visualization = False
+
+    # maximum number of step-visualizations waiting to be rendered, when exceeded the oldest one is dropped
+    visualization_queue_size = 4
+
+    # name of the file of the debug folder where the metrics of each step are appended (.jsonl or .csv)
+    metrics_file = "metrics.jsonl"
+
     def __init__(self, target_image: Picture, target_image_mask: Picture, detector: str, steps: int,
                  plot_interval: int = 5, additive_attack=True, debug_root: str = "./Data/Debug/",
                  test: bool = True):
@@ -38,6 +58,29 @@ class BaseIterativeAttack(BaseAttack, ABC):
         # counter of the attack iterations that have been applied to the image
         self.step_counter = 0
 
+        # image to use as input of the first step when the attack is resumed from a checkpoint (additive attacks only)
+        self._resumed_image = None
+
+        # background worker rendering the step-visualizations, started at the first visualization
+        self._step_visualizer = None
+
+        # stream of the metrics of each step, the last row records why the attack stopped early
+        self.metrics = MetricsStream(os.path.join(str(self.debug_folder), self.metrics_file),
+                                     extra_columns=["stop_reason"])
+
+        # starting time of the current step
+        self._step_start_time = None
+
+        # starting time of the loop of the steps, after the pre-attack operations (e.g. the computation of the target
+        # representation)
+        self.loop_start_time = None
+
+        # criteria checked after each step to stop the attack early (see Attacks.StoppingCriteria)
+        self.stopping_criteria = []
+
+        # reason why the attack stopped before executing all the steps, None if it executed all of them
+        self.stop_reason = None
+
         # create a folder where to store the data generated at each step
         self.steps_debug_folder = os.path.join(str(self.debug_folder), "steps")
         if self.plot_interval > 0:
@@ -53,15 +96,18 @@ class BaseIterativeAttack(BaseAttack, ABC):
 
         # execute post-attack operations
         self._on_before_attack()
+        self.loop_start_time = datetime.now()
 
-        # iterate the attack for the given amount of steps
+        # iterate the attack for the given amount of steps, starting from the step of the checkpoint if the attack
+        # has been resumed
         attacked_image = pristine_image
-        for self.step_counter in range(0, self.steps):
+        if self._resumed_image is not None:
+            attacked_image = self._resumed_image
+
+        for self.step_counter in range(self.step_counter, self.steps):
 
             # print logs
-            self.write_to_logs("\n### Step: {} ###".format(self.step_counter), force_print=True)
-            step_start_time = datetime.now()
-            self.write_to_logs(" start at: {}".format(step_start_time), force_print=False)
+            step_start_time = self._log_step_start()
 
             # if the attack is not additive, remove the effect of the previous iteration
             if not self.additive_attack:
@@ -76,14 +122,140 @@ class BaseIterativeAttack(BaseAttack, ABC):
             # execute post-step operations
             self._on_after_attack_step(attacked_image)
 
-            self.write_to_logs(" ended at: {}".format(datetime.now()), force_print=False)
-            self.write_to_logs(" duration: {}".format(datetime.now() - step_start_time))
+            self._log_step_end(step_start_time)
+
+            stop = self._check_stopping_criteria(attacked_image)
+
+            self._on_checkpoint_step(attacked_image, force=stop)
+
+            if stop:
+                break
 
         # execute post-attack operations
         self._on_after_attack(attacked_image)
 
         return attacked_image
 
+    def _check_stopping_criteria(self, attacked_image: Picture) -> bool:
+        """
+        Check if any of the stopping criteria is met after the current step, recording the reason into the logs and
+        the metrics
+        :param attacked_image: image produced by the current step
+        :return: True if the attack should stop
+        """
+        for criterion in self.stopping_criteria:
+            reason = criterion.should_stop(self, attacked_image)
+            if reason is not None:
+                self.stop_reason = reason
+                self.write_to_logs("Stopping after step {}: {}".format(self.step_counter, reason))
+                self.metrics.write(step=self.step_counter + 1, stop_reason=reason)
+                return True
+
+        return False
+
+    def _on_checkpoint_step(self, attacked_image: Picture, force: bool = False):
+        """
+        Save a checkpoint if it is due after the current step (every checkpoint_interval steps and after the last step)
+        :param attacked_image: image produced by the current step
+        :param force: save the checkpoint even if it is not due (e.g. the attack is stopping early)
+        :return:
+        """
+        if self.checkpoint_interval <= 0:
+            return
+
+        if force or (self.step_counter + 1) % self.checkpoint_interval == 0 or self.step_counter + 1 == self.steps:
+            self.save_checkpoint(attacked_image)
+
+    def _get_checkpoint_state(self, attacked_image: Picture) -> dict:
+        """
+        Collect the state needed to continue the attack from the step after the current one
+        :param attacked_image: image produced by the current step
+        :return: dictionary of numpy arrays
+        """
+        state = dict()
+        state["attack_name"] = np.array(type(self).__name__)
+        state["step_counter"] = np.array(self.step_counter + 1)
+
+        # the input of the next step of an additive attack is the output of this step
+        if self.additive_attack:
+            state["attacked_image"] = np.array(attacked_image, dtype=np.float32)
+
+        return state
+
+    def _set_checkpoint_state(self, state: dict, checkpoint_folder: str):
+        """
+        Restore the state saved by _get_checkpoint_state
+        :param state: dictionary of numpy arrays loaded from the checkpoint
+        :param checkpoint_folder: folder containing the checkpoint, used to resolve the files it references
+        :return:
+        """
+        if str(state["attack_name"]) != type(self).__name__:
+            raise ValueError("The checkpoint belongs to a {} not to a {}".format(state["attack_name"],
+                                                                                 type(self).__name__))
+
+        self.step_counter = int(state["step_counter"])
+
+        if "attacked_image" in state:
+            self._resumed_image = Picture(state["attacked_image"].astype(float))
+
+    def save_checkpoint(self, attacked_image: Picture):
+        """
+        Save the state of the attack into the checkpoint file of the debug folder, the previous checkpoint is replaced
+        atomically so that a checkpoint is always available even if the process is killed while writing
+        :param attacked_image: image produced by the current step
+        :return:
+        """
+        path = os.path.join(self.debug_folder, self.checkpoint_file)
+        temporary_path = path + ".tmp"
+
+        with open(temporary_path, "wb") as file:
+            np.savez(file, **self._get_checkpoint_state(attacked_image))
+        os.replace(temporary_path, path)
+
+        # keep the metrics file up to date with the checkpoint
+        self.metrics.flush()
+
+        self.write_to_logs(" checkpoint saved", force_print=False)
+
+    def resume(self, run: str):
+        """
+        Load the state of a previous execution of this attack, execute will continue from the step after the checkpoint
+        :param run: debug folder of the previous execution or path of its checkpoint file
+        :return:
+        """
+        path = run
+        if os.path.isdir(run):
+            path = os.path.join(run, self.checkpoint_file)
+
+        if not os.path.exists(path):
+            raise FileNotFoundError("No checkpoint found at {}".format(path))
+
+        with np.load(path) as checkpoint:
+            state = {key: checkpoint[key] for key in checkpoint.files}
+
+        self._set_checkpoint_state(state, os.path.dirname(os.path.abspath(path)))
+
+        self.write_to_logs("Resumed from: {} (step {})".format(path, self.step_counter))
+
+    def _log_step_start(self):
+        """
+        Write into the logs the beginning of the current step
+        :return: starting time of the step
+        """
+        self.write_to_logs("\n### Step: {} ###".format(self.step_counter), force_print=True)
+        self._step_start_time = datetime.now()
+        self.write_to_logs(" start at: {}".format(self._step_start_time), force_print=False)
+        return self._step_start_time
+
+    def _log_step_end(self, step_start_time):
+        """
+        Write into the logs the end of the current step
+        :param step_start_time: starting time of the step returned by _log_step_start
+        :return:
+        """
+        self.write_to_logs(" ended at: {}".format(datetime.now()), force_print=False)
+        self.write_to_logs(" duration: {}".format(datetime.now() - step_start_time))
+
     def _on_before_attack_step(self, image: Picture, *args, **kwargs):
         """
         Instructions to perform before the attack step
@@ -99,10 +271,34 @@ class BaseIterativeAttack(BaseAttack, ABC):
         :return:
         """
         if self.plot_interval > 0 and (self.step_counter + 1) % self.plot_interval == 0:
-            self.detector.prediction_pipeline(attacked_image,
-                                              path=os.path.join(self.steps_debug_folder, str(self.step_counter + 1))
-                                              , original_picture=self.target_image, omask=self.target_image_mask,
-                                              note=self.step_note())
+            self._visualize_step(attacked_image, os.path.join(self.steps_debug_folder, str(self.step_counter + 1)),
+                                 self.step_note())
+
+    def _visualize_step(self, image: Picture, path: str, note: str):
+        """
+        Generate a step-visualization, in the background worker if async_visualization is set
+        :param image: image to visualize
+        :param path: path of the visualization
+        :param note: note to print on the visualization
+        :return:
+        """
+        if not self.async_visualization:
+            self.detector.prediction_pipeline(image, path=path, original_picture=self.target_image,
+                                              omask=self.target_image_mask, note=note)
+            return
+
+        if self._step_visualizer is None:
+            self._step_visualizer = AsyncVisualizer(type(self.detector), self._step_visualizer_settings(),
+                                                    self.visualization_queue_size)
+
+        self._step_visualizer.prediction_pipeline(image, path, original_picture=self.target_image,
+                                                  omask=self.target_image_mask, note=note)
+
+    def _step_visualizer_settings(self) -> dict:
+        """
+        :return: attributes to set on the visualizer of the background worker
+        """
+        return dict()
 
     def _on_before_attack(self):
         """
@@ -114,11 +310,31 @@ class BaseIterativeAttack(BaseAttack, ABC):
         self.write_to_logs("Steps: {}".format(self.steps))
         self.write_to_logs("Plot interval: {}".format(self.plot_interval))
         self.write_to_logs("Additive attack: {}".format(self.additive_attack))
+        self.write_to_logs("Stopping criteria: {}".format(
+            ", ".join(type(criterion).__name__ for criterion in self.stopping_criteria) or "None"))
 
         if self.plot_interval > 0 and not self.test:
-            self.detector.prediction_pipeline(self.target_image, path=os.path.join(self.steps_debug_folder, str(0))
-                                              , original_picture=self.target_image, omask=self.target_image_mask,
-                                              note="Initial state")
+            self._visualize_step(self.target_image, os.path.join(self.steps_debug_folder, str(0)), "Initial state")
+
+    def _on_after_attack(self, attacked_image: Picture):
+        """
+        Wait for the pending step-visualizations before generating the final result
+        :param attacked_image: final attacked image
+        :return:
+        """
+        if self.stop_reason is not None:
+            self.write_to_logs("Attack stopped after {} of {} steps: {}".format(self.step_counter + 1, self.steps,
+                                                                              self.stop_reason))
+
+        self.metrics.close()
+
+        if self._step_visualizer is not None:
+            self._step_visualizer.close()
+            self.write_to_logs("Step visualizations: {} requested, {} dropped".format(
+                self._step_visualizer.submitted, self._step_visualizer.dropped))
+            self._step_visualizer = None
+
+        super()._on_after_attack(attacked_image)
 
     def step_note(self):
         """
@@ -126,6 +342,14 @@ class BaseIterativeAttack(BaseAttack, ABC):
         """
         return "Step:{}".format(self.step_counter + 1)
 
+    def detector_score(self, attacked_image: Picture) -> float:
+        """
+        Score assigned by the detector to the attacked image, used by the DetectorScoreReached stopping criterion
+        :param attacked_image: image to score
+        :return: score, lower values mean a more successful attack
+        """
+        raise NotImplementedError("{} does not define a detector score".format(type(self).__name__))
+
     @property
     def progress_proportion(self):
         """
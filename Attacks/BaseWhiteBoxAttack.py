@@ -1,34 +1,16 @@
 import argparse
 import os
 from abc import ABC, abstractmethod
+from datetime import datetime
+
 import numpy as np
 from cv2 import PSNR
 from Attacks.BaseIterativeAttack import BaseIterativeAttack
+from Attacks.Optimizers import Momentum, normalize_gradient
+from Attacks.TargetRepresentationCache import TargetRepresentationCache
 from Ulitities.Image.Picture import Picture
 
 
-def normalize_gradient(gradient, margin=17):
-    """
-    Normalize the gradient cutting away the values on the borders
-    :param margin: margin to use along the bordes
-    :param gradient: gradient to normalize
-    :return: normalized gradient
-    """
-
-    # set to 0 part of the gradient too near to the border
-    if margin > 0:
-        gradient[0:margin, :] = 0
-        gradient[-margin:, :] = 0
-        gradient[:, 0:margin] = 0
-        gradient[:, -margin:] = 0
-
-    # scale the final gradient using the computed infinity norm
-    if np.max(np.abs(gradient)) > 0:
-        gradient = gradient / np.max(np.abs(gradient))
-
-    return gradient
-
-
 class BaseWhiteBoxAttack(BaseIterativeAttack, ABC):
     """
     This class in used as a base to implement attacks whose aim is to reproduce some kind of "target representation"
@@ -36,6 +18,17 @@ class BaseWhiteBoxAttack(BaseIterativeAttack, ABC):
 
     name = "Base Mimicking Attack"
 
+    # name of the file of the debug folder storing the target representation referenced by the checkpoints
+    target_representation_file = "target_representation.npz"
+
+    # cache of the target representations (see target_representation_key), e.g. a TargetRepresentationCache shared by
+    # the attacks of a batch run, None to always compute them
+    target_representation_cache = None
+
+    # version of the computation of the target representation, increase it when _compute_target_representation changes
+    # to invalidate the cached target representations
+    target_representation_version = 1
+
     def __init__(self, target_image: Picture, target_image_mask: Picture, source_image: Picture,
                  source_image_mask: Picture, detector: str, steps: int, alpha: float,momentum_coeficient: float = 0.5,
                  regularization_weight=0.05, plot_interval=5, additive_attack=True,
@@ -81,19 +74,25 @@ class BaseWhiteBoxAttack(BaseIterativeAttack, ABC):
         # create list for tracking the PSNR during iterations
         self.psnr_steps = [999]
 
+        # norm of the gradient of the last step before its normalization (None if it is not available)
+        self._last_gradient_norm = None
+
         # variable to store the detector engine
         self._engine = None
 
+        # attacked image produced by the current noise, computed when it is first requested (see attacked_image)
+        self._attacked_image = None
+
         # variable used to store the generated adversarial noise
         self.noise = None
 
-        # create variable to store the momentum of the gradient
-        self.moving_avg_gradient = None
-
         # variable to control the strength of the momentum
         assert (0 <= momentum_coeficient <= 1)
         self.momentum_coeficient = momentum_coeficient
 
+        # update rule of the attack, it can be replaced before executing the attack (see Attacks.Optimizers)
+        self.optimizer = Momentum(momentum_coeficient)
+
     def _on_before_attack(self):
         """
         Write the input parameters into the logs, generate target representation
@@ -103,11 +102,12 @@ class BaseWhiteBoxAttack(BaseIterativeAttack, ABC):
 
         self.write_to_logs("Source image: {}".format(self.source_image.path))
         self.write_to_logs("Alpha: {}".format(self.alpha))
-        self.write_to_logs("Momentum coefficient:{}".format(self.momentum_coeficient))
+        self.write_to_logs("Optimizer: {}".format(self.optimizer))
         self.write_to_logs("Regularization weight:{}".format(self.regularization_weight))
 
-        # compute the target representation
-        self.target_representation = self._compute_target_representation(self.source_image, self.source_image_mask)
+        # compute the target representation (unless it has been restored from a checkpoint)
+        if self.target_representation is None:
+            self.target_representation = self._get_target_representation()
 
         if self.source_image.path != self.target_image.path and not self.test:
             self.detector.prediction_pipeline(self.source_image,
@@ -126,54 +126,240 @@ class BaseWhiteBoxAttack(BaseIterativeAttack, ABC):
 
         # compute the PSNR between the initial image
         psnr = PSNR(self.target_image, np.array(attacked_image, np.int))
+
+        self._record_step(attacked_image, psnr)
+
+    def _record_step(self, attacked_image: Picture, psnr: float, step_time: float = None):
+        """
+        Track the PSNR of the step, append the metrics of the step to the metrics stream, update the logs and generate
+        the step visualization
+        :param attacked_image: image produced by the step, it is used only if the step has to be visualized
+        :param psnr: PSNR of the attacked image w.r.t. the target image
+        :param step_time: duration of the step [s], if None it is measured from the start of the step
+        :return:
+        """
         self.psnr_steps.append(psnr)
 
-        super()._on_after_attack_step(attacked_image)
+        super(BaseWhiteBoxAttack, self)._on_after_attack_step(attacked_image)
 
-        self.detector.plot_graph(self.loss_steps[1:], "Loss", "Attack iteration",
-                                 os.path.join(self.debug_folder, "loss"))
-        self.detector.plot_graph(self.psnr_steps[1:], "PSNR", "Attack iteration",
-                                 os.path.join(self.debug_folder, "psnr"))
+        if step_time is None and self._step_start_time is not None:
+            step_time = (datetime.now() - self._step_start_time).total_seconds()
+
+        self.metrics.write(step=self.step_counter + 1, loss=float(self.loss_steps[-1]), psnr=float(psnr),
+                           step_time=step_time, alpha=self._step_alpha(), gradient_norm=self._last_gradient_norm)
 
         #write the loss and psnr into the log
         self.write_to_logs("Loss: {:.2f}".format(self.loss_steps[-1]))
         self.write_to_logs("Psnr: {:.2f}".format(psnr))
 
+    def _get_checkpoint_state(self, attacked_image: Picture) -> dict:
+        """
+        Add the noise, the momentum and the history of the loss and of the PSNR to the checkpoint state, the target
+        representation is saved once into its own file and referenced by the checkpoints
+        :param attacked_image: image produced by the current step
+        :return: dictionary of numpy arrays
+        """
+        state = super(BaseWhiteBoxAttack, self)._get_checkpoint_state(attacked_image)
+
+        state["noise"] = np.array(self.noise, dtype=np.float32)
+
+        state["optimizer"] = np.array(type(self.optimizer).__name__)
+        for key, value in self.optimizer.get_state().items():
+            state["optimizer_" + key] = np.array(value, dtype=np.float32)
+        state["loss_steps"] = np.array([float(loss) for loss in self.loss_steps], dtype=np.float32)
+        state["psnr_steps"] = np.array([float(psnr) for psnr in self.psnr_steps], dtype=np.float32)
+
+        path = os.path.join(self.debug_folder, self.target_representation_file)
+        if not os.path.exists(path):
+            with open(path + ".tmp", "wb") as file:
+                np.savez(file, target_representation=np.array(self.target_representation, dtype=np.float32))
+            os.replace(path + ".tmp", path)
+
+        state["target_representation_file"] = np.array(self.target_representation_file)
+
+        return state
+
+    def _set_checkpoint_state(self, state: dict, checkpoint_folder: str):
+        """
+        Restore the state saved by _get_checkpoint_state, loading the referenced target representation
+        :param state: dictionary of numpy arrays loaded from the checkpoint
+        :param checkpoint_folder: folder containing the checkpoint, used to resolve the files it references
+        :return:
+        """
+        super(BaseWhiteBoxAttack, self)._set_checkpoint_state(state, checkpoint_folder)
+
+        if state["noise"].shape != np.shape(self.noise):
+            raise ValueError("The checkpoint noise has shape {} while the attack expects {}".format(
+                state["noise"].shape, np.shape(self.noise)))
+
+        if str(state["optimizer"]) != type(self.optimizer).__name__:
+            raise ValueError("The checkpoint has been produced by the {} optimizer, not by the {} one".format(
+                state["optimizer"], type(self.optimizer).__name__))
+
+        self.noise = state["noise"].astype(np.asarray(self.noise).dtype)
+        self.optimizer.set_state({key[len("optimizer_"):]: value for key, value in state.items()
+                                  if key.startswith("optimizer_")})
+        self.loss_steps = [float(loss) for loss in state["loss_steps"]]
+        self.psnr_steps = [float(psnr) for psnr in state["psnr_steps"]]
+
+        with np.load(os.path.join(checkpoint_folder, str(state["target_representation_file"]))) as file:
+            self.target_representation = self._restore_target_representation(file["target_representation"])
+
+    def _restore_target_representation(self, target_representation: np.array):
+        """
+        Convert the target representation loaded from a checkpoint or from the cache into the format returned by
+        _compute_target_representation
+        :param target_representation: numpy array containing the target representation
+        :return: target representation
+        """
+        return Picture(target_representation)
+
+    def _get_target_representation(self):
+        """
+        Load the target representation from the target representation cache, computing (and caching) it if it is not
+        there
+        :return: target representation
+        """
+        cache = self.target_representation_cache
+        key = self.target_representation_key() if cache is not None else None
+
+        if key is not None:
+            cached = cache.get(key)
+            if cached is not None:
+                self.write_to_logs("Target representation loaded from the cache")
+                return self._restore_target_representation(cached)
+
+        target_representation = self._compute_target_representation(self.source_image, self.source_image_mask)
+
+        if key is not None:
+            cache.put(key, np.asarray(target_representation))
+
+        return target_representation
+
+    def target_representation_key(self):
+        """
+        Key of the target representation of the attack in the target representation cache, computed from the pixels
+        and the mask of the source image, the class of the attack, target_representation_version, the version of the
+        detector and the parameters returned by _target_representation_parameters. Override it to change what
+        identifies the target representation of an attack, return None to disable the cache
+        :return: hexadecimal digest or None
+        """
+        return TargetRepresentationCache.make_key([self.source_image, self.source_image_mask],
+                                                  attack=type(self).__name__,
+                                                  version=self.target_representation_version,
+                                                  detector=self._detector_version(),
+                                                  **self._target_representation_parameters())
+
+    def _target_representation_parameters(self) -> dict:
+        """
+        :return: parameters of the attack its target representation depends on (e.g. quality factor, patch size,
+            stride), numpy arrays or values with a stable representation
+        """
+        return dict()
+
+    def _detector_version(self) -> str:
+        """
+        :return: string identifying the detector (e.g. its weights) used to compute the target representation
+        """
+        return self.detector.name
+
     def attack(self, image_to_attack: Picture, *args, **kwargs):
         """
         Perform step of the attack executing the following steps:
+            (1) -> apply the lookahead of the optimizer (Nesterov momentum) to the image
             (2) -> compute the gradient
-            (3) -> normalize the gradient
-            (4) -> apply the gradient to the image with the desired strength
+            (3) -> let the optimizer turn the gradient into an update with the desired strength
+            (4) -> apply the update to the image
             (5) -> return the image
         :return: attacked image
         """
 
         # apply Nesterov momentum
-        image_to_attack = np.array(image_to_attack, dtype=float) - self.moving_avg_gradient
+        image_to_attack = self._get_step_input(image_to_attack)
 
         # compute the gradient
         image_gradient, loss = self._get_gradient_of_image(image_to_attack, self.target_representation,
                                                            Picture(self.noise))
 
+        return self._apply_gradient(image_gradient, loss)
+
+    def _get_step_input(self, image_to_attack: Picture):
+        """
+        Compute the image on which the gradient of the current step has to be computed
+        :param image_to_attack: image given as input to the attack step
+        :return: image shifted by the lookahead of the optimizer (Nesterov momentum)
+        """
+        return np.array(image_to_attack, dtype=float) - self.optimizer.lookahead()
+
+    def _apply_gradient(self, image_gradient, loss):
+        """
+        Update the state of the optimizer and the cumulative noise using the gradient computed at the current step
+        :param image_gradient: gradient of the image returned by _get_gradient_of_image
+        :param loss: loss returned by _get_gradient_of_image
+        :return: attacked image
+        """
+
         # save loss value to plot it
         self.loss_steps.append(loss)
 
         # compute the decaying alpha
-        alpha = self.alpha / (1 + 0.05 * self.step_counter)
-
-        # normalize the gradient
-        image_gradient = normalize_gradient(image_gradient, 0) * alpha
+        alpha = self._step_alpha()
 
-        # update the moving average
-        self.moving_avg_gradient = self.moving_avg_gradient * self.momentum_coeficient + (
-                    1 - self.momentum_coeficient) * image_gradient
+        self._last_gradient_norm = float(np.linalg.norm(image_gradient))
 
         # add this iteration contribution to the cumulative noise
-        self.noise += self.moving_avg_gradient / (1 - self.momentum_coeficient ** (1 + self.step_counter))
+        self.noise += self.optimizer.step(image_gradient, alpha, self.step_counter)
 
         return self.attacked_image
 
+    @property
+    def noise(self):
+        """
+        Adversarial noise subtracted from the target image, the attacked image is recomputed whenever it is assigned
+        (also by augmented assignments like +=)
+        :return:
+        """
+        return self._noise
+
+    @noise.setter
+    def noise(self, value):
+        self._noise = value
+        self._attacked_image = None
+
+    @property
+    def moving_avg_gradient(self):
+        """
+        Velocity of the momentum optimizer, None for the other optimizers
+        :return:
+        """
+        if isinstance(self.optimizer, Momentum):
+            return self.optimizer.velocity
+        return None
+
+    @moving_avg_gradient.setter
+    def moving_avg_gradient(self, value):
+        if isinstance(self.optimizer, Momentum):
+            self.optimizer.velocity = value
+
+    def _step_alpha(self):
+        """
+        :return: strength of the current step, alpha decays with the number of steps
+        """
+        return self.alpha / (1 + 0.05 * self.step_counter)
+
+    def _on_after_attack(self, attacked_image: Picture):
+        """
+        Render the graphs of the loss and of the PSNR once the attack is over
+        :param attacked_image: final attacked image
+        :return:
+        """
+        super(BaseWhiteBoxAttack, self)._on_after_attack(attacked_image)
+
+        self.detector.plot_graph(self.loss_steps[1:], "Loss", "Attack iteration",
+                                 os.path.join(self.debug_folder, "loss"))
+        self.detector.plot_graph(self.psnr_steps[1:], "PSNR", "Attack iteration",
+                                 os.path.join(self.debug_folder, "psnr"))
+
     @abstractmethod
     def _get_gradient_of_image(self, image: Picture, target: Picture, old_perturbation: Picture = None):
         """
@@ -203,6 +389,17 @@ class BaseWhiteBoxAttack(BaseIterativeAttack, ABC):
 
     @property
     def attacked_image(self):
+        """
+        Attacked image produced by the current noise, it is computed once after each change of the noise. Treat it as
+        read only: it may share its memory with the attack and be overwritten when the noise changes, copy it to keep
+        the image of a step
+        :return:
+        """
+        if self._attacked_image is None:
+            self._attacked_image = self._compute_attacked_image()
+        return self._attacked_image
+
+    def _compute_attacked_image(self):
         """
         Compute the attacked image using the original image and the cumulative noise to reduce
         rounding artifacts caused by translating the noise from one to 3 channels and vie versa multiple times,
@@ -1,8 +1,10 @@
+import os
 from abc import ABC
 
 import numpy as np
 import tensorflow as tf
 from Attacks.BaseWhiteBoxAttack import BaseWhiteBoxAttack
+from Attacks.TargetRepresentationCache import files_signature
 from Detectors.Exif.ExifEngine import ExifEngine
 from Detectors.Exif.lib.utils import ops
 from Detectors.Exif.models.exif import exif_net
@@ -58,6 +60,12 @@ class BaseExifAttack(BaseWhiteBoxAttack, ABC):
         self.gradient_op = None
         self.loss_op = None
 
+    def _detector_version(self) -> str:
+        """
+        :return: signature of the weights of the exif model
+        """
+        return files_signature(os.path.dirname(self.detector._engine.ckpt_path))
+
     def _on_before_attack(self):
         """
         Populate the gradent_op and loss_op variables
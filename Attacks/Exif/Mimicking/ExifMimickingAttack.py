@@ -48,6 +48,12 @@ class ExifMimickingAttack(BaseExifAttack):
 
         self.stride = (stride, stride)
 
+    def _target_representation_parameters(self) -> dict:
+        """
+        :return: size and stride of the patches whose features form the target representation
+        """
+        return dict(patch_size=tuple(self.patch_size), stride=tuple(self.stride))
+
     def _compute_target_representation(self, target_representation_source_image: Picture,
                                        target_representation_source_image_mask: Picture):
         """
@@ -80,6 +86,14 @@ class ExifMimickingAttack(BaseExifAttack):
 
             return target_representation
 
+    def _restore_target_representation(self, target_representation: np.array):
+        """
+        Convert the target representation loaded from a checkpoint back into a list of feature vectors
+        :param target_representation: numpy array in the shape N x 4096
+        :return: list of 4096-dimensional feature vectors
+        """
+        return list(target_representation)
+
     def _get_gradient_of_image(self, image: Picture, target: list, old_perturbation: Picture = None):
         """
         Function to compute the gradient of the exif model on the entire image
@@ -1,10 +1,14 @@
 from abc import ABC, abstractmethod
+from datetime import datetime
 
 import numpy as np
 import tensorflow as tf
 
 from Attacks.BaseWhiteBoxAttack import BaseWhiteBoxAttack
-from Detectors.Noiseprint.noiseprintEngine import NoiseprintEngine
+from Attacks.Optimizers import Momentum
+from Attacks.TargetRepresentationCache import files_signature
+from Detectors.Noiseprint.noiseprintEngine import NoiseprintEngine, search_threshold
+from Detectors.Noiseprint.utility.morphology import maxFilter
 from Detectors.Noiseprint.utility.utility import jpeg_quality_of_file, prepare_image_noiseprint
 from Ulitities.Image.Picture import Picture
 
@@ -16,6 +20,37 @@ class BaseNoiseprintAttack(BaseWhiteBoxAttack, ABC):
 
     name = "Base Noiseprint Attack"
 
+    # compute the gradients with the compiled _gradient_step (True) or with an eager gradient tape (False). The compiled
+    # step uses batch_loss: subclasses overriding loss without overriding batch_loss fall back to the eager tape
+    compiled_gradient = True
+
+    # execute the steps on device: noise, momentum and image live in tf.Variables and the steps between two
+    # visualizations run inside a compiled tf.while_loop (only for attacks whose gradient can be batched and that use
+    # the Nesterov momentum optimizer)
+    on_device = False
+
+    # compute the gradient only near the forgery: the pixels farther than the receptive field of the network from the
+    # target image mask get no gradient and the forward and backward passes skip the areas that can not affect the
+    # gradient of the other pixels
+    mask_restricted = False
+
+    # radius of the receptive field of the noiseprint network (17 layers of 3x3 convolutions)
+    receptive_field_radius = 17
+
+    # on images processed by tiles compute at each step the gradient of only a fraction of the tiles, sampled
+    # uniformly ("uniform") or proportionally to their last loss ("loss"), None to process all the tiles
+    tile_sampling = None
+
+    # fraction of the tiles processed at each step when tile_sampling is set
+    tile_sampling_fraction = 0.25
+
+    # momentum of the per-tile moving averages of the importance weighted gradients when tile_sampling is set
+    tile_momentum = 0.9
+
+    # dtype of the adversarial noise, of the state of the optimizer and of the work buffers of the steps (the network
+    # computes in single precision anyway), np.float64 reproduces the results of the double precision state
+    state_dtype = np.float32
+
     def __init__(self, target_image: Picture, target_image_mask: Picture, source_image: Picture,
                  source_image_mask: Picture, steps: int, alpha: float, quality_factor=None,
                  regularization_weight=0.05, plot_interval=5, debug_root: str = "./Data/Debug/", test: bool = True):
@@ -55,11 +90,24 @@ class BaseNoiseprintAttack(BaseWhiteBoxAttack, ABC):
         # load the desired model
         self._engine.load_quality(self.quality_factor)
 
+        # work buffers reused by the steps (see _get_buffer)
+        self._buffers = dict()
+
+        # one channel version of the target image, computed at the first step
+        self._target_one_channel = None
+
         # create variable to store the generated adversarial noise
-        self.noise = np.zeros((target_image.shape[0], target_image.shape[1]))
+        self.noise = np.zeros((target_image.shape[0], target_image.shape[1]), self.state_dtype)
 
         # create variable to store the momentum of the gradient
-        self.moving_avg_gradient = np.zeros((target_image.shape[0], target_image.shape[1]))
+        self.moving_avg_gradient = np.zeros((target_image.shape[0], target_image.shape[1]), self.state_dtype)
+
+        # boolean mask of the pixels that get a gradient when mask_restricted is set (computed in _on_before_attack)
+        self.active_mask = None
+
+        # per-tile momentum buffers and last losses when tile_sampling is set
+        self._tile_sampling_state = None
+        self._tile_random = np.random.RandomState(0)
 
     def _on_before_attack(self):
         """
@@ -72,6 +120,128 @@ class BaseNoiseprintAttack(BaseWhiteBoxAttack, ABC):
         self.write_to_logs(
             "Quality factor to be used: {} {}".format(self.quality_factor, "(inferred)" if self.inferred else ""))
 
+        # the images visualized at each step differ only by a few grey levels, warm start the EM of their heatmaps
+        # from the previous visualization (the first step visualization is computed from scratch)
+        self.detector.em_params = None
+        self.detector.warm_start = True
+
+        if self.mask_restricted:
+            self.active_mask = self._compute_active_mask()
+
+            if self.active_mask is None:
+                self.write_to_logs("Mask restricted gradient: the mask is empty, the whole image will be attacked")
+            else:
+                self.write_to_logs("Mask restricted gradient: {:.1%} of the pixels are active".format(
+                    np.mean(self.active_mask)))
+
+    def _target_representation_parameters(self) -> dict:
+        """
+        :return: quality factor of the model and tiling of the noiseprint engine used on large images
+        """
+        return dict(quality_factor=self.quality_factor, slide=self._engine.slide, overlap=self._engine.overlap,
+                    large_limit=self._engine.large_limit)
+
+    def _detector_version(self) -> str:
+        """
+        :return: signature of the weights of the noiseprint model of the quality factor in use
+        """
+        return files_signature(NoiseprintEngine._save_path % self.quality_factor)
+
+    def _compute_active_mask(self):
+        """
+        Compute the pixels that can change the output of the network on the forgery: the target image mask dilated by
+        the receptive field of the network
+        :return: boolean mask, None if the target image mask is empty
+        """
+        mask = np.asarray(self.target_image_mask) > 0
+        if len(mask.shape) > 2:
+            mask = mask.any(axis=2)
+
+        if not mask.any():
+            return None
+
+        size = 2 * self.receptive_field_radius + 1
+        return maxFilter(mask.astype(np.uint8), (size, size)) > 0
+
+    def _step_visualizer_settings(self) -> dict:
+        """
+        :return: attributes to set on the visualizer of the background worker, warm starting its EM as done for the
+            synchronous visualizations
+        """
+        return dict(warm_start=True)
+
+    def _get_checkpoint_state(self, attacked_image: Picture) -> dict:
+        """
+        Add the per-tile momentum buffers, the last losses of the tiles and the state of the random generator sampling
+        the tiles to the checkpoint state when tile_sampling is in use. The cores of the tiles do not overlap, hence
+        the buffers are saved as a single image
+        :param attacked_image: image produced by the current step
+        :return: dictionary of numpy arrays
+        """
+        state = super(BaseNoiseprintAttack, self)._get_checkpoint_state(attacked_image)
+
+        tile_state = self._tile_sampling_state
+        if tile_state is None:
+            return state
+
+        slide = self._engine.slide
+        velocities = np.zeros(tile_state["shape"], dtype=np.float32)
+        for (x, y), velocity in zip(tile_state["tiles"], tile_state["velocities"]):
+            velocities[x: x + slide, y: y + slide] = velocity
+
+        state["tile_sampling_shape"] = np.array(tile_state["shape"])
+        state["tile_sampling_tiles"] = np.array(tile_state["tiles"], dtype=np.int64).reshape(-1, 2)
+        state["tile_sampling_velocities"] = velocities
+        state["tile_sampling_losses"] = np.array(tile_state["losses"], dtype=np.float32)
+
+        _, keys, position, has_gauss, cached_gaussian = self._tile_random.get_state()
+        state["tile_random_keys"] = keys
+        state["tile_random_position"] = np.array(position)
+        state["tile_random_has_gauss"] = np.array(has_gauss)
+        state["tile_random_cached_gaussian"] = np.array(cached_gaussian)
+
+        return state
+
+    def _set_checkpoint_state(self, state: dict, checkpoint_folder: str):
+        """
+        Restore the state saved by _get_checkpoint_state, including the state of the tile sampling if present
+        :param state: dictionary of numpy arrays loaded from the checkpoint
+        :param checkpoint_folder: folder containing the checkpoint, used to resolve the files it references
+        :return:
+        """
+        super(BaseNoiseprintAttack, self)._set_checkpoint_state(state, checkpoint_folder)
+
+        if "tile_sampling_velocities" not in state:
+            self._tile_sampling_state = None
+            return
+
+        slide = self._engine.slide
+        tiles = [(int(x), int(y)) for x, y in state["tile_sampling_tiles"]]
+        velocities = state["tile_sampling_velocities"]
+
+        self._tile_sampling_state = dict(
+            shape=tuple(int(size) for size in state["tile_sampling_shape"]), tiles=tiles,
+            velocities=[np.array(velocities[x: x + slide, y: y + slide]) for x, y in tiles],
+            losses=state["tile_sampling_losses"].astype(np.float64))
+
+        self._tile_random.set_state(("MT19937", state["tile_random_keys"], int(state["tile_random_position"]),
+                                     int(state["tile_random_has_gauss"]),
+                                     float(state["tile_random_cached_gaussian"])))
+
+    def detector_score(self, attacked_image: Picture) -> float:
+        """
+        Score the attacked image with the F1 score of the noiseprint heatmap w.r.t. the mask of the forgery (using the
+        best threshold)
+        :param attacked_image: image to score
+        :return: F1 score
+        """
+        image = Picture(np.array(attacked_image))
+        if image.max() > 1:
+            image = image.to_float()
+
+        heatmap = self.detector._engine.detect(image.one_channel())
+        return float(search_threshold(heatmap, self.target_image_mask)['f1'])
+
     def loss(self, y_pred, y_true):
         """
         Specify a loss function to drive the image we are attacking towards the target representation
@@ -82,22 +252,299 @@ class BaseNoiseprintAttack(BaseWhiteBoxAttack, ABC):
         """
         return tf.reduce_mean(tf.square(tf.subtract(y_pred, y_true)))
 
-    def attack(self, image_to_attack: Picture, *args, **kwargs):
+    def batch_loss(self, y_pred, y_true):
         """
-        Perform step of the attack executing the following steps:
-            (1) -> prepare the image to be used by noiseprint
-            (2) -> compute the gradient
-            (3) -> normalize the gradient
-            (4) -> apply the gradient to the image with the desired strength
-            (5) -> return the image
-        :return: attacked image
+        Loss of each sample of a batch, batched version of loss
+        :param y_pred: output of the model, tensor in the shape B x H x W
+        :param y_true: target representations, tensor in the shape B x H x W
+        :return: tensor in the shape B containing the loss of each sample
+        """
+        return tf.reduce_mean(tf.square(tf.subtract(y_pred, y_true)), axis=[1, 2])
+
+    @property
+    def _batch_loss_matches_loss(self):
         """
+        Does batch_loss compute the loss of this attack? It does not if a subclass overrides loss but not batch_loss,
+        in that case only the eager gradient tape of _get_gradient_of_patch uses the right loss
+        :return: boolean
+        """
+        return type(self).loss is BaseNoiseprintAttack.loss or \
+               type(self).batch_loss is not BaseNoiseprintAttack.batch_loss
+
+    def _get_step_input(self, image_to_attack: Picture):
+        """
+        Compute the image on which the gradient of the current step has to be computed
+        :param image_to_attack: image given as input to the attack step
+        :return: one channel image shifted by the momentum of the gradient (Nesterov momentum), it is a work buffer
+            overwritten by the next step
+        """
+
+        # the attack is not additive, the input of each step is the target image: convert it to one channel once
+        if image_to_attack is self.target_image:
+            if self._target_one_channel is None:
+                self._target_one_channel = np.asarray(self.target_image.one_channel(), self.state_dtype)
+            image_one_channel = self._target_one_channel
+        else:
+            image_one_channel = image_to_attack.one_channel()
 
         # compute the attacked image using the original image and the compulative noise to reduce
         # rounding artifacts caused by translating the noise from one to 3 channels and vice versa multiple times
-        image_one_channel = Picture((image_to_attack.one_channel() - self.noise).clip(0, 255))
+        step_input = self._get_buffer("step_input", np.shape(self.noise))
+        np.subtract(image_one_channel, self.noise, out=step_input)
+        np.clip(step_input, 0, 255, out=step_input)
+
+        # apply the lookahead of the optimizer
+        step_input -= self.optimizer.lookahead()
+
+        return Picture(step_input)
+
+    def _get_buffer(self, name: str, shape: tuple) -> np.array:
+        """
+        Get a work buffer of the attack, it is allocated at its first use (or when the requested shape changes) and
+        then reused by the following steps, keeping the memory used by the steps constant
+        :param name: name of the buffer
+        :param shape: shape of the buffer
+        :return: numpy array of dtype state_dtype, its content is the one left by its previous use
+        """
+        buffer = self._buffers.get(name)
+
+        if buffer is None or buffer.shape != tuple(shape):
+            buffer = np.empty(shape, self.state_dtype)
+            self._buffers[name] = buffer
+
+        return buffer
+
+    @property
+    def supports_batching(self):
+        """
+        Can the gradient of this attack be computed in a batch together with other attacks (see
+        NoiseprintBatchAttackDriver)? This is possible if the image is processed as a single patch by the default
+        _get_gradient_of_image and batch_loss computes the loss of the attack
+        :return: boolean
+        """
+        return type(self)._get_gradient_of_image is BaseNoiseprintAttack._get_gradient_of_image and \
+               self.target_image.shape[0] * self.target_image.shape[1] < NoiseprintEngine.large_limit and \
+               not self.mask_restricted and self._batch_loss_matches_loss
+
+    @property
+    def runs_on_device(self):
+        """
+        Will the steps be executed on device? on_device has to be set and the attack has to support it: its gradient can
+        be batched, it is not additive and it uses the Nesterov momentum optimizer
+        :return: boolean
+        """
+        return self.on_device and self.supports_batching and not self.additive_attack and \
+               isinstance(self.optimizer, Momentum) and self.optimizer.nesterov
+
+    def execute(self) -> Picture:
+        """
+        Start the attack pipeline using the data passed in the initialization, executing the steps on device if
+        requested and supported
+        :return: attacked image
+        """
+        if self.runs_on_device:
+            return self._execute_on_device()
+
+        return super(BaseNoiseprintAttack, self).execute()
+
+    def _execute_on_device(self) -> Picture:
+        """
+        Execute the attack keeping its state in tf.Variables, the steps run in compiled loops that return to the host
+        only at the plot_interval boundaries and at the end, returning the loss and PSNR of each step
+        :return: attacked image
+        """
+
+        # execute pre-attack operations
+        self._on_before_attack()
+        self.loop_start_time = datetime.now()
+
+        target_image = np.array(self.target_image, dtype=np.float32)
+        target_one_channel = tf.constant(np.array(self.target_image.one_channel(), dtype=np.float32))
+        target_representation = tf.constant(np.array(self.target_representation, dtype=np.float32))
+
+        # the noise is subtracted from each channel of the attacked image
+        if len(target_image.shape) == 2:
+            target_image = target_image[:, :, np.newaxis]
+        target_image = tf.constant(target_image)
+
+        noise = tf.Variable(np.array(self.noise, dtype=np.float32))
+        if self.moving_avg_gradient is None:
+            self.moving_avg_gradient = np.zeros(np.shape(self.noise), self.state_dtype)
+        moving_avg_gradient = tf.Variable(np.array(self.moving_avg_gradient, dtype=np.float32))
+
+        # start from the step of the checkpoint if the attack has been resumed
+        step = self.step_counter
+        while step < self.steps:
+
+            # number of steps to execute before the next visualization
+            num_steps = self.steps - step
+            if self.plot_interval > 0:
+                num_steps = min(num_steps, self.plot_interval - step % self.plot_interval)
+
+            start_time = self._log_step_start_on_device(step, num_steps)
+
+            losses, psnrs = self._device_steps(noise, moving_avg_gradient, target_one_channel, target_image,
+                                               target_representation, tf.constant(step), tf.constant(num_steps))
+
+            # bring the state back to host memory
+            self.noise = noise.numpy().astype(self.state_dtype)
+            self.moving_avg_gradient = moving_avg_gradient.numpy().astype(self.state_dtype)
+
+            # the gradients never leave the device, the duration of each step is the average of the chunk
+            self._last_gradient_norm = None
+            step_time = (datetime.now() - start_time).total_seconds() / num_steps
+
+            for index, (loss, psnr) in enumerate(zip(losses.numpy(), psnrs.numpy())):
+                self.step_counter = step + index
+                self.loss_steps.append(float(loss))
 
-        return super(BaseNoiseprintAttack, self).attack(image_one_channel, args, kwargs)
+                # only the last step of the chunk can be visualized
+                attacked_image = self.attacked_image if index == num_steps - 1 else None
+                self._record_step(attacked_image, float(psnr), step_time)
+
+            self._log_step_end(start_time)
+
+            # the state is available only at the end of the chunk, the stopping criteria are checked and the
+            # checkpoints are saved only there
+            stop = self._check_stopping_criteria(self.attacked_image)
+
+            if self.checkpoint_interval > 0 and (stop or (step + num_steps) // self.checkpoint_interval >
+                                                 step // self.checkpoint_interval or step + num_steps == self.steps):
+                self.save_checkpoint(self.attacked_image)
+
+            if stop:
+                break
+
+            step += num_steps
+
+        attacked_image = self.attacked_image
+
+        # execute post-attack operations
+        self._on_after_attack(attacked_image)
+
+        return attacked_image
+
+    def _log_step_start_on_device(self, step, num_steps):
+        """
+        Write into the logs the beginning of a chunk of steps executed on device
+        :param step: first step of the chunk
+        :param num_steps: number of steps of the chunk
+        :return: starting time of the chunk
+        """
+        self.step_counter = step
+        start_time = self._log_step_start()
+        self.write_to_logs(" executing steps {}-{} on device".format(step, step + num_steps - 1), force_print=False)
+        return start_time
+
+    @tf.function
+    def _device_steps(self, noise, moving_avg_gradient, target_one_channel, target_image, target_representation,
+                      first_step, num_steps):
+        """
+        Execute num_steps attack steps on device, the same operations of attack and _on_after_attack_step
+        :param noise: tf.Variable containing the adversarial noise
+        :param moving_avg_gradient: tf.Variable containing the momentum of the gradient
+        :param target_one_channel: one channel version of the target image
+        :param target_image: target image in the shape H x W x C
+        :param target_representation: target representation of the attack
+        :param first_step: index of the first step to execute
+        :param num_steps: number of steps to execute
+        :return: loss and PSNR of each step
+        """
+        losses = tf.TensorArray(tf.float32, size=num_steps)
+        psnrs = tf.TensorArray(tf.float32, size=num_steps)
+
+        def step_body(index, losses, psnrs):
+            step = tf.cast(first_step + index, tf.float32)
+
+            # apply Nesterov momentum
+            image = tf.clip_by_value(target_one_channel - noise, 0, 255) - moving_avg_gradient
+
+            # compute the gradient
+            regularization_value = tf.norm(noise) * self.regularization_weight
+            gradients, loss, _ = self._gradient_step(image[tf.newaxis, :, :, tf.newaxis],
+                                                     target_representation[tf.newaxis],
+                                                     regularization_value[tf.newaxis])
+            gradient = gradients[0, :, :, 0]
+
+            # normalize the gradient and apply the decaying alpha
+            alpha = self.alpha / (1 + 0.05 * step)
+            gradient = tf.math.divide_no_nan(gradient, tf.reduce_max(tf.abs(gradient))) * alpha
+
+            # update the moving average and the cumulative noise
+            moving_avg_gradient.assign(moving_avg_gradient * self.optimizer.momentum +
+                                       (1 - self.optimizer.momentum) * gradient)
+            noise.assign_add(moving_avg_gradient / (1 - self.optimizer.momentum ** (1 + step)))
+
+            # compute the PSNR of the attacked image, as cv2.PSNR on the integer image
+            attacked_image = tf.floor(tf.clip_by_value(target_image - noise[:, :, tf.newaxis], 0, 255))
+            mse = tf.reduce_mean(tf.square(target_image - attacked_image))
+            psnr = 20 * tf.math.log(255 / (tf.sqrt(mse) + 2.220446049250313e-16)) / tf.math.log(10.0)
+
+            return index + 1, losses.write(index, loss[0]), psnrs.write(index, psnr)
+
+        _, losses, psnrs = tf.while_loop(lambda index, losses, psnrs: index < num_steps, step_body,
+                                         [tf.constant(0), losses, psnrs])
+
+        return losses.stack(), psnrs.stack()
+
+    def _gradient_step(self, images, targets, regularization_values):
+        """
+        Forward pass, loss and gradient of a batch of images w.r.t. their targets on the loaded noiseprint model
+        :param images: tensor in the shape B x H x W x 1
+        :param targets: tensor in the shape B x H x W
+        :param regularization_values: tensor in the shape B, values added to the loss of each image
+        :return: gradients (B x H x W x 1), losses (B), noiseprints (B x H x W)
+        """
+        with tf.GradientTape() as tape:
+            tape.watch(images)
+
+            # perform feed forward pass
+            noiseprints = tf.squeeze(self._engine.model(images), axis=3)
+
+            # compute the loss of each sample, the samples are independent hence the gradient of their sum is the
+            # gradient of each loss w.r.t. its own image
+            losses = self.batch_loss(noiseprints, targets) + regularization_values
+            loss = tf.reduce_sum(losses)
+
+        return tape.gradient(loss, images), losses, noiseprints
+
+    # compiled version of _gradient_step, traced once for any batch size and image shape. The shapes are not bucketed:
+    # padding the patches to a bucket size would change the output of the network near the padded border (the padded
+    # area is not zero after the first layers), and the relaxed signature already bounds the traces to one
+    _compiled_gradient_step = tf.function(_gradient_step, input_signature=[
+        tf.TensorSpec(shape=(None, None, None, 1), dtype=tf.float32),
+        tf.TensorSpec(shape=(None, None, None), dtype=tf.float32),
+        tf.TensorSpec(shape=(None,), dtype=tf.float32)])
+
+    def _get_gradients_of_images(self, images: list, targets: list, regularization_values: list):
+        """
+        Compute the gradients of a batch of images of the same shape w.r.t. their targets on the loaded noiseprint
+        model with a single forward and backward pass
+        :param images: list of one channel images
+        :param targets: list of target representations, one for each image
+        :param regularization_values: list of values to add to the loss of each image
+        :return: list of gradients, list of losses
+        """
+
+        # batch_loss does not compute the loss of this attack, compute the gradient of each image with the eager tape
+        if not self._batch_loss_matches_loss:
+            results = [self._get_gradient_of_patch(image, target, regularization_value)
+                       for image, target, regularization_value in zip(images, targets, regularization_values)]
+            return [gradient for gradient, _ in results], [loss for _, loss in results]
+
+        # stack the images and the targets into B x H x W x 1 and B x H x W tensors
+        tensor_batch = tf.convert_to_tensor(np.stack(images)[:, :, :, np.newaxis], dtype=tf.float32)
+        tensor_targets = tf.convert_to_tensor(np.stack(targets), dtype=tf.float32)
+        tensor_regularization = tf.convert_to_tensor(np.array(regularization_values), dtype=tf.float32)
+
+        if self.compiled_gradient:
+            gradients, losses, _ = self._compiled_gradient_step(tensor_batch, tensor_targets, tensor_regularization)
+        else:
+            gradients, losses, _ = self._gradient_step(tensor_batch, tensor_targets, tensor_regularization)
+
+        gradients = np.squeeze(gradients.numpy(), axis=3).astype(self.state_dtype, copy=False)
+
+        return list(gradients), list(losses.numpy())
 
     def _get_gradient_of_patch(self, image: Picture, target: Picture, regularization_value=0):
         """
@@ -112,6 +559,10 @@ class BaseNoiseprintAttack(BaseWhiteBoxAttack, ABC):
         # check that input image and target rerpresentation have the same shape
         assert (image.shape == target.shape)
 
+        if self.compiled_gradient and self._batch_loss_matches_loss:
+            gradients, losses = self._get_gradients_of_images([image], [target], [regularization_value])
+            return gradients[0], losses[0]
+
         # prepare the tape object to compute the gradient
         with tf.GradientTape() as tape:
             # convert the input image into a tensor
@@ -140,18 +591,63 @@ class BaseNoiseprintAttack(BaseWhiteBoxAttack, ABC):
             2) Compute the gradient of each patch with respect to the patch-tirget representation
             3) Recombine all the patch-gradients to obtain a image wide gradient
             4) Apply the image-gradient to the image
+        If mask_restricted is set only the pixels near the forgery get a gradient (see _get_gradient_of_region)
         :return: image_gradient, cumulative_loss
         """
 
         assert (len(image.shape) == 2)
 
+        return self._get_gradient_of_region(image, target, old_perturbation, self.active_mask)
+
+    def _get_gradient_of_region(self, image: Picture, target: Picture, old_perturbation: Picture = None,
+                                active_mask: np.array = None):
+        """
+        Compute the gradient of a one channel image, as a single patch if it is small enough or by tiles otherwise.
+        If an active mask is given, the forward and backward passes run only on the area from which the gradient of
+        the active pixels can be computed (a crop of the image or the tiles intersecting the active pixels) and the
+        gradient of the other pixels is 0. The loss of a crop is rescaled to the area of the image, the loss of an image
+        processed by tiles is the sum of the losses of the processed tiles only
+        :param image: one channel image
+        :param target: target representation of the image
+        :param old_perturbation: perturbation already applied to the image, used to compute the regularization
+        :param active_mask: boolean mask of the pixels whose gradient has to be computed, None for all the pixels
+        :return: image_gradient, cumulative_loss
+        """
+
         # variable to store the cumulative loss across all patches
         cumulative_loss = 0
 
-        # image wide gradient
-        image_gradient = np.zeros(image.shape)
+        if image.shape[0] * image.shape[1] < NoiseprintEngine.large_limit and active_mask is not None:
+            # image wide gradient
+            image_gradient = self._get_buffer("gradient", image.shape)
+            image_gradient.fill(0)
 
-        if image.shape[0] * image.shape[1] < NoiseprintEngine.large_limit:
+            # the gradient of an active pixel depends on the outputs within the receptive field radius from it,
+            # which in turn depend on the inputs within twice the radius: process only the crop containing them
+            rows = np.flatnonzero(active_mask.any(axis=1))
+            columns = np.flatnonzero(active_mask.any(axis=0))
+            margin = 2 * self.receptive_field_radius
+
+            x_start, x_end = max(rows[0] - margin, 0), min(rows[-1] + 1 + margin, image.shape[0])
+            y_start, y_end = max(columns[0] - margin, 0), min(columns[-1] + 1 + margin, image.shape[1])
+
+            crop_gradient, crop_loss = self._get_gradient_of_patch(image[x_start:x_end, y_start:y_end],
+                                                                   target[x_start:x_end, y_start:y_end])
+
+            # the loss of the crop is a mean over its pixels: scale it (and its gradient) by the area of the crop to
+            # get the loss of the whole image up to the constant contribution of the outputs outside the crop, so that
+            # losses and gradients are comparable with the unrestricted attack
+            scale = (x_end - x_start) * (y_end - y_start) / (image.shape[0] * image.shape[1])
+            np.multiply(crop_gradient, scale, out=image_gradient[x_start:x_end, y_start:y_end])
+
+            # the perturbation is 0 outside of the active area: its norm is the one of the whole image
+            regularization_value = 0
+            if old_perturbation is not None:
+                regularization_value = np.linalg.norm(old_perturbation) * self.regularization_weight
+
+            cumulative_loss = crop_loss * scale + regularization_value
+
+        elif image.shape[0] * image.shape[1] < NoiseprintEngine.large_limit:
             # the image can be processed as a single patch
 
             regularization_value = 0
@@ -161,69 +657,209 @@ class BaseNoiseprintAttack(BaseWhiteBoxAttack, ABC):
             image_gradient, cumulative_loss = self._get_gradient_of_patch(image, target, regularization_value)
 
         else:
-            # the image is too big, we have to divide it in patches to process separately
-            # iterate over x and y, strides = self.slide, window size = self.slide+2*self.overlap
-            for x in range(0, image.shape[0], self._engine.slide):
-                x_start = x - self._engine.overlap
-                x_end = x + self._engine.slide + self._engine.overlap
-                for y in range(0, image.shape[1], self._engine.slide):
-                    y_start = y - self._engine.overlap
-                    y_end = y + self._engine.slide + self._engine.overlap
-
-                    # get the patch we are currently working on
-                    patch = image[
-                            max(x_start, 0): min(x_end, image.shape[0]),
-                            max(y_start, 0): min(y_end, image.shape[1])
-                            ]
-
-                    # get the desired target representation for this patch
-                    target_patch = target[
-                                   max(x_start, 0): min(x_end, image.shape[0]),
-                                   max(y_start, 0): min(y_end, image.shape[1])
-                                   ]
-
-                    perturbation_patch = None
-                    regularization_value = 0
-                    if old_perturbation is not None:
-                        perturbation_patch = old_perturbation[
-                                             max(x_start, 0): min(x_end, image.shape[0]),
-                                             max(y_start, 0): min(y_end, image.shape[1])
-                                             ]
-                        regularization_value = np.linalg.norm(perturbation_patch) * self.regularization_weight
-
-                    patch_gradient, patch_loss = self._get_gradient_of_patch(patch, target_patch,
-                                                                             regularization_value)
-
-                    # discard initial overlap if not the row or first column
-                    if x > 0:
-                        patch_gradient = patch_gradient[self._engine.overlap:, :]
-                    if y > 0:
-                        patch_gradient = patch_gradient[:, self._engine.overlap:]
-
-                    # add this patch loss to the total loss
-                    cumulative_loss += patch_loss
-
-                    # add this patch's gradient to the image gradient
-                    # discard data beyond image size
-                    patch_gradient = patch_gradient[:min(self._engine.slide, patch.shape[0]),
-                                     :min(self._engine.slide, patch.shape[1])]
-
-                    # copy data to output buffer
-                    image_gradient[x: min(x + self._engine.slide, image_gradient.shape[0]),
-                    y: min(y + self._engine.slide, image_gradient.shape[1])] = patch_gradient
+            # the image is too big, we have to divide it in tiles to process separately
+            image_gradient, cumulative_loss = self._get_gradient_of_tiles(image, target, old_perturbation,
+                                                                          active_mask)
+
+        # freeze the pixels outside of the active area
+        if active_mask is not None:
+            image_gradient[~active_mask] = 0
 
         return image_gradient, cumulative_loss
 
-    @property
-    def attacked_image(self):
+    def _get_gradient_of_tiles(self, image: Picture, target: Picture, old_perturbation: Picture = None,
+                               active_mask: np.array = None):
+        """
+        Compute the gradient of an image too big to be processed as a single patch, dividing it into tiles.
+        If tile_sampling is set only a fraction of the tiles is processed (see _get_gradient_of_sampled_tiles)
+        :param image: one channel image
+        :param target: target representation of the image
+        :param old_perturbation: perturbation already applied to the image, used to compute the regularization
+        :param active_mask: boolean mask of the pixels whose gradient has to be computed, the tiles without active
+            pixels are skipped
+        :return: image_gradient, cumulative_loss
+        """
+        slide = self._engine.slide
+
+        # top left corner of the core of each tile, strides = self.slide, window size = self.slide+2*self.overlap
+        tiles = [(x, y) for x in range(0, image.shape[0], slide) for y in range(0, image.shape[1], slide)]
+
+        # skip the tiles whose gradient would be discarded
+        if active_mask is not None:
+            tiles = [(x, y) for x, y in tiles if active_mask[x: x + slide, y: y + slide].any()]
+
+        if self.tile_sampling is not None:
+            return self._get_gradient_of_sampled_tiles(image, target, old_perturbation, tiles)
+
+        # variable to store the cumulative loss across all tiles
+        cumulative_loss = 0
+
+        # image wide gradient
+        image_gradient = self._get_buffer("gradient", image.shape)
+        image_gradient.fill(0)
+
+        for x, y in tiles:
+            tile_gradient, tile_loss = self._get_gradient_of_tile(image, target, old_perturbation, x, y)
+
+            # add this tile loss to the total loss
+            cumulative_loss += tile_loss
+
+            # copy data to output buffer
+            image_gradient[x: x + slide, y: y + slide] = tile_gradient
+
+        return image_gradient, cumulative_loss
+
+    def _get_gradient_of_sampled_tiles(self, image: Picture, target: Picture, old_perturbation: Picture,
+                                       tiles: list):
+        """
+        Compute the gradient of a fraction of the tiles (tile_sampling_fraction) sampled uniformly (tile_sampling =
+        "uniform") or with probability proportional to their last loss (tile_sampling = "loss"). Each tile keeps a
+        momentum buffer, the moving average (tile_momentum) of its gradient divided by the probability of sampling it
+        and 0 when it is not sampled: its expected update is the gradient of the tile, hence the buffers are unbiased
+        estimates of the moving average of the full gradient. The "loss" sampling draws the tiles with replacement from
+        a mixture of the loss proportional and the uniform distributions, so that the weights of the tiles with a
+        small loss stay bounded. All the tiles are processed at the first step
+        :param image: one channel image
+        :param target: target representation of the image
+        :param old_perturbation: perturbation already applied to the image, used to compute the regularization
+        :param tiles: list of the top left corners of the tile cores
+        :return: image_gradient, cumulative_loss (sum of the last loss of each tile)
+        """
+        assert (self.tile_sampling in ["uniform", "loss"])
+
+        slide = self._engine.slide
+        state = self._tile_sampling_state
+
+        if state is None or state["shape"] != image.shape or state["tiles"] != tiles:
+            # the buffers are empty, process all the tiles
+            state = dict(shape=image.shape, tiles=tiles, velocities=[None] * len(tiles), losses=np.zeros(len(tiles)))
+            self._tile_sampling_state = state
+            sampled = np.arange(len(tiles))
+            weights = np.ones(len(tiles))
+        else:
+            num_samples = min(len(tiles), max(1, int(round(self.tile_sampling_fraction * len(tiles)))))
+
+            if self.tile_sampling == "uniform":
+                sampled = self._tile_random.choice(len(tiles), num_samples, replace=False)
+                weights = np.full(num_samples, len(tiles) / num_samples)
+            else:
+                probabilities = state["losses"] + np.finfo(float).eps
+                probabilities = 0.5 * probabilities / np.sum(probabilities) + 0.5 / len(tiles)
+
+                # Hansen-Hurwitz estimator: a tile drawn c times out of n is weighted c / (n * p)
+                counts = np.bincount(self._tile_random.choice(len(tiles), num_samples, p=probabilities),
+                                     minlength=len(tiles))
+                sampled = np.flatnonzero(counts)
+                weights = counts[sampled] / (num_samples * probabilities[sampled])
+
+        self.write_to_logs(" computing the gradient of {} of {} tiles".format(len(sampled), len(tiles)),
+                           force_print=False)
+
+        # the tiles not sampled at this step contribute a 0 gradient to their moving average
+        first_step = state["velocities"][0] is None
+        if not first_step:
+            for velocity in state["velocities"]:
+                velocity *= self.tile_momentum
+
+        for index, weight in zip(sampled, weights):
+            x, y = tiles[index]
+            tile_gradient, tile_loss = self._get_gradient_of_tile(image, target, old_perturbation, x, y)
+
+            if first_step:
+                state["velocities"][index] = np.array(tile_gradient)
+            else:
+                state["velocities"][index] += (1 - self.tile_momentum) * weight * tile_gradient
+            state["losses"][index] = float(tile_loss)
+
+        # image wide gradient
+        image_gradient = self._get_buffer("gradient", image.shape)
+        image_gradient.fill(0)
+
+        for (x, y), velocity in zip(tiles, state["velocities"]):
+            image_gradient[x: x + slide, y: y + slide] = velocity
+
+        return image_gradient, float(np.sum(state["losses"]))
+
+    def _get_gradient_of_tile(self, image: Picture, target: Picture, old_perturbation: Picture, x: int, y: int):
+        """
+        Compute the gradient of a tile of the image, the tile is processed with an overlap on each side to compute
+        the gradient of its core
+        :param image: one channel image
+        :param target: target representation of the image
+        :param old_perturbation: perturbation already applied to the image, used to compute the regularization
+        :param x: first row of the core of the tile
+        :param y: first column of the core of the tile
+        :return: gradient of the core of the tile, loss of the tile
+        """
+        x_start = x - self._engine.overlap
+        x_end = x + self._engine.slide + self._engine.overlap
+        y_start = y - self._engine.overlap
+        y_end = y + self._engine.slide + self._engine.overlap
+
+        # get the patch we are currently working on
+        patch = image[
+                max(x_start, 0): min(x_end, image.shape[0]),
+                max(y_start, 0): min(y_end, image.shape[1])
+                ]
+
+        # get the desired target representation for this patch
+        target_patch = target[
+                       max(x_start, 0): min(x_end, image.shape[0]),
+                       max(y_start, 0): min(y_end, image.shape[1])
+                       ]
+
+        perturbation_patch = None
+        regularization_value = 0
+        if old_perturbation is not None:
+            perturbation_patch = old_perturbation[
+                                 max(x_start, 0): min(x_end, image.shape[0]),
+                                 max(y_start, 0): min(y_end, image.shape[1])
+                                 ]
+            regularization_value = np.linalg.norm(perturbation_patch) * self.regularization_weight
+
+        patch_gradient, patch_loss = self._get_gradient_of_patch(patch, target_patch, regularization_value)
+
+        return self._get_tile_core(patch_gradient, x, y), patch_loss
+
+    def _get_tile_core(self, patch_values: np.array, x: int, y: int):
+        """
+        Cut the core of a tile out of the values computed on the tile with its overlap
+        :param patch_values: values computed on the tile including its overlap (e.g. gradient or noiseprint)
+        :param x: first row of the core of the tile
+        :param y: first column of the core of the tile
+        :return: values of the core of the tile
+        """
+        shape = patch_values.shape
+
+        # discard initial overlap if not the row or first column
+        if x > 0:
+            patch_values = patch_values[self._engine.overlap:, :]
+        if y > 0:
+            patch_values = patch_values[:, self._engine.overlap:]
+
+        # discard data beyond image size
+        return patch_values[:min(self._engine.slide, shape[0]), :min(self._engine.slide, shape[1])]
+
+    def _compute_attacked_image(self):
         """
         Compute the attacked image using the original image and the cumulative noise to reduce
         rounding artifacts caused by translating the noise from one to 3 channels and vie versa multiple times,
         still this operation here is done once so some rounding error is still present.
+        The noise is subtracted from each channel, the image is computed into a work buffer of the attack.
         Use attacked_image_monochannel to get the one channel version of the image withoud rounding errors
         :return:
         """
-        return Picture((self.target_image - Picture(self.noise).three_channels(1 / 3, 1 / 3, 1 / 3)).clip(0, 255))
+        target_image = np.asarray(self.target_image)
+
+        noise = self.noise
+        if len(target_image.shape) == 3:
+            noise = noise[:, :, np.newaxis]
+
+        attacked_image = self._get_buffer("attacked_image", target_image.shape)
+        np.subtract(target_image, noise, out=attacked_image)
+        np.clip(attacked_image, 0, 255, out=attacked_image)
+
+        return Picture(attacked_image)
 
     @property
     def attacked_image_monochannel(self):
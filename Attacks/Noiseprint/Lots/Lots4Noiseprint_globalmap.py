@@ -5,7 +5,7 @@ import numpy as np
 from tqdm import tqdm
 
 from Attacks.Noiseprint.BaseNoiseprintAttack import BaseNoiseprintAttack
-from Detectors.Noiseprint.noiseprintEngine import normalize_noiseprint, NoiseprintEngine
+from Detectors.Noiseprint.noiseprintEngine import normalize_noiseprint
 from Detectors.Noiseprint.utility.utility import prepare_image_noiseprint
 from Ulitities.Image.Picture import Picture
 from Ulitities.Image.functions import visuallize_matrix_values
@@ -49,6 +49,15 @@ class Lots4NoiseprintAttackGlobalMap(BaseNoiseprintAttack):
         self.write_to_logs("Analyzing the image by patches of size:{}".format(self.patch_size))
         self.write_to_logs("Padding patches on each dimension by:{}".format(self.padding_size))
 
+    def _target_representation_parameters(self) -> dict:
+        """
+        :return: parameters of the noiseprint model and size and padding of the patches averaged into the target
+            representation
+        """
+        parameters = super(Lots4NoiseprintAttackGlobalMap, self)._target_representation_parameters()
+        parameters.update(patch_size=tuple(self.patch_size), padding_size=tuple(self.padding_size))
+        return parameters
+
     def _compute_target_representation(self, target_representation_source_image: Picture,
                                        target_representation_source_image_mask: Picture):
         """
@@ -116,6 +125,7 @@ class Lots4NoiseprintAttackGlobalMap(BaseNoiseprintAttack):
             2) Compute the gradient of each patch with respect to the patch-tirget representation
             3) Recombine all the patch-gradients to obtain a image wide gradient
             4) Apply the image-gradient to the image
+        The image is padded by padding_size before computing the gradient (see _get_gradient_of_region)
         :return: image_gradient, cumulative_loss
         """
 
@@ -126,67 +136,13 @@ class Lots4NoiseprintAttackGlobalMap(BaseNoiseprintAttack):
         image = image.pad(pad_size, mode="reflect")
         target = target.pad(pad_size, mode="reflect")
 
-        if old_perturbation is not None:
-            old_perturbation = old_perturbation.pad(pad_size, "reflect")
-
-        # variable to store the cumulative loss across all patches
-        cumulative_loss = 0
-
-        # image wide gradient
-        image_gradient = np.zeros(image.shape)
-
-        if image.shape[0] * image.shape[1] < NoiseprintEngine.large_limit:
-            # the image can be processed as a single patch
-            image_gradient, cumulative_loss = self._get_gradient_of_patch(image, target)
-
-        else:
-            # the image is too big, we have to divide it in patches to process separately
-            # iterate over x and y, strides = self.slide, window size = self.slide+2*self.overlap
-            for x in range(0, image.shape[0], self._engine.slide):
-                x_start = x - self._engine.overlap
-                x_end = x + self._engine.slide + self._engine.overlap
-                for y in range(0, image.shape[1], self._engine.slide):
-                    y_start = y - self._engine.overlap
-                    y_end = y + self._engine.slide + self._engine.overlap
-
-                    # get the patch we are currently working on
-                    patch = image[
-                            max(x_start, 0): min(x_end, image.shape[0]),
-                            max(y_start, 0): min(y_end, image.shape[1])
-                            ]
-
-                    # get the desired target representation for this patch
-                    target_patch = target[
-                                   max(x_start, 0): min(x_end, image.shape[0]),
-                                   max(y_start, 0): min(y_end, image.shape[1])
-                                   ]
-
-                    perturbation_patch = None
-                    if old_perturbation is not None:
-                        perturbation_patch = old_perturbation[
-                                             max(x_start, 0): min(x_end, image.shape[0]),
-                                             max(y_start, 0): min(y_end, image.shape[1])
-                                             ]
-
-                    patch_gradient, patch_loss = self._get_gradient_of_patch(patch, target_patch)
-
-                    # discard initial overlap if not the row or first column
-                    if x > 0:
-                        patch_gradient = patch_gradient[self._engine.overlap:, :]
-                    if y > 0:
-                        patch_gradient = patch_gradient[:, self._engine.overlap:]
-
-                    # add this patch loss to the total loss
-                    cumulative_loss += patch_loss
-
-                    # add this patch's gradient to the image gradient
-                    # discard data beyond image size
-                    patch_gradient = patch_gradient[:min(self._engine.slide, patch.shape[0]),
-                                     :min(self._engine.slide, patch.shape[1])]
-
-                    # copy data to output buffer
-                    image_gradient[x: min(x + self._engine.slide, image_gradient.shape[0]),
-                    y: min(y + self._engine.slide, image_gradient.shape[1])] = patch_gradient
+        # the active pixels are the ones of the image, not the ones of the padding
+        active_mask = None
+        if self.active_mask is not None:
+            active_mask = np.pad(self.active_mask, pad_size)
+
+        # the regularization is not used by this attack
+        image_gradient, cumulative_loss = self._get_gradient_of_region(image, target, None, active_mask)
 
         if self.padding_size[0] > 0:
             image_gradient = image_gradient[self.padding_size[0]:, :]
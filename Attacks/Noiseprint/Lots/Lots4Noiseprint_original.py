@@ -38,6 +38,9 @@ class Lots4NoiseprintAttackOriginal(BaseNoiseprintAttack):
         self.patch_size = patch_size
         self.padding_size = padding_size
 
+        # number of patches processed by each forward and backward pass
+        self.patch_batch_size = 256
+
     def _on_before_attack(self):
         """
         Save parameters into the logs
@@ -48,6 +51,15 @@ class Lots4NoiseprintAttackOriginal(BaseNoiseprintAttack):
         self.write_to_logs("Analyzing the image by patches of size:{}".format(self.patch_size))
         self.write_to_logs("Padding patches on each dimension by:{}".format(self.padding_size))
 
+    def _target_representation_parameters(self) -> dict:
+        """
+        :return: parameters of the noiseprint model and size and padding of the patches averaged into the target
+            representation
+        """
+        parameters = super(Lots4NoiseprintAttackOriginal, self)._target_representation_parameters()
+        parameters.update(patch_size=tuple(self.patch_size), padding_size=tuple(self.padding_size))
+        return parameters
+
     def _compute_target_representation(self, target_representation_source_image: Picture,
                                        target_representation_source_image_mask: Picture):
         """
@@ -132,42 +144,96 @@ class Lots4NoiseprintAttackOriginal(BaseNoiseprintAttack):
             4) Apply the image-gradient to the image
             5) Convert then the image to the range of values of integers [0,255] and convert it back to the range
                [0,1]
+        The patches are gathered from a zero-padded copy of the image through a strided view and their gradients are
+        computed in batches of patch_batch_size patches
         :return: gradient, loss
         """
 
+        patches = self._get_patches_view(image)
+        n_x, n_y = patches.shape[0:2]
+        patches = patches.reshape((n_x * n_y,) + patches.shape[2:])
+
+        # indices of the patches to process, if the gradient is restricted to the forgery only the patches whose
+        # core contains active pixels are processed (each patch is processed on its own)
+        indices = np.arange(len(patches))
+        if self.active_mask is not None:
+            indices = np.flatnonzero(self._get_active_patches(image.shape[0:2]))
+
         # variable to store the cumulative loss across all patches
         cumulative_loss = 0
 
-        # image wide gradient
-        image_gradient = np.zeros((image.shape[0:2]))
+        # gradient of each patch
+        patches_gradient = np.zeros(patches.shape)
 
-        # divide the image into patches
-        img_patches = image.divide_in_patches(self.patch_size, self.padding_size, zero_padding=True)
+        for start in tqdm(range(0, len(indices), self.patch_batch_size)):
+            batch_indices = indices[start:start + self.patch_batch_size]
+            batch = patches[batch_indices]
 
-        # analyze the image patch by patch
-        for patch in tqdm(img_patches):
+            # compute the gradient of each patch w.r.t. the target representation
+            gradients, losses = self._get_gradients_of_images(batch, [np.asarray(target)] * len(batch),
+                                                              [0] * len(batch))
 
-            # check if we are on a border and therefore we have to "cut"tareget representation
-            target_patch_representation = target
+            patches_gradient[batch_indices] = np.stack(gradients)
 
-            # if we are on a border, cut away the "overflowing target representation"
-            if target_patch_representation.shape != patch.shape:
-                target_patch_representation = target_patch_representation[:patch.shape[0],
-                                              :patch.shape[1]]
+            # add these patches loss contribution
+            cumulative_loss += np.sum(losses)
 
-            # compute the gradient of the input w.r.t. the target representation
-            patch_gradient, patch_loss = self._get_gradient_of_patch(patch, target_patch_representation)
+        # remove the padding from the gradients and recombine them into the image wide gradient
+        image_gradient = self._merge_patches(patches_gradient.reshape((n_x, n_y) + patches.shape[1:]), image.shape[0:2])
 
-            # check that the retrieved gradient has the correct shape
-            assert (patch_gradient.shape == patch.shape)
+        # freeze the pixels outside of the active area
+        if self.active_mask is not None:
+            image_gradient[~self.active_mask] = 0
 
-            # add this patch's loss contribution
-            cumulative_loss += patch_loss
+        return image_gradient, cumulative_loss
 
-            # remove padding from the gradient
-            patch_gradient = patch.no_paddings(patch_gradient)
+    def _get_active_patches(self, shape: tuple):
+        """
+        Find the patches (as returned by _get_patches_view) whose core contains active pixels
+        :param shape: shape of the image
+        :return: boolean array with one element for each patch
+        """
+        n_x = -(-shape[0] // self.patch_size[0])
+        n_y = -(-shape[1] // self.patch_size[1])
 
-            # Add the contribution of this patch to the image wide gradient removing the padding
-            image_gradient = patch.add_to_image(image_gradient, patch_gradient)
+        active_mask = np.zeros((n_x * self.patch_size[0], n_y * self.patch_size[1]), dtype=bool)
+        active_mask[:shape[0], :shape[1]] = self.active_mask
 
-        return image_gradient, cumulative_loss
+        active_mask = active_mask.reshape((n_x, self.patch_size[0], n_y, self.patch_size[1]))
+        return active_mask.any(axis=(1, 3)).reshape(n_x * n_y)
+
+    def _get_patches_view(self, image: np.array):
+        """
+        Divide the image into padded patches as divide_in_patches does with zero_padding=True. The patch cores tile
+        the image, the rows of each patch are padded by padding_size[3] (before) and padding_size[1] (after),
+        the columns by padding_size[0] (before) and padding_size[2] (after)
+        :param image: one channel image
+        :return: read only view of the patches in the shape n_x x n_y x patch_rows x patch_columns
+        """
+        top, right, bottom, left = self.padding_size
+        n_x = -(-image.shape[0] // self.patch_size[0])
+        n_y = -(-image.shape[1] // self.patch_size[1])
+
+        # zero-pad the image so that every patch is complete
+        padded = np.zeros((n_x * self.patch_size[0] + left + right, n_y * self.patch_size[1] + top + bottom),
+                          dtype=np.float32)
+        padded[left:left + image.shape[0], top:top + image.shape[1]] = image
+
+        shape = (n_x, n_y, self.patch_size[0] + left + right, self.patch_size[1] + top + bottom)
+        strides = (padded.strides[0] * self.patch_size[0], padded.strides[1] * self.patch_size[1]) + padded.strides
+        return np.lib.stride_tricks.as_strided(padded, shape, strides, writeable=False)
+
+    def _merge_patches(self, patches: np.array, shape: tuple):
+        """
+        Recombine the cores (no paddings) of the patches into an image wide array
+        :param patches: array in the shape n_x x n_y x patch_rows x patch_columns
+        :param shape: shape of the image
+        :return: image wide array
+        """
+        top, right, bottom, left = self.padding_size
+        n_x, n_y = patches.shape[0:2]
+
+        cores = patches[:, :, left:left + self.patch_size[0], top:top + self.patch_size[1]]
+        cores = cores.transpose((0, 2, 1, 3)).reshape((n_x * self.patch_size[0], n_y * self.patch_size[1]))
+
+        return np.ascontiguousarray(cores[:shape[0], :shape[1]])
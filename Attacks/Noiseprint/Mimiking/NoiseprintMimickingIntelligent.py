@@ -43,6 +43,16 @@ class NoiseprintIntelligentMimickingAttack(BaseNoiseprintAttack):
         # for this technique no padding is needed
         self.padding_size = (0, 0, 0, 0)
 
+    def _target_representation_parameters(self) -> dict:
+        """
+        :return: parameters of the noiseprint model, size and padding of the averaged patches and the mask of the
+            forgery the target representation reproduces
+        """
+        parameters = super(NoiseprintIntelligentMimickingAttack, self)._target_representation_parameters()
+        parameters.update(patch_size=tuple(self.patch_size), padding_size=tuple(self.padding_size),
+                          target_forgery_mask=np.asarray(self.target_forgery_mask))
+        return parameters
+
     def _compute_target_representation(self, target_representation_source_image: Picture,
                                        target_representation_source_image_mask: Picture,
                                        target_forgery_mask: Picture = None):
@@ -0,0 +1,163 @@
+import logging
+import os
+from collections import OrderedDict
+from datetime import datetime
+
+import numpy as np
+
+from Attacks.Noiseprint.BaseNoiseprintAttack import BaseNoiseprintAttack
+from Ulitities.Image.Picture import Picture
+
+
+class NoiseprintBatchAttackDriver:
+    """
+    Execute many noiseprint attacks in lockstep. At each step the attacks sharing the same quality factor and image
+    shape are advanced together with a single batched forward and backward pass, while the noise, momentum, loss and
+    PSNR of each attack are still tracked separately. Attacks whose gradient can not be batched (large images or custom
+    _get_gradient_of_image implementations) are advanced one by one in the same loop. Attacks executing their steps on
+    device (see BaseNoiseprintAttack.on_device) run their own compiled loop instead, one after the other.
+    """
+
+    def __init__(self, attacks: list, max_batch_size: int = 4):
+        """
+        :param attacks: list of BaseNoiseprintAttack instances to execute
+        :param max_batch_size: maximum number of images processed by a single forward and backward pass
+        """
+        assert (len(attacks) > 0 and max_batch_size > 0)
+        assert (all(isinstance(attack, BaseNoiseprintAttack) for attack in attacks))
+
+        self.attacks = attacks
+        self.max_batch_size = max_batch_size
+
+        # log file handler of each attack, every attack logs into its own debug folder
+        self._log_handlers = [logging.FileHandler(os.path.join(attack.debug_folder, "logs.txt")) for attack in attacks]
+        for handler in self._log_handlers:
+            handler.setFormatter(logging.Formatter('%(message)s'))
+
+    def _activate(self, index):
+        """
+        Redirect the logs to the log file of the given attack
+        :param index: index of the attack
+        :return: the attack
+        """
+        for handler in logging.root.handlers[:]:
+            logging.root.removeHandler(handler)
+        logging.root.addHandler(self._log_handlers[index])
+        return self.attacks[index]
+
+    def _buckets(self, indices):
+        """
+        Group the attacks whose gradient can be computed in the same batch (same model, image shape and batch_loss)
+        :param indices: indices of the attacks to group
+        :return: list of lists of indices (batches of at most max_batch_size attacks), list of the indices of the
+            attacks that have to be executed alone
+        """
+        buckets = OrderedDict()
+        alone = []
+
+        for index in indices:
+            attack = self.attacks[index]
+            if attack.supports_batching:
+                key = (attack.quality_factor, attack.target_image.shape[:2], type(attack).batch_loss)
+                buckets.setdefault(key, []).append(index)
+            else:
+                alone.append(index)
+
+        batches = []
+        for bucket in buckets.values():
+            for start in range(0, len(bucket), self.max_batch_size):
+                batches.append(bucket[start:start + self.max_batch_size])
+
+        return batches, alone
+
+    def execute(self) -> list:
+        """
+        Execute all the attacks
+        :return: list of attacked images, one for each attack
+        """
+
+        # input of the first step of each attack, additive attacks resumed from a checkpoint continue from its image
+        attacked_images = [attack.target_image if attack._resumed_image is None else attack._resumed_image
+                           for attack in self.attacks]
+
+        # attacks executing their steps on device keep their whole state on device, they can not join the loop
+        lockstep = []
+        for index, attack in enumerate(self.attacks):
+            if attack.runs_on_device:
+                attacked_images[index] = self._activate(index).execute()
+            else:
+                lockstep.append(index)
+
+        if len(lockstep) == 0:
+            return attacked_images
+
+        # execute pre-attack operations
+        for index in lockstep:
+            self._activate(index)._on_before_attack()
+
+        # the loop starts once all the attacks are ready, the pre-attack operations of the others are not counted
+        loop_start_time = datetime.now()
+        for index in lockstep:
+            self.attacks[index].loop_start_time = loop_start_time
+
+        # first step of each attack, attacks resumed from a checkpoint join the loop at the step of their checkpoint
+        first_steps = {index: self.attacks[index].step_counter for index in lockstep}
+
+        # attacks stopped early by their stopping criteria
+        stopped = set()
+
+        for step in range(min(first_steps.values()), max(self.attacks[index].steps for index in lockstep)):
+
+            active = [index for index in lockstep
+                      if first_steps[index] <= step < self.attacks[index].steps and index not in stopped]
+
+            # print logs and execute pre-step operations
+            step_start_times = dict()
+            for index in active:
+                attack = self._activate(index)
+                attack.step_counter = step
+                step_start_times[index] = attack._log_step_start()
+
+                # if the attack is not additive, remove the effect of the previous iteration
+                if not attack.additive_attack:
+                    attacked_images[index] = attack.target_image
+
+                attack._on_before_attack_step(attacked_images[index])
+
+            batches, alone = self._buckets(active)
+
+            # execute the attacks that can not be batched
+            for index in alone:
+                attacked_images[index] = self._activate(index).attack(attacked_images[index])
+
+            # execute one step of the batchable attacks, one forward and backward pass per batch
+            for batch in batches:
+                images, targets, regularization_values = [], [], []
+                for index in batch:
+                    attack = self.attacks[index]
+                    images.append(attack._get_step_input(attacked_images[index]))
+                    targets.append(np.array(attack.target_representation))
+                    regularization_values.append(np.linalg.norm(Picture(attack.noise)) * attack.regularization_weight)
+
+                gradients, losses = self.attacks[batch[0]]._get_gradients_of_images(images, targets,
+                                                                                    regularization_values)
+
+                for index, gradient, loss in zip(batch, gradients, losses):
+                    attacked_images[index] = self.attacks[index]._apply_gradient(gradient, loss)
+
+            # execute post-step operations
+            for index in active:
+                attack = self._activate(index)
+                attack._on_after_attack_step(attacked_images[index])
+                attack._log_step_end(step_start_times[index])
+
+                if attack._check_stopping_criteria(attacked_images[index]):
+                    stopped.add(index)
+
+                attack._on_checkpoint_step(attacked_images[index], force=index in stopped)
+
+        # execute post-attack operations
+        for index in lockstep:
+            self._activate(index)._on_after_attack(attacked_images[index])
+
+        return attacked_images
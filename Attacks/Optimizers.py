@@ -0,0 +1,296 @@
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+
+def normalize_gradient(gradient, margin=17):
+    """
+    Normalize the gradient cutting away the values on the borders
+    :param margin: margin to use along the bordes
+    :param gradient: gradient to normalize
+    :return: normalized gradient
+    """
+
+    # set to 0 part of the gradient too near to the border
+    if margin > 0:
+        gradient[0:margin, :] = 0
+        gradient[-margin:, :] = 0
+        gradient[:, 0:margin] = 0
+        gradient[:, -margin:] = 0
+
+    # scale the final gradient using the computed infinity norm
+    if np.max(np.abs(gradient)) > 0:
+        gradient = gradient / np.max(np.abs(gradient))
+
+    return gradient
+
+
+class Optimizer(ABC):
+    """
+    Update rule of a white box attack: given the gradient of the loss w.r.t. the attacked image it computes the update
+    to add to the adversarial noise (the noise is subtracted from the image). The state of the optimizer is allocated
+    at the first step with the shape and the dtype of the gradient, it is updated in place and can be saved into and
+    restored from a checkpoint
+    """
+
+    name = "Base optimizer"
+
+    @abstractmethod
+    def step(self, gradient: np.array, alpha: float, step: int) -> np.array:
+        """
+        Compute the update of the current step
+        :param gradient: gradient of the loss w.r.t. the attacked image
+        :param alpha: strength of the current step
+        :param step: index of the current step (starting from 0)
+        :return: update to add to the adversarial noise, it may be a work buffer of the optimizer overwritten by the
+            next step
+        """
+        raise NotImplementedError
+
+    def _buffer(self, name: str, like: np.array) -> np.array:
+        """
+        Get an array of the state of the optimizer with the dtype of the given array, allocating it (filled with zeros)
+        at the first use and converting it if it has been restored with a different dtype
+        :param name: name of the attribute storing the array
+        :param like: array whose shape and dtype the buffer must have
+        :return: numpy array
+        """
+        value = getattr(self, name, None)
+
+        if value is None:
+            value = np.zeros(like.shape, like.dtype)
+        elif value.dtype != like.dtype:
+            value = value.astype(like.dtype)
+
+        setattr(self, name, value)
+        return value
+
+    def lookahead(self):
+        """
+        :return: shift to subtract from the image before computing the gradient of the next step (Nesterov momentum),
+            0 if the optimizer does not look ahead
+        """
+        return 0
+
+    def get_state(self) -> dict:
+        """
+        :return: dictionary of numpy arrays containing the state of the optimizer
+        """
+        return dict()
+
+    def set_state(self, state: dict):
+        """
+        Restore the state returned by get_state, keeping the dtype of its arrays (the state of a checkpoint is float32)
+        :param state: dictionary of numpy arrays
+        :return:
+        """
+        pass
+
+    def __str__(self):
+        return self.name
+
+
+class Momentum(Optimizer):
+    """
+    Momentum on the L-infinity normalized gradient with bias correction, by default with the Nesterov lookahead.
+    This is the update rule the white box attacks have always used
+    """
+
+    name = "Momentum"
+
+    def __init__(self, momentum: float = 0.9, nesterov: bool = True):
+        """
+        :param momentum: [0,1] how relevant is the velocity derived from past gradients w.r.t. the current gradient?
+        :param nesterov: compute the gradient on the image shifted by the velocity?
+        """
+        assert (0 <= momentum <= 1)
+        self.momentum = momentum
+        self.nesterov = nesterov
+
+        # moving average of the normalized gradients
+        self.velocity = None
+
+        # work buffers of the step, they are not part of the state
+        self._update = None
+
+    def step(self, gradient, alpha, step):
+        velocity = self._buffer("velocity", gradient)
+        update = self._buffer("_update", gradient)
+
+        # normalize the gradient by its infinity norm and apply the strength of the step
+        np.copyto(update, gradient)
+        max_gradient = max(np.max(gradient), -np.min(gradient))
+        if max_gradient > 0:
+            update /= max_gradient
+        update *= alpha
+
+        # velocity = velocity * momentum + (1 - momentum) * gradient
+        update *= (1 - self.momentum)
+        velocity *= self.momentum
+        velocity += update
+
+        return np.divide(velocity, 1 - self.momentum ** (1 + step), out=update)
+
+    def lookahead(self):
+        if not self.nesterov or self.velocity is None:
+            return 0
+        return self.velocity
+
+    def get_state(self):
+        if self.velocity is None:
+            return dict()
+        return dict(velocity=self.velocity)
+
+    def set_state(self, state):
+        if "velocity" in state:
+            self.velocity = np.array(state["velocity"])
+
+    def __str__(self):
+        return "{} (momentum: {}, nesterov: {})".format(self.name, self.momentum, self.nesterov)
+
+
+class Adam(Optimizer):
+    """
+    Adam: step of size alpha along the ratio between the bias corrected first and second moments of the gradient
+    """
+
+    name = "Adam"
+
+    def __init__(self, beta1: float = 0.9, beta2: float = 0.999, epsilon: float = 1e-8):
+        """
+        :param beta1: decay of the first moment
+        :param beta2: decay of the second moment
+        :param epsilon: term added to the denominator for numerical stability
+        """
+        self.beta1 = beta1
+        self.beta2 = beta2
+        self.epsilon = epsilon
+
+        self.first_moment = None
+        self.second_moment = None
+
+        # work buffers of the step, they are not part of the state
+        self._update = None
+        self._denominator = None
+
+    def step(self, gradient, alpha, step):
+        first_moment = self._buffer("first_moment", gradient)
+        second_moment = self._buffer("second_moment", gradient)
+        update = self._buffer("_update", gradient)
+        denominator = self._buffer("_denominator", gradient)
+
+        # first_moment = beta1 * first_moment + (1 - beta1) * gradient
+        first_moment *= self.beta1
+        np.multiply(gradient, 1 - self.beta1, out=update)
+        first_moment += update
+
+        # second_moment = beta2 * second_moment + (1 - beta2) * gradient^2
+        second_moment *= self.beta2
+        np.square(gradient, out=update)
+        update *= (1 - self.beta2)
+        second_moment += update
+
+        # bias corrected moments
+        np.divide(second_moment, 1 - self.beta2 ** (1 + step), out=denominator)
+        np.sqrt(denominator, out=denominator)
+        denominator += self.epsilon
+
+        np.divide(first_moment, 1 - self.beta1 ** (1 + step), out=update)
+        update *= alpha
+        update /= denominator
+
+        return update
+
+    def get_state(self):
+        if self.first_moment is None:
+            return dict()
+        return dict(first_moment=self.first_moment, second_moment=self.second_moment)
+
+    def set_state(self, state):
+        if "first_moment" in state:
+            self.first_moment = np.array(state["first_moment"])
+            self.second_moment = np.array(state["second_moment"])
+
+    def __str__(self):
+        return "{} (beta1: {}, beta2: {})".format(self.name, self.beta1, self.beta2)
+
+
+class SignSGD(Optimizer):
+    """
+    Step of size alpha along the sign of the gradient (fast gradient sign method)
+    """
+
+    name = "Sign SGD"
+
+    def step(self, gradient, alpha, step):
+        update = self._buffer("_update", gradient)
+
+        np.sign(gradient, out=update)
+        update *= alpha
+
+        return update
+
+
+class RMSprop(Optimizer):
+    """
+    Gradient divided by the root of the (bias corrected) moving average of its square, the update of each pixel is
+    roughly alpha in magnitude as for the other optimizers
+    """
+
+    name = "RMSprop"
+
+    def __init__(self, decay: float = 0.9, epsilon: float = 1e-8):
+        """
+        :param decay: decay of the moving average of the squared gradient
+        :param epsilon: term added to the denominator for numerical stability
+        """
+        self.decay = decay
+        self.epsilon = epsilon
+
+        self.mean_square = None
+
+        # work buffers of the step, they are not part of the state
+        self._update = None
+        self._denominator = None
+
+    def step(self, gradient, alpha, step):
+        mean_square = self._buffer("mean_square", gradient)
+        update = self._buffer("_update", gradient)
+        denominator = self._buffer("_denominator", gradient)
+
+        # mean_square = decay * mean_square + (1 - decay) * gradient^2
+        mean_square *= self.decay
+        np.square(gradient, out=update)
+        update *= (1 - self.decay)
+        mean_square += update
+
+        # bias corrected root mean square
+        np.divide(mean_square, 1 - self.decay ** (1 + step), out=denominator)
+        np.sqrt(denominator, out=denominator)
+        denominator += self.epsilon
+
+        np.multiply(gradient, alpha, out=update)
+        update /= denominator
+
+        return update
+
+    def get_state(self):
+        if self.mean_square is None:
+            return dict()
+        return dict(mean_square=self.mean_square)
+
+    def set_state(self, state):
+        if "mean_square" in state:
+            self.mean_square = np.array(state["mean_square"])
+
+    def __str__(self):
+        return "{} (decay: {})".format(self.name, self.decay)
+
+
+# optimizers selectable by name (e.g. from the command line)
+supported_optimizers = {
+    "momentum": Momentum,
+    "adam": Adam,
+    "sign": SignSGD,
+    "rmsprop": RMSprop,
+}
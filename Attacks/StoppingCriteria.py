@@ -0,0 +1,132 @@
+from abc import ABC, abstractmethod
+from datetime import datetime
+
+import numpy as np
+
+
+class StoppingCriterion(ABC):
+    """
+    Criterion checked by an iterative attack after each step to decide if it should stop before executing all of its
+    steps
+    """
+
+    @abstractmethod
+    def should_stop(self, attack, attacked_image):
+        """
+        :param attack: the iterative attack being executed, its step_counter is the index of the step just executed
+        :param attacked_image: image produced by the last step
+        :return: a string describing the reason to stop, None to continue
+        """
+        raise NotImplementedError
+
+
+class LossPlateau(StoppingCriterion):
+    """
+    Stop when the best loss of the last window steps improves the best loss of the previous steps by less than
+    min_improvement (relative)
+    """
+
+    def __init__(self, window: int = 10, min_improvement: float = 0.01):
+        """
+        :param window: number of steps over which the improvement is measured
+        :param min_improvement: minimum relative improvement of the loss over the window
+        """
+        assert (window > 0 and min_improvement >= 0)
+        self.window = window
+        self.min_improvement = min_improvement
+
+    def should_stop(self, attack, attacked_image):
+        # the first element of loss_steps is a placeholder
+        losses = [float(loss) for loss in attack.loss_steps[1:]]
+        if len(losses) <= self.window:
+            return None
+
+        previous_best = min(losses[:-self.window])
+        current_best = min(losses[-self.window:])
+
+        improvement = (previous_best - current_best) / max(abs(previous_best), np.finfo(float).eps)
+        if improvement < self.min_improvement:
+            return "loss improved by {:.2%} in the last {} steps".format(improvement, self.window)
+
+        return None
+
+
+class PsnrFloor(StoppingCriterion):
+    """
+    Stop when the PSNR of the attacked image drops below a minimum value
+    """
+
+    def __init__(self, min_psnr: float):
+        """
+        :param min_psnr: minimum acceptable PSNR [dB]
+        """
+        self.min_psnr = min_psnr
+
+    def should_stop(self, attack, attacked_image):
+        psnr = attack.psnr_steps[-1]
+        if len(attack.psnr_steps) > 1 and psnr < self.min_psnr:
+            return "PSNR {:.2f} below {:.2f}".format(psnr, self.min_psnr)
+
+        return None
+
+
+class WallClockBudget(StoppingCriterion):
+    """
+    Stop when the loop of the steps has been running for more than a given number of seconds, the pre-attack
+    operations (e.g. the computation of the target representation) are not counted
+    """
+
+    def __init__(self, seconds: float):
+        """
+        :param seconds: time budget of the attack (measured from the loop_start_time of the attack) [s]
+        """
+        assert (seconds > 0)
+        self.seconds = seconds
+
+    def should_stop(self, attack, attacked_image):
+        elapsed = (datetime.now() - attack.loop_start_time).total_seconds()
+        if elapsed > self.seconds:
+            return "time budget of {:.0f}s exhausted ({:.0f}s)".format(self.seconds, elapsed)
+
+        return None
+
+
+class DetectorScoreReached(StoppingCriterion):
+    """
+    Stop when the score assigned by the detector to the attacked image reaches a target value. Computing the score
+    requires running the detector, hence it is checked only every interval steps
+    """
+
+    def __init__(self, target: float, interval: int = 5, score_function=None, lower_is_better: bool = True):
+        """
+        :param target: score to reach
+        :param interval: how often (# steps) should the score be computed?
+        :param score_function: function(attack, attacked_image) returning the score, by default the detector_score
+            method of the attack
+        :param lower_is_better: is the attack trying to lower the score (True) or to raise it (False)?
+        """
+        assert (interval > 0)
+        self.target = target
+        self.interval = interval
+        self.score_function = score_function
+        self.lower_is_better = lower_is_better
+
+        # last computed score
+        self.last_score = None
+
+    def should_stop(self, attack, attacked_image):
+        if (attack.step_counter + 1) % self.interval != 0:
+            return None
+
+        if self.score_function is not None:
+            self.last_score = self.score_function(attack, attacked_image)
+        else:
+            self.last_score = attack.detector_score(attacked_image)
+
+        attack.write_to_logs("Detector score: {:.4f}".format(self.last_score), force_print=False)
+
+        reached = self.last_score <= self.target if self.lower_is_better else self.last_score >= self.target
+        if reached:
+            return "detector score {:.4f} reached the target {:.4f}".format(self.last_score, self.target)
+
+        return None
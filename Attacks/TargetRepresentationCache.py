@@ -0,0 +1,95 @@
+import hashlib
+import os
+
+import numpy as np
+
+from Ulitities.io.cache import TwoTierCache, update_digest
+
+
+def files_signature(path: str) -> str:
+    """
+    Summarize the files at the given path (a file or a folder, recursively) by their names, sizes and modification
+    times, the signature changes whenever one of them is replaced (e.g. the weights of a detector)
+    :param path: path of the file or of the folder
+    :return: string, empty if the path does not exist
+    """
+    if os.path.isfile(path):
+        root, paths = os.path.dirname(path), [path]
+    else:
+        root = path
+        paths = sorted(os.path.join(folder, name) for folder, _, names in os.walk(path) for name in names)
+
+    signature = []
+    for file_path in paths:
+        stat = os.stat(file_path)
+        signature.append("{}:{}:{}".format(os.path.relpath(file_path, root), stat.st_size, int(stat.st_mtime)))
+
+    return ";".join(signature)
+
+
+class TargetRepresentationCache(TwoTierCache):
+    """
+    Cache of the target representations of the white box attacks, so that repeated and batch runs on the same source
+    image do not compute them again. Entries are numpy arrays kept in memory up to a byte budget and stored on disk
+    (with their own byte budget), least recently used ones are evicted first.
+    """
+
+    extension = ".npy"
+
+    def __init__(self, cache_dir: str = None, max_bytes: int = 256 * 2 ** 20, max_disk_bytes: int = 2 * 2 ** 30):
+        """
+        :param cache_dir: folder of the on-disk entries (created when the first entry is stored), None to keep the
+            entries only in memory
+        :param max_bytes: maximum number of bytes of the in-memory entries
+        :param max_disk_bytes: maximum number of bytes of the on-disk entries
+        """
+        super().__init__(max_bytes, cache_dir, max_disk_bytes)
+
+    @staticmethod
+    def make_key(arrays: list, **params):
+        """
+        Compute the key of a target representation
+        :param arrays: arrays from which the target representation is computed (e.g. source image and its mask)
+        :param params: parameters of the computation, numpy arrays are hashed by content, the other values by their
+            representation
+        :return: hexadecimal digest identifying the target representation
+        """
+        digest = hashlib.sha1()
+
+        for array in arrays:
+            update_digest(digest, array)
+
+        for name, value in sorted(params.items()):
+            digest.update(name.encode())
+            if isinstance(value, np.ndarray):
+                update_digest(digest, value)
+            else:
+                digest.update(repr(value).encode())
+
+        return digest.hexdigest()
+
+    def get(self, key: str):
+        """
+        Retrieve an entry of the cache
+        :param key: key of the entry (see make_key)
+        :return: copy of the stored array or None if the entry is not in the cache
+        """
+        entry = self.get_entry(key)
+        if entry is None:
+            return None
+
+        return np.copy(entry)
+
+    def put(self, key: str, value: np.array):
+        """
+        Add an entry to the cache
+        :param key: key of the entry (see make_key)
+        :param value: target representation to store, converted to a numpy array
+        """
+        self.put_entry(key, np.array(value))
+
+    def _read(self, file):
+        return np.load(file, allow_pickle=False)
+
+    def _write(self, file, entry):
+        np.save(file, entry, allow_pickle=False)
@@ -0,0 +1,60 @@
+import hashlib
+
+import numpy as np
+
+from Ulitities.io.cache import TwoTierCache, update_digest
+
+
+class HeatmapCache(TwoTierCache):
+    """
+    Cache of the results of the noiseprint post-processing (heatmap, valid mask and parameters of the EM).
+    Entries are kept in memory up to a byte budget, least recently used ones are evicted first.
+    If a folder is given, entries are also stored on disk (with their own byte budget) and
+    loaded back when they are not in memory anymore.
+    """
+
+    def __init__(self, max_bytes: int = 256 * 2 ** 20, cache_dir: str = None, max_disk_bytes: int = 2 * 2 ** 30):
+        """
+        :param max_bytes: maximum number of bytes of the in-memory entries
+        :param cache_dir: folder of the on-disk entries, None to keep the entries only in memory
+        :param max_disk_bytes: maximum number of bytes of the on-disk entries
+        """
+        super().__init__(max_bytes, cache_dir, max_disk_bytes)
+
+    @staticmethod
+    def make_key(noiseprint: np.array, image: np.array, **params):
+        """
+        Compute the key of a post-processing result
+        :param noiseprint: noiseprint from which the heatmap is computed
+        :param image: one channel image from which the noiseprint has been computed (used to discard saturated areas)
+        :param params: parameters of the post-processing
+        :return: hexadecimal digest identifying the result
+        """
+        digest = hashlib.sha1()
+        for array in [noiseprint, image]:
+            update_digest(digest, array)
+        digest.update(repr(sorted(params.items())).encode())
+        return digest.hexdigest()
+
+    def get(self, key: str):
+        """
+        Retrieve an entry of the cache
+        :param key: key of the entry (see make_key)
+        :return: tuple (heatmap, valid, other) or None if the entry is not in the cache
+        """
+        entry = self.get_entry(key)
+        if entry is None:
+            return None
+
+        heatmap, valid, other = entry
+        return np.copy(heatmap), np.copy(valid), dict(other)
+
+    def put(self, key: str, heatmap: np.array, valid: np.array, other: dict):
+        """
+        Add an entry to the cache
+        :param key: key of the entry (see make_key)
+        :param heatmap: heatmap to store
+        :param valid: valid mask of the heatmap
+        :param other: parameters of the EM used to compute the heatmap
+        """
+        self.put_entry(key, (np.copy(heatmap), np.copy(valid), dict(other)))
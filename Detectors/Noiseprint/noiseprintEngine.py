@@ -4,15 +4,15 @@ import os
 import numpy as np
 import tensorflow as tf
 from PIL import Image
-from sklearn.metrics import f1_score
 from tensorflow.python.keras.layers import Conv2D, BatchNormalization, Activation
 from tensorflow.python.keras.models import Model
 
 # Bias layer necessary because noiseprint applies bias after batch-normalization.
 from Detectors.DetectorEngine import DeterctorEngine
-from Detectors.Noiseprint.noiseprint_blind import noiseprint_blind_post, genMappFloat
+from Detectors.Noiseprint.heatmapCache import HeatmapCache
+from Detectors.Noiseprint.noiseprint_blind import noiseprint_blind_post, noiseprint_reference_post, genMappFloat
 from Detectors.Noiseprint.utility.utility import jpeg_quality_of_file
-from Detectors.Noiseprint.utility.utilityRead import jpeg_qtableinv, imread2f
+from Detectors.Noiseprint.utility.utilityRead import jpeg_qtableinv, imread2f, computeF1MCCThresholds
 from Ulitities.Image.Picture import Picture
 
 
@@ -23,16 +23,43 @@ class NoiseprintEngine(DeterctorEngine):
     overlap = 34
     setup_on_init = True
 
+    # cache of the heatmaps shared by all the engines, set to None to disable it
+    heatmap_cache = HeatmapCache()
+
     def __init__(self):
 
         super().__init__("Noiseprint Engine")
 
         self._model = _full_conv_net()
         self._loaded_quality = None
+
+        # parameters of the gaussian mixture fitted by the last call to detect
+        self.last_post_params = None
+
+        # speed/fidelity preset of the heatmap post-processing (see noiseprint_blind.postPresets)
+        # and optional time budget in seconds of its EM
+        self.post_preset = 'exact'
+        self.post_time_budget = None
+
+        # optional callback receiving the statistics of the heatmap post-processing (see noiseprint_blind_post)
+        self.post_callback = None
+
+        # reference camera model (see post_em.loadReferenceModel), if given the heatmaps are computed by scoring
+        # the image against it instead of fitting a gaussian mixture on each image
+        self.reference_model = None
+
         if self.setup_on_init:
             setup_session()
 
-    def detect(self, image: Picture):
+    def detect(self, image: Picture, init=None):
+        """
+        Compute the heatmap of the given image
+        :param image: one channel image in the range [0,1]
+        :param init: parameters of the gaussian mixture fitted on a nearly identical image (see last_post_params),
+            if given they are used to warm start the EM instead of running all the random replicates
+            and the heatmap cache is bypassed
+        :return: heatmap
+        """
 
         # check that the image has only one channel
         assert (len(image.shape) == 2 or (len(image.shape) == 3 and image.shape[2] == 1))
@@ -40,10 +67,35 @@ class NoiseprintEngine(DeterctorEngine):
         # produce the noiseprint
         noiseprint = self.predict(image)
 
+        if self.reference_model is not None:
+            mapp, valid, range0, range1, imgsize, other = noiseprint_reference_post(noiseprint, image,
+                                                                                    self.reference_model)
+            self.last_post_params = other
+            return genMappFloat(mapp, valid, range0, range1, imgsize)
+
+        # results obtained with a warm started EM depend on the initialization and those obtained within a time
+        # budget depend on the timing, hence they are not cached. The cache is also bypassed when a callback has
+        # to receive the statistics of the post-processing, since a cache hit would not run it
+        key = None
+        if self.heatmap_cache is not None and init is None and self.post_time_budget is None and \
+                self.post_callback is None:
+            key = self.heatmap_cache.make_key(noiseprint, image, preset=self.post_preset)
+            cached = self.heatmap_cache.get(key)
+            if cached is not None:
+                attacked_heatmap, _, self.last_post_params = cached
+                return attacked_heatmap
+
         # generate heatmap
-        mapp, valid, range0, range1, imgsize, other = noiseprint_blind_post(noiseprint, image)
+        mapp, valid, range0, range1, imgsize, other = noiseprint_blind_post(noiseprint, image, init,
+                                                                            preset=self.post_preset,
+                                                                            timeBudget=self.post_time_budget,
+                                                                            callback=self.post_callback)
+        self.last_post_params = other
         attacked_heatmap = genMappFloat(mapp, valid, range0, range1, imgsize)
 
+        if key is not None:
+            self.heatmap_cache.put(key, attacked_heatmap, valid, other)
+
         return attacked_heatmap
 
     def get_mask(self,image: Picture,gtmask):
@@ -222,21 +274,25 @@ def noiseprint_blind_file(filename, model_name='net'):
 def e_score(mask1:np.array,mask2:np.array):
     return np.array(np.equal(mask1,mask2)).sum()**2 / (mask1.shape[0]*mask2.shape[0])
 
-def find_best_theshold(heatmap, mask):
-    best_theshold = -1
-    best_f1 = -1
-    seen_peak = False
-    for threshold in range(50, 2000, 5):
-        pred_mask = np.array(heatmap > threshold, int)
-        score = f1_score(mask.flatten(), pred_mask.flatten())
-
-        if score > best_f1:
-            best_f1 = score
-            best_theshold = threshold
-        else:
-            break
+def search_threshold(heatmap, mask):
+    """
+    Find the threshold of the heatmap that maximizes the F1 score of the predicted mask (heatmap > threshold).
+    The heatmap is sorted once and the metrics of all the thresholds are computed through cumulative sums,
+    hence the result is the global optimum.
+    :param heatmap: heatmap to threshold
+    :param mask: ground truth mask, positive where greater than 0
+    :return: dictionary with the best threshold ('threshold'), its F1 score ('f1') and MCC ('mcc'), and the curves
+        of all the candidate thresholds ('thresholds', 'f1_curve', 'mcc_curve')
+    """
+    f1, mcc, thresholds = computeF1MCCThresholds(heatmap, mask)
+    best = int(np.argmax(f1))
+
+    return {'threshold': thresholds[best], 'f1': f1[best], 'mcc': mcc[best],
+            'thresholds': thresholds, 'f1_curve': f1, 'mcc_curve': mcc}
 
-    return best_theshold
+
+def find_best_theshold(heatmap, mask):
+    return search_threshold(heatmap, mask)['threshold']
 
 
 def noiseprint_blind(img, QF):
@@ -12,20 +12,77 @@
 @author: davide.cozzolino
 """
 
+import time
+
 import numpy as np
-from .post_em import EMgu_img, getSpamFromNoiseprint
+from .post_em import EMgu_img, getSpamFromNoiseprint, scoreReferenceModel, ksize_default, stride_default
 from .utility.utilityRead import imread2f, jpeg_qtableinv, resizeMapWithPadding
 
 
 
-def noiseprint_blind_post(res, img):
-    spam, valid, range0, range1, imgsize = getSpamFromNoiseprint(res, img)
+# speed/fidelity presets of noiseprint_blind_post:
+# stride and ksize of the SPAM features, replicates and maximum iterations of the EM,
+# maximum number of vectors used to fit the EM and parameters of the PCA
+postPresets = {
+    'preview': {'stride': 16, 'ksize': 64, 'replicates': 2, 'maxIter': 30, 'maxFitSamples': 5000,
+                'pcaParams': {'randomized': True}},
+    'standard': {'stride': 8, 'ksize': 64, 'replicates': 4, 'maxIter': 60, 'maxFitSamples': 20000,
+                 'pcaParams': {'chunkSize': 16384}},
+    'exact': {'stride': 8, 'ksize': 64, 'replicates': 10, 'maxIter': 100, 'maxFitSamples': None,
+              'pcaParams': None},
+}
+
+
+def noiseprint_blind_post(res, img, init=None, maxFitSamples=None, preset='exact', timeBudget=None, callback=None):
+    # init: "other" dictionary returned by a previous call on a nearly identical image,
+    # used to warm start the EM (see EMgu_img)
+    # maxFitSamples: maximum number of SPAM vectors used to fit the EM (None -> the one of the preset)
+    # preset: name of one of the postPresets
+    # timeBudget: if given, seconds after which the EM is stopped (see EMgu_img)
+    # callback: if given, it is called as callback(event, data) at the end of each stage, EM replicate
+    # and EM iteration (see EMgu_img) and with the statistics of the whole run ('done') before returning,
+    # the statistics of the run are also returned in other['stats']
+    if preset not in postPresets:
+        raise ValueError("Unknown preset %s, available presets: %s" % (preset, ', '.join(postPresets)))
+    params = postPresets[preset]
+    if maxFitSamples is None:
+        maxFitSamples = params['maxFitSamples']
+    deadline = None if timeBudget is None else time.time() + timeBudget
+
+    times = dict()
+    spam, valid, range0, range1, imgsize = getSpamFromNoiseprint(res, img, ksize=params['ksize'],
+                                                                 stride=params['stride'], times=times)
+    if callback is not None:
+        for name in ['weights', 'spam']:
+            callback('stage', {'name': name, 'time': times[name]})
 
     if np.sum(valid) < 50:
         # print('error too small %d' % np.sum(weights))
         return None, valid, range0, range1, imgsize, dict()
 
-    mapp, other = EMgu_img(spam, valid, extFeat=range(32), seed=0, maxIter=100, replicates=10, outliersNlogl=42)
+    mapp, other = EMgu_img(spam, valid, extFeat=range(32), seed=0, maxIter=params['maxIter'],
+                           replicates=params['replicates'], outliersNlogl=42, init=init, maxFitSamples=maxFitSamples,
+                           pcaParams=params['pcaParams'], deadline=deadline, callback=callback)
+    other['preset'] = preset
+    other['stats']['times'].update(times)
+    if callback is not None:
+        callback('done', other['stats'])
+
+    return mapp, valid, range0, range1, imgsize, other
+
+
+def noiseprint_reference_post(res, img, model):
+    # model: reference camera model fitted on authentic images (see post_em.fitReferenceModel),
+    # the image is scored with a single Mahalanobis pass, without fitting any EM
+    spam, valid, range0, range1, imgsize = getSpamFromNoiseprint(res, img, ksize=model.get('ksize', ksize_default),
+                                                                 stride=model.get('stride', stride_default))
+
+    if np.sum(valid) < 50:
+        return None, valid, range0, range1, imgsize, dict()
+
+    mapp = scoreReferenceModel(spam, model)
+    other = dict(model)
+    other['reference'] = True
 
     return mapp, valid, range0, range1, imgsize, other
 
@@ -0,0 +1,94 @@
+import numpy as np
+
+
+class PostStatsAggregator:
+    """
+    Aggregate the statistics of the noiseprint post-processing (other['stats'] returned by noiseprint_blind_post)
+    across the images of a dataset run, to tune the replicates and iterations budgets of the EM.
+    The aggregator can be passed directly as the callback of noiseprint_blind_post (or as
+    NoiseprintEngine.post_callback): the statistics of each run are collected when it ends.
+    """
+
+    def __init__(self):
+        self.runs = []
+
+    def __call__(self, event: str, data: dict):
+        """
+        Callback of noiseprint_blind_post, collects the statistics of the run sent with the 'done' event
+        :param event: name of the event
+        :param data: data of the event
+        """
+        if event == 'done':
+            self.add(data)
+
+    def add(self, stats: dict):
+        """
+        Add the statistics of a run
+        :param stats: other['stats'] returned by noiseprint_blind_post (or EMgu_img)
+        """
+        if stats:
+            self.runs.append(stats)
+
+    def add_result(self, other: dict):
+        """
+        Add the statistics contained in the other dictionary returned by noiseprint_blind_post
+        :param other: dictionary returned by noiseprint_blind_post
+        """
+        if other is not None:
+            self.add(other.get('stats'))
+
+    def summary(self):
+        """
+        Summarize the collected statistics
+        :return: dictionary with the number of runs, mean and 90th percentile of the time of each stage,
+            mean and 90th percentile of the iterations per replicate, fraction of replicates that converged
+            or hit the deadline, mean number of replicates per run and index of the replicate
+            with the best log-likelihood in each run
+        """
+        summary = {'runs': len(self.runs)}
+        if len(self.runs) == 0:
+            return summary
+
+        stages = sorted(set(name for stats in self.runs for name in stats['times']))
+        summary['times'] = dict()
+        for name in stages:
+            times = np.array([stats['times'].get(name, 0.0) for stats in self.runs])
+            summary['times'][name] = {'mean': float(np.mean(times)), 'p90': float(np.percentile(times, 90))}
+
+        replicates = [replicate for stats in self.runs for replicate in stats['replicates']]
+        if len(replicates) > 0:
+            iterations = np.array([replicate['iterations'] for replicate in replicates])
+            flags = np.array([replicate['flagExit'] for replicate in replicates])
+            summary['iterations'] = {'mean': float(np.mean(iterations)),
+                                     'p90': float(np.percentile(iterations, 90))}
+            summary['converged'] = float(np.mean(flags == 0))
+            summary['deadline_hit'] = float(np.mean(flags == 2))
+
+        summary['replicates_per_run'] = float(np.mean([len(stats['replicates']) for stats in self.runs]))
+        summary['best_replicate'] = [int(np.argmax([replicate['avrLogl'] for replicate in stats['replicates']]))
+                                     for stats in self.runs if len(stats['replicates']) > 0]
+        summary['num_valid'] = float(np.mean([stats['numValid'] for stats in self.runs]))
+        summary['num_fit_samples'] = float(np.mean([stats['numFitSamples'] for stats in self.runs]))
+
+        return summary
+
+    def print_summary(self):
+        """
+        Print a human readable summary of the collected statistics
+        """
+        summary = self.summary()
+        print("Post-processing statistics of {} runs".format(summary['runs']))
+        if summary['runs'] == 0:
+            return
+
+        for name, times in summary['times'].items():
+            print("  {:<10} mean {:8.3f}s  p90 {:8.3f}s".format(name, times['mean'], times['p90']))
+
+        if 'iterations' in summary:
+            print("  iterations per replicate: mean {:.1f}  p90 {:.1f}".format(summary['iterations']['mean'],
+                                                                             summary['iterations']['p90']))
+            print("  converged replicates: {:.1%}  deadline hit: {:.1%}".format(summary['converged'],
+                                                                                 summary['deadline_hit']))
+        print("  replicates per run: {:.1f}".format(summary['replicates_per_run']))
+        print("  best replicate histogram: {}".format(np.bincount(summary['best_replicate']).tolist()))
+        print("  valid vectors: {:.0f}  fit samples: {:.0f}".format(summary['num_valid'], summary['num_fit_samples']))
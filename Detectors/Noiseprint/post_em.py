@@ -13,12 +13,15 @@
 @author: davide.cozzolino
 """
 
+import time
+import warnings
+
 import numpy as np
 import numpy.linalg as numpyl
-import skimage.morphology as ski
-from scipy.ndimage.filters import uniform_filter, maximum_filter
+from scipy.ndimage.filters import uniform_filter
 
 from Detectors.Noiseprint.utility.gaussianMixture import gm
+from Detectors.Noiseprint.utility.morphology import binaryOpeningDisk, maxFilter
 from .feat_spam.spam_np_opt import getSpamRes
 
 paramSpam_default = {'resTranspose': False, 'uniformQuant': False, \
@@ -33,11 +36,67 @@ win_v = 5
 win_z = 35
 
 
-def faetReduce(feat_list, inds, whiteningFlag=False):
-    cov_mtx = np.cov(feat_list, rowvar=False, bias=True)
-    w, v = np.linalg.eigh(cov_mtx)
-    w = w[::-1]
-    v = v[:, ::-1]
+def streamingCov(feat_list, chunkSize=16384):
+    # covariance of the rows of feat_list accumulated chunk by chunk with float32 products,
+    # the features are shifted by the mean of the first chunk to limit the cancellation errors
+    [N, dim] = feat_list.shape
+    shift = np.mean(feat_list[:chunkSize], axis=0, dtype=np.float64).astype(np.float32)
+    acc_sum = np.zeros(dim, dtype=np.float64)
+    acc_prod = np.zeros((dim, dim), dtype=np.float64)
+    for index in range(0, N, chunkSize):
+        chunk = np.subtract(feat_list[index:(index + chunkSize)], shift, dtype=np.float32)
+        acc_sum += np.sum(chunk, axis=0, dtype=np.float64)
+        acc_prod += np.matmul(chunk.transpose(), chunk)
+    acc_sum = acc_sum / N
+    return acc_prod / N - np.outer(acc_sum, acc_sum)
+
+
+def randomizedEigh(cov_mtx, numComp, oversampling=20, powerIter=4, seed=0):
+    # top numComp eigenvalues (decreasing order) and eigenvectors of a symmetric positive semi-definite
+    # matrix, computed by randomized subspace iteration
+    dim = cov_mtx.shape[0]
+    numProj = min(numComp + oversampling, dim)
+    Q = np.random.RandomState(seed).standard_normal((dim, numProj))
+    Q, _ = np.linalg.qr(np.matmul(cov_mtx, Q))
+    for index in range(powerIter):
+        Q, _ = np.linalg.qr(np.matmul(cov_mtx, Q))
+    w, v = np.linalg.eigh(np.matmul(np.matmul(Q.transpose(), cov_mtx), Q))
+    w = w[::-1][:numComp]
+    v = np.matmul(Q, v[:, ::-1][:, :numComp])
+    return w, v
+
+
+def faetReduce(feat_list, inds, whiteningFlag=False, chunkSize=None, randomized=False, checkTol=None):
+    # chunkSize: if given the covariance is accumulated in float32 chunks of chunkSize features
+    # randomized: compute only the needed top components with a randomized eigensolver,
+    #             in this case w contains only the top max(inds)+1 eigenvalues
+    # checkTol: accuracy guard of the randomized eigensolver, the result is compared against the exact
+    #           decomposition and it is discarded if eigenvalues or subspace differ more than checkTol,
+    #           after this fallback w contains all the eigenvalues (one for each feature) as without randomized
+    if (chunkSize is None) and (not randomized):
+        cov_mtx = np.cov(feat_list, rowvar=False, bias=True)
+    else:
+        cov_mtx = streamingCov(feat_list, chunkSize if chunkSize is not None else 16384)
+
+    if randomized:
+        numComp = max(inds) + 1
+        w, v = randomizedEigh(cov_mtx, numComp)
+        if checkTol is not None:
+            w_exact, v_exact = np.linalg.eigh(cov_mtx)
+            w_exact = w_exact[::-1]
+            v_exact = v_exact[:, ::-1]
+            err_eig = np.max(np.abs(w - w_exact[:numComp])) / w_exact[0]
+            err_sub = 1.0 - np.min(np.linalg.svd(np.matmul(v_exact[:, inds].transpose(), v[:, inds]),
+                                                 compute_uv=False))
+            if (err_eig > checkTol) or (err_sub > checkTol):
+                warnings.warn('randomized PCA not accurate (eigenvalues error %g, subspace error %g), '
+                              'using the exact decomposition' % (err_eig, err_sub))
+                w, v = w_exact, v_exact
+    else:
+        w, v = np.linalg.eigh(cov_mtx)
+        w = w[::-1]
+        v = v[:, ::-1]
+
     v = v[:, inds]
     if whiteningFlag:
         v = v / np.sqrt(w[inds])
@@ -45,20 +104,23 @@ def faetReduce(feat_list, inds, whiteningFlag=False):
 
 
 def getWeights(img, res):
+    # float32 box filters, uint8 bitmaps and separable running max/min filters
+    # (same mask of skimage binary_opening with a disk and scipy maximum_filter)
+    res = np.asarray(res, dtype=np.float32)
     res_m = uniform_filter(res, (win_v, win_v))
     res_v = uniform_filter(np.square(res), (win_v, win_v)) - np.square(res_m)
-    mm = res_v < 0.005
-    mm[:1, :] = True;
-    mm[-1:, :] = True;
-    mm[:, :1] = True;
-    mm[:, -1:] = True;
+    mm = (res_v < 0.005).astype(np.uint8)
+    mm[:1, :] = 1;
+    mm[-1:, :] = 1;
+    mm[:, :1] = 1;
+    mm[:, -1:] = 1;
 
     th_White = 253.0 / 256;
     rd_White = 3
-    sat_mask = ski.binary_opening(img > th_White, ski.disk(rd_White))
-    mm = np.logical_or(mm, sat_mask)
-    mm = maximum_filter(mm, (win_z, win_z))
-    weights = np.logical_not(mm)
+    sat_mask = binaryOpeningDisk((img > th_White).astype(np.uint8), rd_White)
+    mm = np.maximum(mm, sat_mask, out=mm)
+    mm = maxFilter(mm, (win_z, win_z))
+    weights = (mm == 0)
     return weights
 
 
@@ -71,8 +133,10 @@ def getCoocValues(res, img_gray, n_clusters=4, random_state=0):
     return values
 
 
-def getSpamFromNoiseprint(res, img_gray, ksize=ksize_default, stride=stride_default, values=None):
+def getSpamFromNoiseprint(res, img_gray, ksize=ksize_default, stride=stride_default, values=None, times=None):
+    # times: if given, dictionary in which the wall times of the 'weights' and 'spam' stages are stored
     imgsize = img_gray.shape
+    startTime = time.time()
 
     paramSpam = dict(paramSpam_default)
     paramSpam['strides'] = (stride, stride)
@@ -80,6 +144,7 @@ def getSpamFromNoiseprint(res, img_gray, ksize=ksize_default, stride=stride_defa
         paramSpam['values'] = values
 
     weights = getWeights(img_gray, res)
+    weightsTime = time.time()
     spam, weights, range0, range1 = getSpamRes(res, paramSpam, ksize, weights=weights, paddingModality=0)
     valid = (weights >= satutationProb)
 
@@ -89,6 +154,10 @@ def getSpamFromNoiseprint(res, img_gray, ksize=ksize_default, stride=stride_defa
     range0 = range0[2:-2]
     range1 = range1[2:-2]
 
+    if times is not None:
+        times['weights'] = weightsTime - startTime
+        times['spam'] = time.time() - weightsTime
+
     return spam, valid, range0, range1, imgsize
 
 
@@ -121,30 +190,113 @@ def EMgu(feats, seed=0, maxIter=100, replicates=10, outliersNlogl=42):
     return mahal, other
 
 
-def EMgu_img(spam, valid, extFeat=range(32), seed=0, maxIter=100, replicates=10, outliersNlogl=42):
+def stratifiedSubsample(numVectors, numSamples, randomState):
+    # draw one vector from each of numSamples contiguous (raster order) strata of the valid vectors,
+    # so that the subsample covers the whole image
+    if numSamples is None or numSamples >= numVectors:
+        return np.arange(numVectors)
+    bounds = np.floor(np.linspace(0, numVectors, numSamples + 1)).astype(np.int64)
+    return bounds[:-1] + np.floor(randomState.random_sample(numSamples) * (bounds[1:] - bounds[:-1])).astype(np.int64)
+
+
+def newStats(shape_spam, valid, numFitSamples, extFeat):
+    # statistics of a call to EMgu_img: wall time of each stage [s], iterations and exit flag
+    # of each EM replicate (see gm.EM) and feature counts
+    stats = dict()
+    stats['times'] = dict()
+    stats['replicates'] = list()
+    stats['numVectors'] = shape_spam[0] * shape_spam[1]
+    stats['numValid'] = int(np.sum(valid))
+    stats['numFitSamples'] = numFitSamples
+    stats['numFeatures'] = shape_spam[2]
+    stats['numComponents'] = len(extFeat)
+    return stats
+
+
+def addStageTime(stats, name, startTime, callback=None):
+    # add the time elapsed from startTime to the stage name and return the current time
+    endTime = time.time()
+    stats['times'][name] = stats['times'].get(name, 0.0) + endTime - startTime
+    if callback is not None:
+        callback('stage', {'name': name, 'time': endTime - startTime})
+    return endTime
+
+
+def runReplicate(gm_data, list_valid, stats, maxIter, deadline, callback=None, warm=False):
+    # run the EM of a replicate, recording its statistics
+    index = len(stats['replicates'])
+    startTime = time.time()
+    iterCallback = None
+    if callback is not None:
+        iterCallback = lambda iter, avrLogl: callback('iteration', {'replicate': index, 'iteration': iter,
+                                                                    'avrLogl': avrLogl})
+    avrLogl, flagExit, iter = gm_data.EM(list_valid, maxIter=maxIter, regularizer=-1.0, deadline=deadline,
+                                         callback=iterCallback)
+    replicate = {'iterations': iter + 1, 'flagExit': flagExit, 'avrLogl': avrLogl,
+                 'time': time.time() - startTime, 'warm': warm}
+    stats['replicates'].append(replicate)
+    if callback is not None:
+        callback('replicate', replicate)
+    return avrLogl, flagExit
+
+
+def EMgu_img(spam, valid, extFeat=range(32), seed=0, maxIter=100, replicates=10, outliersNlogl=42, init=None,
+             initTol=1e-2, maxFitSamples=None, pcaParams=None, deadline=None, callback=None):
+    # init is the "other" dictionary returned by a previous call on a nearly identical image:
+    # its whitening L, mu and Sigma are reused and a single warm-started EM is run.
+    # If the average log-likelihood degrades by more than initTol (relative) the full
+    # randomly initialized replicates are run instead.
+    # maxFitSamples: if given, the EM is fitted on a stratified subsample of at most maxFitSamples
+    # valid vectors, the Mahalanobis map is still computed on every vector.
+    # pcaParams: dictionary of additional parameters of faetReduce (streaming/randomized PCA)
+    # deadline: if given, time (as returned by time.time) after which the EM iterations are stopped
+    # and no further replicates are started, at least one replicate is always run.
+    # callback: if given, it is called as callback(event, data) at the end of each stage ('stage'),
+    # EM replicate ('replicate') and EM iteration ('iteration'). The statistics are also returned in other['stats'].
     shape_spam = spam.shape
     list_spam = spam.reshape([shape_spam[0] * shape_spam[1], shape_spam[2]])
+    fitInds = stratifiedSubsample(int(np.sum(valid)), maxFitSamples, np.random.RandomState(seed))
+    stats = newStats(shape_spam, valid, fitInds.size, extFeat)
+
+    if init is not None:
+        mahal, other = EMgu_img_warm(list_spam, valid, shape_spam, init, fitInds, maxIter=maxIter,
+                                     outliersNlogl=outliersNlogl, deadline=deadline, stats=stats, callback=callback)
+        if (other is not None) and (other['avrLogl'] >= init['avrLogl'] - initTol * np.abs(init['avrLogl'])):
+            return mahal, other
+
+    startTime = time.time()
     list_valid = list_spam[valid.flatten(), :]
-    L, eigs = faetReduce(list_valid, extFeat, True)
+    L, eigs = faetReduce(list_valid, extFeat, True, **(pcaParams if pcaParams is not None else dict()))
+    # keep the whitened features in the type of the SPAM vectors (float32), so that the mixture runs in it
+    L = L.astype(list_spam.dtype)
     list_spam = np.matmul(list_spam, L)
-    list_valid = list_spam[valid.flatten(), :]
+    list_valid = list_spam[valid.flatten(), :][fitInds, :]
+    startTime = addStageTime(stats, 'pca', startTime, callback)
 
     randomState = np.random.RandomState(seed)
     gm_data = gm(shape_spam[2], [0, ], [2, ], outliersProb=0.01, outliersNlogl=outliersNlogl, dtype=list_valid.dtype)
     gm_data.setRandomParams(list_valid, regularizer=-1.0, randomState=randomState)
-    avrLogl, _, _ = gm_data.EM(list_valid, maxIter=maxIter, regularizer=-1.0)
+    avrLogl, flagExit = runReplicate(gm_data, list_valid, stats, maxIter, deadline, callback)
+    deadlineHit = (flagExit == 2)
 
     for index in range(1, replicates):
+        if (deadline is not None) and (time.time() >= deadline):
+            deadlineHit = True
+            break
         gm_data_1 = gm(shape_spam[2], [0, ], [2, ], outliersProb=0.01, outliersNlogl=outliersNlogl,
                        dtype=list_valid.dtype)
         gm_data_1.setRandomParams(list_valid, regularizer=-1.0, randomState=randomState)
-        avrLogl_1, _, _ = gm_data_1.EM(list_valid, maxIter=maxIter, regularizer=-1.0)
+        avrLogl_1, flagExit = runReplicate(gm_data_1, list_valid, stats, maxIter, deadline, callback)
+        deadlineHit = deadlineHit or (flagExit == 2)
         if (avrLogl_1 > avrLogl):
             gm_data = gm_data_1
             avrLogl = avrLogl_1
+    startTime = addStageTime(stats, 'em', startTime, callback)
 
     _, mahal = gm_data.getNlogl(list_spam)
     mahal = mahal.reshape([shape_spam[0], shape_spam[1], ])
+    addStageTime(stats, 'scoring', startTime, callback)
+
     other = dict()
     other['Sigma'] = gm_data.listSigma[0]
     other['mu'] = gm_data.mu
@@ -152,4 +304,118 @@ def EMgu_img(spam, valid, extFeat=range(32), seed=0, maxIter=100, replicates=10,
     other['eigs'] = eigs
     other['outliersNlogl'] = outliersNlogl
     other['outliersProb'] = gm_data.outliersProb
+    other['avrLogl'] = avrLogl
+    other['warmStarted'] = False
+    other['deadlineHit'] = deadlineHit
+    other['numFitSamples'] = fitInds.size
+    other['stats'] = stats
+    return mahal, other
+
+
+def EMgu_img_warm(list_spam, valid, shape_spam, init, fitInds, maxIter=100, outliersNlogl=42, deadline=None,
+                  stats=None, callback=None):
+    for key in ['L', 'mu', 'Sigma', 'outliersProb', 'avrLogl']:
+        if key not in init:
+            return None, None
+    L = init['L']
+    if L.shape[0] != shape_spam[2]:
+        return None, None
+    if stats is None:
+        stats = newStats(shape_spam, valid, fitInds.size, range(L.shape[1]))
+
+    startTime = time.time()
+    L = L.astype(list_spam.dtype)
+    list_spam = np.matmul(list_spam, L)
+    list_valid = list_spam[valid.flatten(), :][fitInds, :]
+    startTime = addStageTime(stats, 'pca', startTime, callback)
+
+    gm_data = gm(L.shape[1], [0, ], [2, ], outliersProb=0.01, outliersNlogl=outliersNlogl, dtype=list_valid.dtype)
+    gm_data.setParams(init['mu'], [init['Sigma'], ], outliersProb=init['outliersProb'])
+    try:
+        avrLogl, flagExit = runReplicate(gm_data, list_valid, stats, maxIter, deadline, callback, warm=True)
+    except (ValueError, np.linalg.LinAlgError):
+        # the initialization is degenerate for this image
+        return None, None
+    startTime = addStageTime(stats, 'em', startTime, callback)
+
+    _, mahal = gm_data.getNlogl(list_spam)
+    mahal = mahal.reshape([shape_spam[0], shape_spam[1], ])
+    addStageTime(stats, 'scoring', startTime, callback)
+
+    other = dict()
+    other['Sigma'] = gm_data.listSigma[0]
+    other['mu'] = gm_data.mu
+    other['L'] = L
+    other['eigs'] = init.get('eigs')
+    other['outliersNlogl'] = outliersNlogl
+    other['outliersProb'] = gm_data.outliersProb
+    other['avrLogl'] = avrLogl
+    other['warmStarted'] = True
+    other['deadlineHit'] = (flagExit == 2)
+    other['numFitSamples'] = fitInds.size
+    other['stats'] = stats
     return mahal, other
+
+
+def fitReferenceModel(list_spam, extFeat=range(32), seed=0, maxIter=100, replicates=10, outliersNlogl=42,
+                      maxFitSamples=None, pcaParams=None):
+    # fit whitening, mean and covariance of the SPAM vectors of authentic images of a camera (or dataset),
+    # list_spam is a (N x 512) array with the valid vectors of all the images.
+    # The returned dictionary can be used by scoreReferenceModel to score new images without any EM.
+    fitInds = stratifiedSubsample(list_spam.shape[0], maxFitSamples, np.random.RandomState(seed))
+
+    L, eigs = faetReduce(list_spam, extFeat, True, **(pcaParams if pcaParams is not None else dict()))
+    L = L.astype(list_spam.dtype)
+    list_valid = np.matmul(list_spam[fitInds, :], L)
+
+    randomState = np.random.RandomState(seed)
+    gm_data = None
+    avrLogl = -np.inf
+    for index in range(replicates):
+        gm_data_1 = gm(list_valid.shape[1], [0, ], [2, ], outliersProb=0.01, outliersNlogl=outliersNlogl,
+                       dtype=list_valid.dtype)
+        gm_data_1.setRandomParams(list_valid, regularizer=-1.0, randomState=randomState)
+        avrLogl_1, _, _ = gm_data_1.EM(list_valid, maxIter=maxIter, regularizer=-1.0)
+        if (gm_data is None) or (avrLogl_1 > avrLogl):
+            gm_data = gm_data_1
+            avrLogl = avrLogl_1
+
+    model = dict()
+    model['Sigma'] = gm_data.listSigma[0]
+    model['mu'] = gm_data.mu
+    model['L'] = L
+    model['eigs'] = eigs
+    model['outliersNlogl'] = outliersNlogl
+    model['outliersProb'] = gm_data.outliersProb
+    model['avrLogl'] = avrLogl
+    model['numFitSamples'] = fitInds.size
+    return model
+
+
+def scoreReferenceModel(spam, model):
+    # Mahalanobis map of the SPAM vectors with respect to a model fitted by fitReferenceModel
+    shape_spam = spam.shape
+    list_spam = spam.reshape([shape_spam[0] * shape_spam[1], shape_spam[2]])
+    L = model['L']
+    list_spam = np.matmul(list_spam, L.astype(list_spam.dtype))
+
+    gm_data = gm(L.shape[1], [0, ], [2, ], outliersProb=0.01, outliersNlogl=model['outliersNlogl'],
+                 dtype=list_spam.dtype)
+    gm_data.setParams(model['mu'], [model['Sigma'], ], outliersProb=model['outliersProb'])
+
+    _, mahal = gm_data.getNlogl(list_spam)
+    mahal = mahal.reshape([shape_spam[0], shape_spam[1], ])
+    return mahal
+
+
+def saveReferenceModel(filename, model):
+    np.savez(filename, **{key: np.asarray(value) for key, value in model.items()})
+
+
+def loadReferenceModel(filename):
+    data = np.load(filename)
+    model = {key: data[key] for key in data.files}
+    for key in ['outliersNlogl', 'outliersProb', 'avrLogl', 'numFitSamples', 'stride', 'ksize', 'quality']:
+        if key in model:
+            model[key] = model[key].item()
+    return model
@@ -8,10 +8,13 @@
 # (included in this package) 
 #
 
+import time
+
 import numpy as np
 from numpy.linalg import cholesky
 from numpy.linalg import eigh
 from scipy.linalg import eigvalsh
+from scipy.linalg import solve_triangular
 
 
 class gm:
@@ -23,6 +26,11 @@ class gm:
     listSigmaInds = []
     listSigmaType = []
 
+    # cache of the factorization of listSigma: (dtype, listSigma, listLowMtx, listLogDet)
+    _factors = None
+    # work buffers reused across the EM iterations
+    _buffers = None
+
     # sigmaType = 0 # isotropic covariance
     # sigmaType = 1 # diagonal covariance
     # sigmaType = 2 # full covariance
@@ -52,6 +60,57 @@ class gm:
             else:
                 self.listSigma[s] = np.ones([], dtype=dtype)
 
+        self._factors = None
+        self._buffers = dict()
+
+    def _getBuffer(self, name, shape, dtype):
+        # return a work buffer of the given shape and type, allocating it only if needed
+        buffer = self._buffers.get(name)
+        if (buffer is None) or (buffer.shape != shape) or (buffer.dtype != dtype):
+            buffer = np.empty(shape, dtype=dtype)
+            self._buffers[name] = buffer
+        return buffer
+
+    def _getFactors(self, dtype):
+        # lower triangular factors and log-determinants of the covariances,
+        # computed only once for each set of covariances
+        S = len(self.listSigmaType)
+        if (self._factors is not None) and (self._factors[0] == dtype) and \
+                all([a is b for a, b in zip(self._factors[1], self.listSigma)]):
+            return self._factors[2], self._factors[3]
+
+        listLogDet = [None, ] * S
+        listLowMtx = [None, ] * S
+        for s in range(S):
+            sigmaType = self.listSigmaType[s]
+            sigma = self.listSigma[s]
+            if sigmaType == 2:  # full covariance
+                try:
+                    lowMtx = cholesky(sigma)
+                except:
+                    # exceptional regularization
+                    sigma_w, sigma_v = eigh(np.real(sigma))
+                    sigma_w = np.maximum(sigma_w, np.spacing(np.max(sigma_w)))
+                    sigma = np.matmul(np.matmul(sigma_v, np.diag(sigma_w)), (np.transpose(sigma_v, [1, 0])))
+                    try:
+                        lowMtx = cholesky(sigma)
+                    except:
+                        sigma_w, sigma_v = eigh(np.real(sigma))
+                        sigma_w = np.maximum(sigma_w, np.spacing(np.max(sigma_w)))
+                        sigma = np.matmul(np.matmul(sigma_v, np.diag(sigma_w)), (np.transpose(sigma_v, [1, 0])))
+                        lowMtx = cholesky(sigma)
+                listLowMtx[s] = np.asarray(lowMtx, dtype=dtype)
+                listLogDet[s] = dtype.type(2 * np.sum(np.log(np.diag(lowMtx))))
+            elif sigmaType == 1:  # diagonal covariance
+                listLowMtx[s] = np.asarray(np.sqrt(sigma), dtype=dtype)
+                listLogDet[s] = dtype.type(np.sum(np.log(sigma)))
+            else:  # isotropic covariance
+                listLowMtx[s] = np.asarray(np.sqrt(sigma), dtype=dtype)
+                listLogDet[s] = dtype.type(np.size(self.mu, 1) * np.log(sigma))
+
+        self._factors = (dtype, list(self.listSigma), listLowMtx, listLogDet)
+        return listLowMtx, listLogDet
+
     def setRandomParams(self, X, regularizer=0, randomState=np.random.get_state()):
         [N, dim] = X.shape
         K = len(self.listSigmaInds)
@@ -81,6 +140,21 @@ class gm:
                 self.listSigma[s] = np.mean(varX)
         return inds
 
+    def setParams(self, mu, listSigma, outliersProb=None):
+        K = len(self.listSigmaInds)
+        dtype = self.mu.dtype
+
+        if outliersProb is not None:
+            self.outliersProb = outliersProb
+
+        if self.outliersProb > 0:
+            self.prioriProb = (1.0 - self.outliersProb) * np.ones((K, 1), dtype=dtype) / K
+        else:
+            self.prioriProb = np.ones((K, 1), dtype=dtype) / K
+
+        self.mu = np.array(mu, dtype=dtype)
+        self.listSigma = [np.array(sigma, dtype=dtype) for sigma in listSigma]
+
     def setRandomParamsW(self, X, weights, regularizer=0, randomState=np.random.get_state(), meanFlag=False):
         [N, dim] = X.shape
         K = len(self.listSigmaInds)
@@ -122,64 +196,36 @@ class gm:
     def getNlogl(self, X):
         [N, dim] = X.shape
         K = len(self.listSigmaInds)
-        S = len(self.listSigmaType)
         dtype = X.dtype
 
         K0 = K
         if self.outliersProb >= 0: K0 = K + 1
 
-        nlogl = np.zeros([N, K0], dtype=dtype)
-        mahal = np.zeros([N, K], dtype=dtype)
-        listLogDet = [None, ] * S
-        listLowMtx = [None, ] * S
-        for s in range(S):
-            sigmaType = self.listSigmaType[s]
-            sigma = self.listSigma[s]
-            if sigmaType == 2:  # full covariance
-                try:
-                    listLowMtx[s] = cholesky(sigma)
-                except:
-                    # exceptional regularization
-                    sigma_w, sigma_v = eigh(np.real(sigma))
-                    sigma_w = np.maximum(sigma_w, np.spacing(np.max(sigma_w)))
-                    sigma = np.matmul(np.matmul(sigma_v, np.diag(sigma_w)), (np.transpose(sigma_v, [1, 0])))
-                    try:
-                        listLowMtx[s] = cholesky(sigma)
-                    except:
-                        sigma_w, sigma_v = eigh(np.real(sigma))
-                        sigma_w = np.maximum(sigma_w, np.spacing(np.max(sigma_w)))
-                        # print(np.min(sigma_w))
-                        sigma = np.matmul(np.matmul(sigma_v, np.diag(sigma_w)), (np.transpose(sigma_v, [1, 0])))
-                        # print(sigma)
-                        listLowMtx[s] = cholesky(sigma)
-                diagLowMtx = np.diag(listLowMtx[s])
-                listLogDet[s] = 2 * np.sum(np.log(diagLowMtx))
-            elif sigmaType == 1:  # diagonal covariance
-                listLowMtx[s] = np.sqrt(sigma)
-                listLogDet[s] = np.sum(np.log(sigma))
-            else:  # isotropic covariance
-                listLowMtx[s] = np.sqrt(sigma)
-                listLogDet[s] = dim * np.log(sigma)
+        nlogl = np.empty([N, K0], dtype=dtype)
+        mahal = np.empty([N, K], dtype=dtype)
+        listLowMtx, listLogDet = self._getFactors(dtype)
 
-        constPi = dim * np.log(2 * np.pi)
+        constPi = dtype.type(dim * np.log(2 * np.pi))
         for k in range(K):
             s = self.listSigmaInds[k]
             sigmaType = self.listSigmaType[s]
             lowMtx = listLowMtx[s]
             logDet = listLogDet[s]
 
-            Xmu = X - self.mu[k, :]
+            Xmu = np.subtract(X, self.mu[k, :], out=self._getBuffer('Xmu', (N, dim), dtype))
 
             if sigmaType == 2:  # full covariance
-                Xmu = np.linalg.solve(lowMtx, Xmu.transpose()).transpose()
-            elif sigmaType == 1:  # diagonal covariance
-                Xmu = Xmu / lowMtx
-            else:  # isotropic covariance
-                Xmu = Xmu / lowMtx
+                # the transposed buffer is Fortran ordered, the triangular solve can work in place
+                Xmu = solve_triangular(lowMtx, Xmu.transpose(), lower=True, overwrite_b=True,
+                                       check_finite=False).transpose()
+            else:  # diagonal or isotropic covariance
+                Xmu = np.divide(Xmu, lowMtx, out=Xmu)
 
-            mahal[:, k] = np.sum(Xmu * Xmu, axis=1)
+            np.einsum('ij,ij->i', Xmu, Xmu, out=mahal[:, k])
 
-            nlogl[:, k] = 0.5 * (mahal[:, k] + logDet + constPi)
+            nlogl[:, k] = mahal[:, k]
+            nlogl[:, k] += logDet + constPi
+            nlogl[:, k] *= dtype.type(0.5)
 
         if self.outliersProb >= 0:
             nlogl[:, K] = self.outliersNlogl
@@ -194,7 +240,8 @@ class gm:
             logPrb = np.append(logPrb.squeeze(), np.log(self.outliersProb))
             logPrb = logPrb.reshape((-1, 1))
 
-        return logPrb.transpose((1, 0)) - nlogl
+        # the log-likelihood is computed in place of the nlogl buffer, keeping the type of X
+        return np.subtract(logPrb.transpose((1, 0)).astype(nlogl.dtype), nlogl, out=nlogl)
 
     def getLoglhInlier(self, X):
         nlogl, _ = self.getNlogl(X)
@@ -224,24 +271,26 @@ class gm:
                 sigmadem = np.zeros([], dtype=dtype)
                 for k in range(K):
                     if s == self.listSigmaInds[k]:
-                        Xmu = X - self.mu[(k,), :]
-                        Xmu = np.sqrt(post[:, (k,)]) * Xmu
-                        sigma = sigma + np.tensordot(Xmu, Xmu, (0, 0))
+                        Xmu = np.subtract(X, self.mu[(k,), :], out=self._getBuffer('Xmu', (N, dim), dtype))
+                        Xmu = np.multiply(Xmu, np.sqrt(post[:, (k,)]), out=Xmu)
+                        sigma += np.dot(Xmu.transpose(), Xmu)
                         sigmadem += self.prioriProb[k, 0]
                 sigma = sigma / sigmadem
                 if regularizer > 0:
-                    sigma = sigma + regularizer * np.eye(dim)
+                    sigma = sigma + regularizer * np.eye(dim, dtype=dtype)
                 elif regularizer < 0:
                     # sigma = sigma - regularizer * np.spacing(np.max(np.linalg.eigvalsh(sigma))) * np.eye(dim)
                     sigma = sigma + np.abs(
-                        regularizer * np.spacing(eigvalsh(sigma, eigvals=(dim - 1, dim - 1)))) * np.eye(dim)
+                        regularizer * np.spacing(eigvalsh(sigma, eigvals=(dim - 1, dim - 1)))) * np.eye(dim,
+                                                                                                       dtype=dtype)
             elif sigmaType == 1:  # diagonal covariance
                 sigma = np.zeros([1, dim], dtype=dtype)
                 sigmadem = np.zeros([], dtype=dtype)
                 for k in range(K):
                     if s == self.listSigmaInds[k]:
-                        Xmu = X - self.mu[(k,), :]
-                        sigma = sigma + np.tensordot(post[:, (k,)], (Xmu * Xmu), (0, 0))
+                        Xmu = np.subtract(X, self.mu[(k,), :], out=self._getBuffer('Xmu', (N, dim), dtype))
+                        Xmu = np.square(Xmu, out=Xmu)
+                        sigma = sigma + np.tensordot(post[:, (k,)], Xmu, (0, 0))
                         sigmadem += self.prioriProb[k, 0]
                 sigma = sigma / sigmadem
                 if regularizer > 0:
@@ -253,15 +302,16 @@ class gm:
                 sigmadem = np.zeros([], dtype=dtype)
                 for k in range(K):
                     if s == self.listSigmaInds[k]:
-                        Xmu = X - self.mu[(k,), :]
-                        sigma = sigma + np.dot(post[:, k], np.mean((Xmu * Xmu), axis=1))
+                        Xmu = np.subtract(X, self.mu[(k,), :], out=self._getBuffer('Xmu', (N, dim), dtype))
+                        Xmu = np.square(Xmu, out=Xmu)
+                        sigma = sigma + np.dot(post[:, k], np.mean(Xmu, axis=1))
                         sigmadem += self.prioriProb[k, 0]
                 sigma = sigma / sigmadem
                 if regularizer > 0:
                     sigma = sigma + regularizer
                 elif regularizer < 0:
                     sigma = sigma + np.abs(regularizer * np.spacing(sigma))
-            self.listSigma[s] = sigma
+            self.listSigma[s] = np.asarray(sigma, dtype=dtype)
 
         # normalize PComponents
         if self.outliersProb < 0:
@@ -290,14 +340,19 @@ class gm:
         [post, avrLogl] = self.expectationWeighed(X, weights)
         return post, avrLogl
 
-    def EM(self, X, regularizer, maxIter, relErr=1e-5):
+    def EM(self, X, regularizer, maxIter, relErr=1e-5, deadline=None, callback=None):
+        # deadline: if given, time (as returned by time.time) after which the iterations are stopped
+        # callback: if given, it is called as callback(iter, avrLogl) after each iteration
         [post, avrLogl_old] = self.expectation(X)
 
         flagExit = 1
         # flagExit = 1 # max number of iteretions
         # flagExit = 0 # converged
+        # flagExit = 2 # deadline reached
         for iter in range(maxIter):
             [post, avrLogl] = self.MEstep(X, post, regularizer=regularizer)
+            if callback is not None:
+                callback(iter, avrLogl)
 
             diff = avrLogl - avrLogl_old
             if (diff >= 0) & (diff < relErr * np.abs(avrLogl)):
@@ -305,6 +360,10 @@ class gm:
                 break
             avrLogl_old = avrLogl
 
+            if (deadline is not None) and (time.time() >= deadline):
+                flagExit = 2
+                break
+
         return avrLogl, flagExit, iter
 
     def EMweighed(self, X, weights, regularizer, maxIter, relErr=1e-5):
@@ -0,0 +1,86 @@
+import numpy as np
+
+# windows up to this size are filtered directly instead of using the van Herk/Gil-Werman algorithm
+smallWindow = 9
+
+
+def runningFilter(x, size, axis, op, identity):
+    # apply op (np.maximum or np.minimum) over a centered window of the given odd size along one axis of an array.
+    # Samples outside the array are equal to identity, that is the window is clipped to the array.
+    # Large windows use the van Herk/Gil-Werman algorithm (3 comparisons per sample whatever the size),
+    # small ones are computed directly from the shifted arrays.
+    assert size % 2 == 1
+    if size == 1:
+        return x
+
+    n = x.shape[axis]
+    radius = size // 2
+    before = (slice(None),) * axis
+
+    if size <= smallWindow:
+        padded = np.full(x.shape[:axis] + (n + 2 * radius,) + x.shape[axis + 1:], identity, dtype=x.dtype)
+        padded[before + (slice(radius, radius + n),)] = x
+        out = padded[before + (slice(0, n),)].copy()
+        for index in range(1, size):
+            op(out, padded[before + (slice(index, index + n),)], out=out)
+        return out
+
+    numBlocks = -(-(n + 2 * radius) // size)
+    padded = np.full(x.shape[:axis] + (numBlocks * size,) + x.shape[axis + 1:], identity, dtype=x.dtype)
+    padded[before + (slice(radius, radius + n),)] = x
+    blocks = padded.reshape(x.shape[:axis] + (numBlocks, size) + x.shape[axis + 1:])
+
+    # prefix and suffix accumulations inside each block
+    prefix = op.accumulate(blocks, axis=axis + 1).reshape(padded.shape)
+    suffix = op.accumulate(blocks[before + (slice(None), slice(None, None, -1))], axis=axis + 1)
+    suffix = suffix[before + (slice(None), slice(None, None, -1))].reshape(padded.shape)
+
+    # the window [i, i + size - 1] of the padded array is centered on the sample i of x
+    # and spans at most two blocks
+    return op(suffix[before + (slice(0, n),)], prefix[before + (slice(size - 1, size - 1 + n),)])
+
+
+def maxFilter(x, size):
+    # separable rectangular maximum filter, equivalent to scipy.ndimage.maximum_filter with odd sizes
+    for axis in range(len(size)):
+        x = runningFilter(x, size[axis], axis, np.maximum, 0)
+    return x
+
+
+def minFilter(x, size, identity=1):
+    # separable rectangular minimum filter, samples outside the array are equal to identity
+    for axis in range(len(size)):
+        x = runningFilter(x, size[axis], axis, np.minimum, identity)
+    return x
+
+
+def diskRectangles(radius):
+    # decompose the disk {x^2 + y^2 <= radius^2} (skimage.morphology.disk) into the union of centered rectangles
+    listRect = list()
+    for dy in range(radius + 1):
+        dx = int(np.floor(np.sqrt(radius ** 2 - dy ** 2)))
+        if (dy < radius) and (dx == int(np.floor(np.sqrt(radius ** 2 - (dy + 1) ** 2)))):
+            continue  # contained in the next (taller) rectangle
+        listRect.append((2 * dy + 1, 2 * dx + 1))
+    return listRect
+
+
+def binaryOpeningDisk(mask, radius):
+    # binary opening with a disk of the given radius of a uint8 {0,1} bitmap,
+    # same output of skimage.morphology.binary_opening(mask, disk(radius)).
+    # Erosion and dilation by a union of rectangles are the intersection and the union
+    # of the separable erosions and dilations by each rectangle.
+    if not np.any(mask):
+        return np.zeros_like(mask)
+
+    listRect = diskRectangles(radius)
+
+    eroded = minFilter(mask, listRect[0])
+    for rect in listRect[1:]:
+        eroded = np.minimum(eroded, minFilter(mask, rect), out=eroded)
+
+    opened = maxFilter(eroded, listRect[0])
+    for rect in listRect[1:]:
+        opened = np.maximum(opened, maxFilter(eroded, rect), out=opened)
+
+    return opened
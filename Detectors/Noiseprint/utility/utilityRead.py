@@ -124,18 +124,35 @@ def jpeg_qtableinv(stream, tnum=0, force_baseline=None):
     return s
 
 
-from scipy.interpolate import interp1d
+from functools import lru_cache
+
+
+def nearestIndices(grid, numOut):
+    # indices of the nearest samples of grid for the positions 0, ..., numOut-1,
+    # same rule of scipy.interpolate.interp1d with kind='nearest' and extrapolation
+    grid = np.asarray(grid, dtype=np.float64)
+    bounds = (grid[1:] + grid[:-1]) / 2.0
+    inds = np.searchsorted(bounds, np.arange(numOut), side='left')
+    return np.clip(inds, 0, grid.size - 1)
+
+
+@lru_cache(maxsize=32)
+def getResizeIndices(range0, range1, shapeOut):
+    # row and column gather indices of resizeMapWithPadding, cached since they
+    # depend only on the sampling grid and on the size of the image
+    inds0 = nearestIndices(range0, shapeOut[0])
+    inds1 = nearestIndices(range1, shapeOut[1])
+    inds0.setflags(write=False)
+    inds1.setflags(write=False)
+    return inds0, inds1
 
 
 def resizeMapWithPadding(x, range0, range1, shapeOut):
-    range0 = range0.flatten()
-    range1 = range1.flatten()
-    xv = np.arange(shapeOut[1])
-    yv = np.arange(shapeOut[0])
-    y = interp1d(range1, x, axis=1, kind='nearest', fill_value='extrapolate', assume_sorted=True, bounds_error=False)
-    y = interp1d(range0, y(xv), axis=0, kind='nearest', fill_value='extrapolate', assume_sorted=True,
-                 bounds_error=False)
-    return y(yv).astype(x.dtype)
+    range0 = tuple(np.asarray(range0).flatten().tolist())
+    range1 = tuple(np.asarray(range1).flatten().tolist())
+    inds0, inds1 = getResizeIndices(range0, range1, (int(shapeOut[0]), int(shapeOut[1])))
+    # columns are gathered first on the small map, then whole rows are copied
+    return np.take(np.take(x, inds1, axis=1), inds0, axis=0)
 
 
 def computeMetricsContinue(values, gt0, gt1):
@@ -156,6 +173,33 @@ def computeMetricsContinue(values, gt0, gt1):
     return FP, TP, FN, TN, vet_th
 
 
+def computeMetricsThresholds(values, gt):
+    # confusion counts of the predictions (values > th) for every threshold th that changes the prediction,
+    # that are -inf (everything positive) and each distinct value (last element of each group of ties)
+    values = values.flatten()
+    gt = gt.flatten() > 0
+    inds = np.argsort(values, kind='stable')
+    vet_th = values[inds]
+    gt = gt[inds]
+    last = np.append(vet_th[1:] != vet_th[:-1], True)
+
+    FN = np.concatenate([[0], np.cumsum(gt, dtype=np.int64)[last]])
+    TN = np.concatenate([[0], np.arange(1, gt.size + 1, dtype=np.int64)[last]]) - FN
+    TP = FN[-1] - FN
+    FP = TN[-1] - TN
+    vet_th = np.concatenate([[-np.inf], vet_th[last]])
+
+    return FP, TP, FN, TN, vet_th
+
+
+def computeF1MCCThresholds(values, gt):
+    FP, TP, FN, TN, vet_th = computeMetricsThresholds(values, gt)
+    FP, TP, FN, TN = [v.astype(np.float64) for v in (FP, TP, FN, TN)]
+    f1 = 2 * TP / np.maximum(2 * TP + FP + FN, 1e-32)
+    mcc = (TP * TN - FP * FN) / np.maximum(np.sqrt((TP + FP) * (TP + FN) * (TN + FP) * (TN + FN)), 1e-32)
+    return f1, mcc, vet_th
+
+
 def computeMCC(values, gt0, gt1):
     FP, TP, FN, TN, vet_th = computeMetricsContinue(values, gt0, gt1)
     mcc = np.abs(TP * TN - FP * FN) / np.maximum(np.sqrt((TP + FP) * (TP + FN) * (TN + FP) * (TN + FN)), 1e-32)
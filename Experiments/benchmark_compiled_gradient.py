@@ -0,0 +1,60 @@
+import argparse
+import os
+import time
+
+import numpy as np
+
+from Attacks.Noiseprint.Mimiking.NoiseprintMimickingAttack import NoiseprintMimickingAttack
+from Datasets import get_image_and_mask
+
+DEBUG_ROOT = os.path.abspath("Data/Debug/")
+DATASETS_ROOT = os.path.abspath("Data/Datasets/")
+
+
+def run_attack(target_image, target_mask, source_image, source_mask, steps, alpha, compiled):
+    """
+    Run the steps of a noiseprint mimicking attack measuring the time of each one
+    :param compiled: should the gradients be computed by the compiled gradient step?
+    :return: list of step times [s], final adversarial noise
+    """
+    attack = NoiseprintMimickingAttack(target_image, target_mask, source_image, source_mask, steps, alpha,
+                                       plot_interval=0, debug_root=DEBUG_ROOT, test=True)
+    attack.compiled_gradient = compiled
+
+    attack._on_before_attack()
+
+    step_times = []
+    for attack.step_counter in range(steps):
+        start_time = time.time()
+        attack.attack(attack.target_image)
+        step_times.append(time.time() - start_time)
+
+    return step_times, attack.noise
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-i', '--image', default="splicing-70.png", help='Name or path of the image to attack')
+    parser.add_argument('-s', '--source', default="normal-42.png", help='Name or path of the source image')
+    parser.add_argument('--steps', default=50, type=int, help='Number of attack steps to perform')
+    parser.add_argument('-a', '--alpha', default=5, type=float, help='Strength of the attack')
+    args = parser.parse_args()
+
+    target_image, target_mask = get_image_and_mask(DATASETS_ROOT, args.image)
+    source_image, source_mask = get_image_and_mask(DATASETS_ROOT, args.source)
+
+    results = dict()
+    for compiled in [False, True]:
+        results[compiled] = run_attack(target_image, target_mask, source_image, source_mask, args.steps, args.alpha,
+                                       compiled)
+
+    print("{:<10} {:>14} {:>18} {:>14}".format("mode", "first step [s]", "mean next steps [s]", "total [s]"))
+    for compiled, (step_times, _) in results.items():
+        print("{:<10} {:>14.3f} {:>18.3f} {:>14.2f}".format("compiled" if compiled else "eager", step_times[0],
+                                                            np.mean(step_times[1:]), np.sum(step_times)))
+
+    eager_times, eager_noise = results[False]
+    compiled_times, compiled_noise = results[True]
+    print("Per-step speedup (steps after the first): {:.2f}x".format(np.mean(eager_times[1:]) /
+                                                                     np.mean(compiled_times[1:])))
+    print("Max absolute difference of the final noise: {:.4f}".format(np.max(np.abs(eager_noise - compiled_noise))))
@@ -0,0 +1,82 @@
+import argparse
+import os
+import time
+
+import numpy as np
+
+from Datasets import get_image_and_mask
+from Detectors.Noiseprint.noiseprintEngine import NoiseprintEngine
+from Detectors.Noiseprint.post_em import getSpamFromNoiseprint, EMgu_img
+from Detectors.Noiseprint.utility.utility import prepare_image_noiseprint
+
+DATASETS_ROOT = os.path.abspath("Data/Datasets/")
+
+# images on which to run the benchmark
+images = [
+    "canong3_canonxt_sub_13.tif",  # canong3
+    "splicing-70.png",
+    "DPP0122.TIF",  # Canon60D
+    "r1be2a3d5t.TIF",  # NikonD90
+]
+
+# sizes of the subsample used to fit the gaussian mixture
+sample_sizes = [1000, 2000, 5000, 10000, 20000, 50000]
+
+
+def heatmaps_agreement(reference_map, map, valid):
+    """
+    Measure how much two heatmaps agree on the valid vectors
+    :param reference_map: heatmap computed by fitting the EM on all the vectors
+    :param map: heatmap to compare
+    :param valid: mask of the valid vectors
+    :return: pearson correlation, fraction of vectors on which the two maps above their median agree
+    """
+    reference_map = reference_map[valid]
+    map = map[valid]
+
+    correlation = np.corrcoef(reference_map, map)[0, 1]
+    agreement = np.mean((reference_map > np.median(reference_map)) == (map > np.median(map)))
+
+    return correlation, agreement
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-i', '--images', nargs='+', default=images, help='Names or paths of the images to use')
+    parser.add_argument('-q', '--quality', default=101, type=int, help='Quality factor of the noiseprint model')
+    args = parser.parse_args()
+
+    engine = NoiseprintEngine()
+    engine.load_quality(args.quality)
+
+    print("{:<32} {:>8} {:>10} {:>10} {:>12} {:>10}".format("image", "samples", "time [s]", "speedup",
+                                                          "correlation", "agreement"))
+
+    for image_name in args.images:
+        image, _ = get_image_and_mask(DATASETS_ROOT, image_name)
+        image = prepare_image_noiseprint(image)
+
+        noiseprint = engine.predict(image)
+        spam, valid, _, _, _ = getSpamFromNoiseprint(noiseprint, image)
+
+        start_time = time.time()
+        reference_map, other = EMgu_img(spam, valid)
+        reference_time = time.time() - start_time
+
+        print("{:<32} {:>8} {:>10.2f} {:>10.2f} {:>12.4f} {:>10.4f}".format(os.path.basename(image_name),
+                                                                          other['numFitSamples'], reference_time,
+                                                                          1, 1, 1))
+
+        for sample_size in sample_sizes:
+            if sample_size >= other['numFitSamples']:
+                break
+
+            start_time = time.time()
+            map, _ = EMgu_img(spam, valid, maxFitSamples=sample_size)
+            elapsed_time = time.time() - start_time
+
+            correlation, agreement = heatmaps_agreement(reference_map, map, valid)
+
+            print("{:<32} {:>8} {:>10.2f} {:>10.2f} {:>12.4f} {:>10.4f}".format("", sample_size, elapsed_time,
+                                                                              reference_time / elapsed_time,
+                                                                              correlation, agreement))
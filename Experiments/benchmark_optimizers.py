@@ -0,0 +1,69 @@
+import argparse
+import os
+
+import numpy as np
+
+from Attacks.Noiseprint.Mimiking.NoiseprintMimickingAttack import NoiseprintMimickingAttack
+from Attacks.Optimizers import supported_optimizers
+from Attacks.StoppingCriteria import DetectorScoreReached
+from Datasets import get_image_and_mask
+
+DEBUG_ROOT = os.path.abspath("Data/Debug/")
+DATASETS_ROOT = os.path.abspath("Data/Datasets/")
+
+
+def relative_loss(attack, attacked_image):
+    """
+    Loss of the last step relative to the loss of the first step
+    """
+    return attack.loss_steps[-1] / attack.loss_steps[1]
+
+
+def run_attack(target_image, target_mask, source_image, source_mask, optimizer_name, steps, alpha, target_ratio):
+    """
+    Run a noiseprint mimicking attack with the given optimizer until the loss drops to target_ratio times the loss of
+    the first step or the steps are over
+    :return: number of steps executed (= detector evaluations), loss of each step, PSNR of each step
+    """
+    attack = NoiseprintMimickingAttack(target_image, target_mask, source_image, source_mask, steps, alpha,
+                                       plot_interval=0, debug_root=DEBUG_ROOT, test=True)
+
+    if optimizer_name != "momentum":
+        attack.optimizer = supported_optimizers[optimizer_name]()
+
+    attack.checkpoint_interval = 0
+    attack.stopping_criteria = [DetectorScoreReached(target_ratio, interval=1, score_function=relative_loss)]
+    attack.execute()
+
+    return len(attack.loss_steps) - 1, [float(loss) for loss in attack.loss_steps[1:]], attack.psnr_steps[1:]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-i', '--image', default="splicing-70.png", help='Name or path of the image to attack')
+    parser.add_argument('-s', '--source', default="normal-42.png", help='Name or path of the source image')
+    parser.add_argument('--steps', default=100, type=int, help='Maximum number of attack steps')
+    parser.add_argument('-a', '--alpha', default=5, type=float, help='Strength of the attack')
+    parser.add_argument('-t', '--target_ratio', default=0.5, type=float,
+                        help='Target loss, as a fraction of the loss of the first step')
+    parser.add_argument('-o', '--optimizers', nargs='+', default=list(supported_optimizers.keys()),
+                        choices=list(supported_optimizers.keys()), help='Optimizers to compare')
+    args = parser.parse_args()
+
+    target_image, target_mask = get_image_and_mask(DATASETS_ROOT, args.image)
+    source_image, source_mask = get_image_and_mask(DATASETS_ROOT, args.source)
+
+    results = dict()
+    for optimizer_name in args.optimizers:
+        results[optimizer_name] = run_attack(target_image, target_mask, source_image, source_mask, optimizer_name,
+                                             args.steps, args.alpha, args.target_ratio)
+
+    print("{:<10} {:>16} {:>12} {:>12}".format("optimizer", "steps to target", "final loss", "final PSNR"))
+    for optimizer_name, (num_steps, losses, psnrs) in results.items():
+        reached = losses[-1] <= args.target_ratio * losses[0]
+        print("{:<10} {:>16} {:>12.4f} {:>12.2f}".format(optimizer_name, num_steps if reached else "not reached",
+                                                         losses[-1], psnrs[-1]))
+
+    best = min(results.keys(), key=lambda name: (results[name][1][-1] > args.target_ratio * results[name][1][0],
+                                                 results[name][0], np.min(results[name][1])))
+    print("Fewest detector evaluations: {}".format(best))
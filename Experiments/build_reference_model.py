@@ -0,0 +1,84 @@
+import argparse
+import os
+
+import numpy as np
+
+from Datasets import supported_datasets
+from Datasets.RIT.RitDataset import RitDataset
+from Detectors.Noiseprint.noiseprintEngine import NoiseprintEngine
+from Detectors.Noiseprint.post_em import getSpamFromNoiseprint, stratifiedSubsample, fitReferenceModel, \
+    saveReferenceModel, ksize_default, stride_default
+from Detectors.Noiseprint.utility.utility import prepare_image_noiseprint
+from Ulitities.Image.Picture import Picture
+
+DATASETS_ROOT = os.path.abspath("Data/Datasets/")
+
+
+def get_authentic_images(dataset_name, camera=None):
+    """
+    List the authentic images of a dataset
+    :param dataset_name: name of the dataset (one of the supported datasets)
+    :param camera: for the RIT dataset, name of the camera folder whose pristine images to use (None for all)
+    :return: list of paths
+    """
+    dataset = supported_datasets[dataset_name](DATASETS_ROOT)
+
+    if isinstance(dataset, RitDataset) and camera is not None:
+        if camera not in dataset.camera_folders:
+            raise ValueError("Unknown camera {}, available cameras: {}".format(camera, dataset.camera_folders))
+        dataset.camera_folders = [camera]
+
+    return dataset.get_authentic_images()
+
+
+def get_reference_vectors(engine, image_path, max_vectors, seed=0):
+    """
+    Compute the valid SPAM vectors of an authentic image
+    :param engine: noiseprint engine with the desired quality already loaded
+    :param image_path: path of the image
+    :param max_vectors: maximum number of vectors to keep from the image
+    :param seed: seed of the subsampling
+    :return: (N x 512) numpy array
+    """
+    image = prepare_image_noiseprint(Picture(image_path))
+
+    noiseprint = engine.predict(image)
+    spam, valid, _, _, _ = getSpamFromNoiseprint(noiseprint, image, ksize=ksize_default, stride=stride_default)
+
+    vectors = spam[valid]
+    return vectors[stratifiedSubsample(vectors.shape[0], max_vectors, np.random.RandomState(seed))]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-d', '--dataset', default="rit", choices=list(supported_datasets.keys()),
+                        help='Dataset whose authentic images are used to fit the model')
+    parser.add_argument('-c', '--camera', default=None, type=str, help='Camera folder of the RIT dataset to use')
+    parser.add_argument('-q', '--quality', default=101, type=int, help='Quality factor of the noiseprint model')
+    parser.add_argument('-v', '--vectors_per_image', default=5000, type=int,
+                        help='Maximum number of SPAM vectors to keep from each image')
+    parser.add_argument('-s', '--max_fit_samples', default=None, type=int,
+                        help='Maximum number of vectors used to fit the model')
+    parser.add_argument('-o', '--output', required=True, type=str, help='Path of the .npz file of the model')
+    args = parser.parse_args()
+
+    engine = NoiseprintEngine()
+    engine.load_quality(args.quality)
+
+    images = get_authentic_images(args.dataset, args.camera)
+
+    list_vectors = []
+    for index, image_path in enumerate(images):
+        print("({}/{}) {}".format(index + 1, len(images), os.path.basename(image_path)))
+        list_vectors.append(get_reference_vectors(engine, image_path, args.vectors_per_image, seed=index))
+
+    list_spam = np.concatenate(list_vectors, axis=0)
+    print("Fitting the model on {} vectors".format(list_spam.shape[0]))
+
+    model = fitReferenceModel(list_spam, maxFitSamples=args.max_fit_samples)
+    model['stride'] = stride_default
+    model['ksize'] = ksize_default
+    model['quality'] = args.quality
+
+    saveReferenceModel(args.output, model)
+    print("Model saved to {}".format(args.output))
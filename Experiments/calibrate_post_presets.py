@@ -0,0 +1,107 @@
+import argparse
+import os
+import time
+
+import numpy as np
+
+from Datasets import get_image_and_mask
+from Detectors.Noiseprint.noiseprintEngine import NoiseprintEngine
+from Detectors.Noiseprint.noiseprint_blind import noiseprint_blind_post, genMappFloat, postPresets
+from Detectors.Noiseprint.postStats import PostStatsAggregator
+from Detectors.Noiseprint.utility.utility import prepare_image_noiseprint
+
+DATASETS_ROOT = os.path.abspath("Data/Datasets/")
+
+# images on which to calibrate the presets
+images = [
+    "canong3_canonxt_sub_13.tif",  # canong3
+    "splicing-70.png",
+    "DPP0122.TIF",  # Canon60D
+    "r1be2a3d5t.TIF",  # NikonD90
+]
+
+# time budgets [s] tested on top of the exact preset
+time_budgets = [1, 2, 5]
+
+
+def heatmaps_agreement(reference_map, map):
+    """
+    Measure how much two full resolution heatmaps agree
+    :param reference_map: heatmap computed with the exact preset
+    :param map: heatmap to compare
+    :return: pearson correlation, fraction of pixels on which the two maps above their median agree
+    """
+    reference_map = reference_map.flatten()
+    map = map.flatten()
+
+    correlation = np.corrcoef(reference_map, map)[0, 1]
+    agreement = np.mean((reference_map > np.median(reference_map)) == (map > np.median(map)))
+
+    return correlation, agreement
+
+
+def compute_heatmap(noiseprint, image, preset, time_budget=None, stats=None):
+    """
+    Compute the full resolution heatmap of a noiseprint using the given preset
+    :param noiseprint: noiseprint of the image
+    :param image: one channel image
+    :param preset: name of the preset to use
+    :param time_budget: time budget of the EM in seconds
+    :param stats: PostStatsAggregator collecting the statistics of the post-processing
+    :return: heatmap, elapsed time
+    """
+    start_time = time.time()
+    mapp, valid, range0, range1, imgsize, other = noiseprint_blind_post(noiseprint, image, preset=preset,
+                                                                        timeBudget=time_budget, callback=stats)
+    heatmap = genMappFloat(mapp, valid, range0, range1, imgsize)
+    return heatmap, time.time() - start_time
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-i', '--images', nargs='+', default=images, help='Names or paths of the images to use')
+    parser.add_argument('-q', '--quality', default=101, type=int, help='Quality factor of the noiseprint model')
+    parser.add_argument('-b', '--budgets', nargs='*', default=time_budgets, type=float,
+                        help='Time budgets [s] to test with the exact preset')
+    args = parser.parse_args()
+
+    engine = NoiseprintEngine()
+    engine.load_quality(args.quality)
+
+    # statistics of the post-processing of each configuration over all the images
+    stats = dict()
+
+    print("{:<32} {:<16} {:>10} {:>10} {:>12} {:>10}".format("image", "preset", "time [s]", "speedup",
+                                                            "correlation", "agreement"))
+
+    for image_name in args.images:
+        image, _ = get_image_and_mask(DATASETS_ROOT, image_name)
+        image = prepare_image_noiseprint(image)
+
+        noiseprint = engine.predict(image)
+
+        reference_map, reference_time = compute_heatmap(noiseprint, image, 'exact',
+                                                        stats=stats.setdefault('exact', PostStatsAggregator()))
+
+        configurations = [(preset, None) for preset in postPresets if preset != 'exact']
+        configurations += [('exact', budget) for budget in args.budgets]
+
+        print("{:<32} {:<16} {:>10.2f} {:>10.2f} {:>12.4f} {:>10.4f}".format(os.path.basename(image_name), 'exact',
+                                                                          reference_time, 1, 1, 1))
+
+        for preset, budget in configurations:
+            name = preset if budget is None else "{} ({:g}s)".format(preset, budget)
+
+            map, elapsed_time = compute_heatmap(noiseprint, image, preset, budget,
+                                                stats.setdefault(name, PostStatsAggregator()))
+
+            correlation, agreement = heatmaps_agreement(reference_map, map)
+
+            print("{:<32} {:<16} {:>10.2f} {:>10.2f} {:>12.4f} {:>10.4f}".format("", name, elapsed_time,
+                                                                              reference_time / elapsed_time,
+                                                                              correlation, agreement))
+
+    for name, aggregator in stats.items():
+        print()
+        print(name)
+        aggregator.print_summary()
@@ -0,0 +1,52 @@
+import argparse
+import os
+
+import matplotlib
+
+matplotlib.use('Agg')
+from matplotlib import pyplot as plt
+
+from Ulitities.io.metrics import read_metrics
+
+
+def plot_metric(rows, metric, path):
+    """
+    Plot a metric of an attack against the attack step
+    :param rows: rows of the metrics file
+    :param metric: name of the metric to plot
+    :param path: path of the image to save
+    :return:
+    """
+    rows = [row for row in rows if row.get(metric) is not None and "step" in row]
+
+    plt.close()
+    plt.plot([row["step"] for row in rows], [row[metric] for row in rows])
+
+    plt.ylabel(metric)
+    plt.xlabel("Attack iteration")
+
+    plt.savefig(path)
+    plt.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('metrics', help='Debug folder of an attack or path of its metrics file (.jsonl or .csv)')
+    parser.add_argument('-m', '--metric', nargs='+', default=["loss", "psnr"], help='Metrics to plot')
+    parser.add_argument('-o', '--output', default=None,
+                        help='Folder where to save the graphs, by default the folder of the metrics file')
+    args = parser.parse_args()
+
+    path = args.metrics
+    if os.path.isdir(path):
+        path = os.path.join(path, "metrics.jsonl")
+
+    output_folder = args.output if args.output else os.path.dirname(os.path.abspath(path))
+    os.makedirs(output_folder, exist_ok=True)
+
+    rows = read_metrics(path)
+    print("Read {} rows from {}".format(len(rows), path))
+
+    for metric in args.metric:
+        plot_metric(rows, metric, os.path.join(output_folder, metric))
+        print("Saved {}".format(os.path.join(output_folder, metric)))
@@ -0,0 +1,76 @@
+import argparse
+import os
+
+import matplotlib
+
+matplotlib.use('Agg')
+from matplotlib import pyplot as plt
+import numpy as np
+
+from Attacks.Noiseprint.Mimiking.NoiseprintMimickingAttack import NoiseprintMimickingAttack
+from Datasets import get_image_and_mask
+from Ulitities.io.folders import create_debug_folder
+from Ulitities.io.metrics import read_metrics
+
+DEBUG_ROOT = os.path.abspath("Data/Debug/")
+DATASETS_ROOT = os.path.abspath("Data/Datasets/")
+
+
+def run_attack(target_image, target_mask, source_image, source_mask, steps, alpha, tile_sampling, fraction):
+    """
+    Run a noiseprint mimicking attack with the given tile sampling mode
+    :param tile_sampling: None (all the tiles), "uniform" or "loss"
+    :param fraction: fraction of the tiles processed at each step
+    :return: loss of each step, time of each step [s]
+    """
+    attack = NoiseprintMimickingAttack(target_image, target_mask, source_image, source_mask, steps, alpha,
+                                       plot_interval=0, debug_root=DEBUG_ROOT, test=True)
+    attack.tile_sampling = tile_sampling
+    attack.tile_sampling_fraction = fraction
+    attack.checkpoint_interval = 0
+    attack.execute()
+
+    rows = read_metrics(os.path.join(attack.debug_folder, attack.metrics_file))
+    rows = [row for row in rows if row.get("loss") is not None]
+    return [row["loss"] for row in rows], [row["step_time"] for row in rows]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-i', '--image', required=True,
+                        help='Name or path of the image to attack, it has to be big enough to be processed by tiles')
+    parser.add_argument('-s', '--source', required=True, help='Name or path of the source image (same size)')
+    parser.add_argument('--steps', default=50, type=int, help='Number of attack steps to perform')
+    parser.add_argument('-a', '--alpha', default=5, type=float, help='Strength of the attack')
+    parser.add_argument('-f', '--fraction', default=0.25, type=float, help='Fraction of the tiles sampled per step')
+    args = parser.parse_args()
+
+    target_image, target_mask = get_image_and_mask(DATASETS_ROOT, args.image)
+    source_image, source_mask = get_image_and_mask(DATASETS_ROOT, args.source)
+
+    results = dict()
+    for mode in [None, "uniform", "loss"]:
+        results[mode] = run_attack(target_image, target_mask, source_image, source_mask, args.steps, args.alpha, mode,
+                                   args.fraction)
+
+    report_folder = create_debug_folder(DEBUG_ROOT)
+
+    # the first step of the sampled modes processes all the tiles, exclude it from the timings
+    baseline_losses, baseline_times = results[None]
+    print("{:<10} {:>18} {:>10} {:>12} {:>22}".format("tiles", "mean step [s]", "speedup", "final loss",
+                                                       "loss vs all tiles [%]"))
+    for mode, (losses, times) in results.items():
+        name = mode if mode else "all"
+        print("{:<10} {:>18.3f} {:>10.2f} {:>12.4f} {:>22.2f}".format(
+            name, np.mean(times[1:]), np.mean(baseline_times[1:]) / np.mean(times[1:]), losses[-1],
+            100 * (losses[-1] - baseline_losses[-1]) / baseline_losses[-1]))
+
+        plt.plot(range(1, len(losses) + 1), losses, label=name)
+
+    plt.ylabel("Loss")
+    plt.xlabel("Attack iteration")
+    plt.legend()
+    plt.savefig(os.path.join(report_folder, "loss"))
+    plt.close()
+
+    print("Loss curves saved to {}".format(os.path.join(report_folder, "loss")))
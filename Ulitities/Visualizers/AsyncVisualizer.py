@@ -0,0 +1,114 @@
+import importlib
+import multiprocessing
+import os
+import queue
+import traceback
+
+import numpy as np
+
+
+def _visualization_worker(visualizer_path: str, settings: dict, use_gpu: bool, tasks):
+    """
+    Body of the worker process: instantiate its own visualizer (and hence its own detector engine) and render the
+    queued visualizations in order until the None sentinel is received
+    :param visualizer_path: module and name of the visualizer class, e.g. Ulitities.Visualizers.X.X
+    :param settings: attributes to set on the visualizer before rendering
+    :param use_gpu: should the worker engine use the GPU?
+    :param tasks: queue of (image, prediction_pipeline kwargs) tuples
+    :return:
+    """
+
+    # the visualizer module is imported only now so that the GPU can be hidden before tensorflow is loaded
+    if not use_gpu:
+        os.environ["CUDA_VISIBLE_DEVICES"] = "-1"
+
+    from Ulitities.Image.Picture import Picture
+
+    module_name, class_name = visualizer_path.rsplit(".", 1)
+    visualizer = getattr(importlib.import_module(module_name), class_name)()
+
+    for name, value in settings.items():
+        setattr(visualizer, name, value)
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+
+        image, kwargs = task
+        if kwargs["original_picture"] is not None:
+            kwargs["original_picture"] = Picture(kwargs["original_picture"])
+
+        try:
+            visualizer.prediction_pipeline(Picture(image), **kwargs)
+        except Exception:
+            # a failed visualization must not stop the following ones
+            traceback.print_exc()
+
+
+class AsyncVisualizer:
+    """
+    Render the visualizations of a visualizer in a background process with its own detector engine, so that the caller
+    does not wait for them. At most max_pending visualizations wait in the queue, when it is full the oldest one is
+    dropped to make room for the new one.
+    """
+
+    def __init__(self, visualizer_class, settings: dict = None, max_pending: int = 4, use_gpu: bool = False):
+        """
+        :param visualizer_class: class of the visualizer to instantiate in the worker (e.g. NoiseprintVisualizer)
+        :param settings: attributes to set on the worker visualizer (e.g. {"warm_start": True})
+        :param max_pending: maximum number of visualizations waiting to be rendered
+        :param use_gpu: should the worker engine use the GPU? By default it runs on CPU to leave the GPU to the caller
+        """
+        assert (max_pending > 0)
+
+        # spawn a fresh interpreter, tensorflow does not support being forked once initialized
+        context = multiprocessing.get_context("spawn")
+
+        self._tasks = context.Queue(maxsize=max_pending)
+
+        visualizer_path = "{}.{}".format(visualizer_class.__module__, visualizer_class.__name__)
+        self._process = context.Process(target=_visualization_worker,
+                                        args=(visualizer_path, dict(settings or {}), use_gpu, self._tasks),
+                                        daemon=True)
+        self._process.start()
+
+        # number of visualizations submitted and of the ones dropped because the queue was full
+        self.submitted = 0
+        self.dropped = 0
+
+    def prediction_pipeline(self, image, path, original_picture=None, omask=None, note=""):
+        """
+        Queue a visualization, see the prediction_pipeline of the visualizer for the meaning of the parameters
+        """
+        assert (self._process is not None)
+
+        task = (np.array(image), dict(path=path, note=note,
+                                      original_picture=None if original_picture is None else np.array(original_picture),
+                                      omask=None if omask is None else np.array(omask)))
+
+        self.submitted += 1
+
+        while True:
+            try:
+                self._tasks.put_nowait(task)
+                return
+            except queue.Full:
+                # drop the oldest pending visualization
+                try:
+                    self._tasks.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def close(self):
+        """
+        Wait for the pending visualizations to be rendered and stop the worker
+        :return:
+        """
+        if self._process is None:
+            return
+
+        self._tasks.put(None)
+        self._process.join()
+        self._process = None
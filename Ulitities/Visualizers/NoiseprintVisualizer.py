@@ -23,6 +23,13 @@ class NoiseprintVisualizer(BaseVisualizer):
         self.qf = qf
         self.load_quality(qf)
 
+        # should the EM of the heatmap be warm started from the one of the previous prediction?
+        # usefull when consecutive images differ only by a few grey levels (e.g. attack steps)
+        self.warm_start = False
+
+        # parameters of the gaussian mixture fitted on the last predicted heatmap
+        self.em_params = None
+
     def load_quality(self,qf :int):
         assert (50 < qf < 102)
         self.qf = qf
@@ -57,7 +64,8 @@ class NoiseprintVisualizer(BaseVisualizer):
 
         noiseprint = self.get_noiseprint(image_one_channel)
 
-        heatmap = self._engine.detect(image_one_channel)
+        heatmap = self._engine.detect(image_one_channel, self.em_params if self.warm_start else None)
+        self.em_params = self._engine.last_post_params
 
         #this is the first computation, compute the best f1 threshold initially
 
@@ -0,0 +1,181 @@
+import os
+import pickle
+from collections import OrderedDict
+
+import numpy as np
+
+
+def size_of(value):
+    """
+    Estimate the number of bytes used by a cached value
+    :param value: numpy array, dictionary, list or tuple of them
+    :return: number of bytes
+    """
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, dict):
+        return sum(size_of(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(size_of(v) for v in value)
+    return 64
+
+
+def update_digest(digest, array: np.array):
+    """
+    Add the content of an array (with its shape and dtype) to a hashlib digest
+    :param digest: hashlib object to update
+    :param array: array to hash
+    :return:
+    """
+    array = np.ascontiguousarray(array)
+    digest.update(str((array.shape, array.dtype.str)).encode())
+    digest.update(array.data)
+
+
+class TwoTierCache:
+    """
+    Cache of values identified by string keys. Entries are kept in memory up to a byte budget, least recently used ones
+    are evicted first. If a folder is given, entries are also stored on disk (with their own byte budget, evicting the
+    least recently used files) and loaded back when they are not in memory anymore.
+    Subclasses define how the entries are copied and serialized by overriding the hooks of this class.
+    """
+
+    # extension of the files of the on-disk entries
+    extension = ".pkl"
+
+    def __init__(self, max_bytes: int = 256 * 2 ** 20, cache_dir: str = None, max_disk_bytes: int = 2 * 2 ** 30):
+        """
+        :param max_bytes: maximum number of bytes of the in-memory entries
+        :param cache_dir: folder of the on-disk entries (created when the first entry is stored), None to keep the
+            entries only in memory
+        :param max_disk_bytes: maximum number of bytes of the on-disk entries
+        """
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.max_disk_bytes = max_disk_bytes
+
+        self._entries = OrderedDict()
+        self._bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+
+    def get_entry(self, key: str):
+        """
+        Retrieve an entry of the cache, the caller must not modify it (see _copy)
+        :param key: key of the entry
+        :return: the stored entry or None if it is not in the cache
+        """
+        entry = self._entries.get(key)
+
+        if entry is not None:
+            self._entries.move_to_end(key)
+        else:
+            entry = self._load(key)
+            if entry is not None:
+                self._store(key, entry)
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return entry
+
+    def put_entry(self, key: str, entry):
+        """
+        Add an entry to the cache, the cache keeps the given object (see _copy)
+        :param key: key of the entry
+        :param entry: value to store
+        """
+        self._store(key, entry)
+        self._save(key, entry)
+
+    def clear(self):
+        """
+        Remove all the in-memory entries
+        """
+        self._entries.clear()
+        self._bytes = 0
+
+    def _size(self, entry) -> int:
+        """
+        :return: number of bytes used by an entry in memory
+        """
+        return size_of(entry)
+
+    def _read(self, file):
+        """
+        Deserialize an entry from a binary file
+        """
+        return pickle.load(file)
+
+    def _write(self, file, entry):
+        """
+        Serialize an entry into a binary file
+        """
+        pickle.dump(entry, file, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def _store(self, key, entry):
+        """
+        Add an entry to the in-memory tier, evicting the least recently used ones to respect the budget
+        """
+        size = self._size(entry)
+        if size > self.max_bytes:
+            return
+
+        if key in self._entries:
+            self._bytes -= self._size(self._entries.pop(key))
+
+        self._entries[key] = entry
+        self._bytes += size
+
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= self._size(evicted)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + self.extension)
+
+    def _load(self, key):
+        """
+        Load an entry from the on-disk tier
+        :return: the entry or None if it is not on disk
+        """
+        if self.cache_dir is None or not os.path.exists(self._path(key)):
+            return None
+
+        try:
+            with open(self._path(key), "rb") as file:
+                entry = self._read(file)
+        except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+            return None
+
+        # mark the entry as recently used
+        os.utime(self._path(key))
+        return entry
+
+    def _save(self, key, entry):
+        """
+        Write an entry to the on-disk tier, evicting the least recently used files to respect the budget
+        """
+        if self.cache_dir is None:
+            return
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        temporary_path = self._path(key) + ".tmp"
+        with open(temporary_path, "wb") as file:
+            self._write(file, entry)
+        os.replace(temporary_path, self._path(key))
+
+        files = [os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir)
+                 if name.endswith(self.extension)]
+        files = sorted(files, key=os.path.getmtime)
+        total_bytes = sum(os.path.getsize(path) for path in files)
+
+        for path in files:
+            if total_bytes <= self.max_disk_bytes:
+                break
+            total_bytes -= os.path.getsize(path)
+            os.remove(path)
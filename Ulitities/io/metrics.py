@@ -0,0 +1,105 @@
+import csv
+import json
+import os
+
+
+class MetricsStream:
+    """
+    Append-only stream of metrics rows (one per attack step) written to a JSONL or CSV file depending on the extension
+    of its path. Rows are buffered in memory and appended to the file every buffer_size rows, on flush and on close.
+    The columns of a CSV file are the keys of its first row followed by the extra columns, values of other keys are
+    dropped.
+    """
+
+    def __init__(self, path: str, buffer_size: int = 32, extra_columns: list = None):
+        """
+        :param path: path of the .jsonl or .csv file, rows are appended if it already exists
+        :param buffer_size: number of rows to keep in memory before appending them to the file
+        :param extra_columns: columns of a CSV file that may be missing from its first row (e.g. values written only
+            by the last row)
+        """
+        assert (buffer_size > 0)
+
+        self.path = path
+        self.buffer_size = buffer_size
+        self.extra_columns = list(extra_columns) if extra_columns else []
+
+        self.csv = os.path.splitext(path)[1].lower() == ".csv"
+
+        self._rows = []
+
+        # columns of the CSV file, read from its header if the file already exists
+        self._columns = None
+        if self.csv and os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path, newline="") as file:
+                self._columns = next(csv.reader(file))
+
+    def write(self, **values):
+        """
+        Add a row to the stream
+        :param values: values of the row, numbers or strings
+        :return:
+        """
+        self._rows.append(values)
+
+        if len(self._rows) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Append the buffered rows to the file
+        :return:
+        """
+        if not self._rows:
+            return
+
+        with open(self.path, "a", newline="") as file:
+            if self.csv:
+                if self._columns is None:
+                    self._columns = list(self._rows[0].keys())
+                    self._columns += [column for column in self.extra_columns if column not in self._columns]
+                    csv.writer(file).writerow(self._columns)
+
+                writer = csv.DictWriter(file, self._columns, extrasaction="ignore")
+                writer.writerows(self._rows)
+            else:
+                for row in self._rows:
+                    file.write(json.dumps(row) + "\n")
+
+        self._rows = []
+
+    def close(self):
+        """
+        Append the buffered rows to the file, the stream can still be used afterwards
+        :return:
+        """
+        self.flush()
+
+
+def read_metrics(path: str) -> list:
+    """
+    Read the rows of a metrics file written by MetricsStream
+    :param path: path of the .jsonl or .csv file
+    :return: list of dictionaries, one for each row (values of CSV files are converted to float when possible and
+        empty ones to None)
+    """
+    rows = []
+
+    with open(path, newline="") as file:
+        if os.path.splitext(path)[1].lower() == ".csv":
+            for row in csv.DictReader(file):
+                for key, value in row.items():
+                    if value == "":
+                        row[key] = None
+                        continue
+                    try:
+                        row[key] = float(value)
+                    except (TypeError, ValueError):
+                        pass
+                rows.append(row)
+        else:
+            for line in file:
+                if line.strip():
+                    rows.append(json.loads(line))
+
+    return rows
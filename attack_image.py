@@ -2,12 +2,19 @@ import argparse
 import os
 
 from Attacks import families_of_attacks
+from Attacks.BaseIterativeAttack import BaseIterativeAttack
+from Attacks.Optimizers import supported_optimizers
+from Attacks.StoppingCriteria import LossPlateau, PsnrFloor, WallClockBudget, DetectorScoreReached
+from Attacks.TargetRepresentationCache import TargetRepresentationCache
 
 DEBUG_ROOT = os.path.abspath("Data/Debug/")
 DATASETS_ROOT = os.path.abspath("Data/Datasets/")
+TARGET_CACHE_ROOT = os.path.abspath("Data/Cache/TargetRepresentations/")
 
 
-def attack_pipeline(category_number, attack_number):
+def attack_pipeline(category_number, attack_number, resume=None, checkpoint_interval=None,
+                    async_visualization=False, stopping_criteria=None, optimizer=None, mask_restricted=False,
+                    tile_sampling=None, target_cache=False):
 
     if category_number is None:
 
@@ -29,18 +36,60 @@ def attack_pipeline(category_number, attack_number):
         attack_number = int(input("Enter attack number:"))
 
     if attack_number == len(supported_attacks.items()):
-        attacks = supported_attacks.values()
+        attacks = list(supported_attacks.values())
     else:
         attacks = list(supported_attacks.values())[attack_number]
 
     if not isinstance(attacks, list):
         attacks = [attacks]
 
+    # the detector score criterion needs a score function, either its own or the one of the attack: refuse to start
+    # attacks that would fail when the criterion is first checked
+    for criterion in stopping_criteria or []:
+        if isinstance(criterion, DetectorScoreReached) and criterion.score_function is None:
+            for current_attack in attacks:
+                if getattr(current_attack, "detector_score", None) in (None, BaseIterativeAttack.detector_score):
+                    raise ValueError("{} does not define a detector score, --target_score can not be used".format(
+                        current_attack.__name__))
+
+    # target representations shared by the attacks of the run and by the previous runs
+    target_representation_cache = TargetRepresentationCache(TARGET_CACHE_ROOT) if target_cache else None
+
     # execute each attack sequentially
     for current_attack in attacks:
         kwarg = current_attack.read_arguments(DATASETS_ROOT)
 
         attack = current_attack(**kwarg)
+
+        if checkpoint_interval is not None:
+            attack.checkpoint_interval = checkpoint_interval
+
+        if async_visualization:
+            attack.async_visualization = True
+
+        if stopping_criteria:
+            attack.stopping_criteria = list(stopping_criteria)
+
+        # noiseprint attacks can restrict the gradient to the surroundings of the forgery
+        if mask_restricted:
+            attack.mask_restricted = True
+
+        # noiseprint attacks on large images can process a sample of the tiles at each step
+        if tile_sampling is not None:
+            attack.tile_sampling = tile_sampling
+
+        # white box attacks load their target representation from the cache if it has already been computed
+        if target_representation_cache is not None:
+            attack.target_representation_cache = target_representation_cache
+
+        # the default optimizer of white box attacks is the momentum one, configured by the attack itself
+        if optimizer is not None and optimizer != "momentum":
+            attack.optimizer = supported_optimizers[optimizer]()
+
+        # continue the trajectory of a previous run of the attack from its last checkpoint
+        if resume:
+            attack.resume(resume)
+
         attack.execute()
 
 
@@ -48,6 +97,41 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("-t", '--type', default=None, type=int,help='Id of the category of the attack to perform')
     parser.add_argument("-m", '--method', default=None, type=int,help='Id of the attack to perform')
+    parser.add_argument('--resume', default=None, type=str,
+                        help='Debug folder (or checkpoint file) of a previous run of the attack to continue')
+    parser.add_argument('--checkpoint_interval', default=None, type=int,
+                        help='How often (# steps) should the state of iterative attacks be saved? 0 -> never')
+    parser.add_argument('--async_visualization', default=False, action='store_true',
+                        help='Render the step-visualizations in a background process')
+    parser.add_argument('--plateau_window', default=None, type=int,
+                        help='Stop when the loss improves by less than --plateau_improvement over this many steps')
+    parser.add_argument('--plateau_improvement', default=0.01, type=float,
+                        help='Minimum relative improvement of the loss over --plateau_window steps')
+    parser.add_argument('--min_psnr', default=None, type=float, help='Stop when the PSNR drops below this value')
+    parser.add_argument('--max_time', default=None, type=float, help='Stop after this many seconds')
+    parser.add_argument('--target_score', default=None, type=float,
+                        help='Stop when the detector score of the attacked image drops to this value')
+    parser.add_argument('--optimizer', default=None, choices=list(supported_optimizers.keys()),
+                        help='Update rule of white box attacks')
+    parser.add_argument('--mask_restricted', default=False, action='store_true',
+                        help='Compute the gradient of noiseprint attacks only near the forgery')
+    parser.add_argument('--tile_sampling', default=None, choices=["uniform", "loss"],
+                        help='Compute the gradient of noiseprint attacks on a sample of the tiles of large images')
+    parser.add_argument('--target_cache', default=False, action='store_true',
+                        help='Load the target representation of white box attacks from the cache when it has already '
+                             'been computed (stored in {})'.format(TARGET_CACHE_ROOT))
     args = parser.parse_known_args()[0]
 
-    attack_pipeline(args.type,args.method)
+    criteria = []
+    if args.plateau_window:
+        criteria.append(LossPlateau(args.plateau_window, args.plateau_improvement))
+    if args.min_psnr is not None:
+        criteria.append(PsnrFloor(args.min_psnr))
+    if args.max_time is not None:
+        criteria.append(WallClockBudget(args.max_time))
+    if args.target_score is not None:
+        criteria.append(DetectorScoreReached(args.target_score))
+
+    attack_pipeline(args.type,args.method, args.resume, args.checkpoint_interval, args.async_visualization, criteria,
+                    args.optimizer, args.mask_restricted,
+                    args.tile_sampling, args.target_cache)
@@ -4,6 +4,7 @@ from os.path import basename
 import numpy as np
 from cv2 import PSNR
 from Attacks.Noiseprint.Mimiking.NoiseprintMimickingAttack import NoiseprintMimickingAttack
+from Attacks.Noiseprint.NoiseprintBatchAttackDriver import NoiseprintBatchAttackDriver
 from Datasets import get_image_and_mask
 from Ulitities.Image.Picture import Picture
 from Ulitities.Visualizers.NoiseprintVisualizer import NoiseprintVisualizer
@@ -48,13 +49,17 @@ if __name__ == "__main__":
 
     noise = np.zeros(source_image_mask.shape)
 
+    attacks = []
     for image_path in images_for_geneating_noise:
 
         image, mask = get_image_and_mask(DATASETS_ROOT, image_path)
 
-        attack = NoiseprintMimickingAttack(image, mask, source_image, source_image_mask, 50, 5,plot_interval=0,debug_root=mimicking_debug_folder)
+        attacks.append(NoiseprintMimickingAttack(image, mask, source_image, source_image_mask, 50, 5,plot_interval=0,debug_root=mimicking_debug_folder))
 
-        attack.execute()
+    # advance all the attacks in lockstep, batching their gradients
+    NoiseprintBatchAttackDriver(attacks).execute()
+
+    for image_path, attack in zip(images_for_geneating_noise, attacks):
 
         noise += attack.noise / len(image_path)
 
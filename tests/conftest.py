@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+
+@pytest.fixture
+def noiseprint_net(monkeypatch):
+    """
+    Replace the noiseprint network with a small one with random weights, shared by all the engines, so that noiseprint
+    attacks can run without the weights of the model
+    :return: the shared keras model
+    """
+    tf = pytest.importorskip("tensorflow")
+    from Detectors.Noiseprint import noiseprintEngine
+
+    tf.random.set_seed(0)
+    net = noiseprintEngine._full_conv_net(num_levels=4)
+
+    def load_quality(self, quality):
+        self._loaded_quality = quality
+
+    monkeypatch.setattr(noiseprintEngine, "_full_conv_net", lambda *args, **kwargs: net)
+    monkeypatch.setattr(noiseprintEngine.NoiseprintEngine, "load_quality", load_quality)
+    monkeypatch.setattr(noiseprintEngine.NoiseprintEngine, "setup_on_init", False)
+
+    return net
+
+
+@pytest.fixture
+def make_noiseprint_attack(noiseprint_net, tmp_path):
+    """
+    :return: function(steps, seed=0, shape=(64, 80), **attributes) creating a noiseprint mimicking attack on random
+        images, without visualizations, with its debug folder in a temporary folder and the given attributes set
+    """
+    from Attacks.Noiseprint.Mimiking.NoiseprintMimickingAttack import NoiseprintMimickingAttack
+    from Ulitities.Image.Picture import Picture
+
+    def make(steps, seed=0, shape=(64, 80), **attributes):
+        randomState = np.random.RandomState(seed)
+        target_image = Picture(randomState.randint(0, 255, shape + (3,)), path="target.png")
+        source_image = Picture(randomState.randint(0, 255, shape + (3,)), path="source.png")
+        mask = np.zeros(shape)
+        mask[shape[0] // 4: shape[0] // 2, shape[1] // 4: shape[1] // 2] = 1
+
+        attack = NoiseprintMimickingAttack(target_image, Picture(mask), source_image, Picture(np.ones(shape)), steps,
+                                           5, quality_factor=101, plot_interval=0, debug_root=str(tmp_path),
+                                           test=True)
+
+        # the final visualizations run the post-processing of the detector, which is not under test
+        attack.detector.prediction_pipeline = lambda *args, **kwargs: None
+        attack.detector.plot_graph = lambda *args, **kwargs: None
+
+        for name, value in attributes.items():
+            setattr(attack, name, value)
+        return attack
+
+    return make
+
+
+@pytest.fixture
+def resume_noiseprint_attack(make_noiseprint_attack):
+    """
+    :return: function(steps, interrupt_after, **attributes) executing an attack that stops after interrupt_after
+        steps, then resuming a new attack from its checkpoint and executing it until the end, the two attacks are
+        returned
+    """
+    from Attacks.StoppingCriteria import StoppingCriterion
+
+    class StopAfter(StoppingCriterion):
+
+        def __init__(self, steps):
+            self.steps = steps
+
+        def should_stop(self, attack, attacked_image):
+            return "interrupted" if attack.step_counter + 1 == self.steps else None
+
+    def resume(steps, interrupt_after, **attributes):
+        interrupted_attack = make_noiseprint_attack(steps, stopping_criteria=[StopAfter(interrupt_after)],
+                                                    **attributes)
+        interrupted_attack.execute()
+
+        resumed_attack = make_noiseprint_attack(steps, **attributes)
+        resumed_attack.resume(interrupted_attack.debug_folder)
+        resumed_attack.execute()
+        return interrupted_attack, resumed_attack
+
+    return resume
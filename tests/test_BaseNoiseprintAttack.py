@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("cv2")
+pytest.importorskip("tensorflow")
+
+
+def test_on_device_loop_matches_the_host_loop(make_noiseprint_attack):
+    host_attack = make_noiseprint_attack(6)
+    host_attack.execute()
+
+    device_attack = make_noiseprint_attack(6, on_device=True)
+    assert device_attack.runs_on_device
+    device_attack.execute()
+
+    # the device loop re-implements the momentum update, the decay of alpha and the PSNR in tensorflow: besides
+    # float32 rounding, a few pixels may differ more when their gradient changes sign (e.g. at the clipping bounds)
+    assert device_attack.step_counter == host_attack.step_counter
+    for device_value, host_value in [(device_attack.noise, host_attack.noise),
+                                     (device_attack.moving_avg_gradient, host_attack.optimizer.velocity)]:
+        difference = np.abs(device_value - host_value)
+        assert np.max(difference) < 0.05 * np.max(np.abs(host_value))
+        assert np.mean(difference) < 1e-3 * np.mean(np.abs(host_value))
+    np.testing.assert_allclose(np.array(device_attack.loss_steps, dtype=float),
+                               np.array(host_attack.loss_steps, dtype=float), rtol=1e-4)
+    np.testing.assert_allclose(device_attack.psnr_steps, host_attack.psnr_steps, rtol=1e-3)
+
+
+@pytest.mark.parametrize("tile_sampling", ["uniform", "loss"])
+def test_resumed_tile_sampling_matches_the_uninterrupted_one(monkeypatch, make_noiseprint_attack,
+                                                             resume_noiseprint_attack, tile_sampling):
+    from Detectors.Noiseprint.noiseprintEngine import NoiseprintEngine
+
+    # process the 64x80 images by 2x3 tiles
+    monkeypatch.setattr(NoiseprintEngine, "large_limit", 1024)
+    monkeypatch.setattr(NoiseprintEngine, "slide", 32)
+    monkeypatch.setattr(NoiseprintEngine, "overlap", 8)
+
+    attack = make_noiseprint_attack(6, tile_sampling=tile_sampling)
+    attack.execute()
+    assert len(attack._tile_sampling_state["tiles"]) == 6
+
+    _, resumed_attack = resume_noiseprint_attack(6, 3, tile_sampling=tile_sampling)
+
+    state, resumed_state = attack._tile_sampling_state, resumed_attack._tile_sampling_state
+    assert resumed_state["tiles"] == state["tiles"]
+    for resumed_velocity, velocity in zip(resumed_state["velocities"], state["velocities"]):
+        np.testing.assert_array_equal(resumed_velocity, velocity)
+    np.testing.assert_array_equal(resumed_state["losses"], state["losses"])
+
+    np.testing.assert_array_equal(resumed_attack.noise, attack.noise)
+    np.testing.assert_array_equal(resumed_attack.optimizer.velocity, attack.optimizer.velocity)
+    # the history of the loss is saved in single precision
+    np.testing.assert_array_equal(np.array(resumed_attack.loss_steps, dtype=np.float32),
+                                  np.array(attack.loss_steps, dtype=np.float32))
@@ -0,0 +1,31 @@
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip("cv2")
+pytest.importorskip("tensorflow")
+
+
+def test_resumed_attack_matches_the_uninterrupted_one(make_noiseprint_attack, resume_noiseprint_attack):
+    attack = make_noiseprint_attack(6)
+    attack.execute()
+
+    interrupted_attack, resumed_attack = resume_noiseprint_attack(6, 3)
+    assert interrupted_attack.step_counter == 2
+    assert interrupted_attack.stop_reason == "interrupted"
+
+    # the checkpoint references the target representation saved once next to it
+    with np.load(os.path.join(interrupted_attack.debug_folder, interrupted_attack.checkpoint_file)) as checkpoint:
+        target_representation_file = str(checkpoint["target_representation_file"])
+    assert target_representation_file == interrupted_attack.target_representation_file
+    assert os.path.exists(os.path.join(interrupted_attack.debug_folder, target_representation_file))
+    np.testing.assert_array_equal(resumed_attack.target_representation, attack.target_representation)
+
+    assert resumed_attack.step_counter == attack.step_counter
+    np.testing.assert_array_equal(resumed_attack.noise, attack.noise)
+    np.testing.assert_array_equal(resumed_attack.optimizer.velocity, attack.optimizer.velocity)
+    np.testing.assert_array_equal(np.array(resumed_attack.loss_steps, dtype=np.float32),
+                                  np.array(attack.loss_steps, dtype=np.float32))
+    np.testing.assert_array_equal(np.array(resumed_attack.psnr_steps, dtype=np.float32),
+                                  np.array(attack.psnr_steps, dtype=np.float32))
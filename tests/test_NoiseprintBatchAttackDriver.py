@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("cv2")
+pytest.importorskip("tensorflow")
+
+from Attacks.Noiseprint.NoiseprintBatchAttackDriver import NoiseprintBatchAttackDriver
+
+
+def test_driver_matches_the_single_runs(make_noiseprint_attack):
+    single_attacks = [make_noiseprint_attack(4, seed) for seed in range(3)]
+    single_images = [attack.execute() for attack in single_attacks]
+
+    attacks = [make_noiseprint_attack(4, seed) for seed in range(3)]
+    driver = NoiseprintBatchAttackDriver(attacks, max_batch_size=2)
+
+    # the first two attacks share a batch, the third one is processed alone
+    assert driver._buckets(range(3)) == ([[0, 1], [2]], [])
+
+    images = driver.execute()
+
+    for single_attack, single_image, attack, image in zip(single_attacks, single_images, attacks, images):
+        assert attack.step_counter == single_attack.step_counter
+        np.testing.assert_array_equal(attack.noise, single_attack.noise)
+        np.testing.assert_array_equal(attack.optimizer.velocity, single_attack.optimizer.velocity)
+        np.testing.assert_array_equal(np.asarray(image), np.asarray(single_image))
+        assert [float(loss) for loss in attack.loss_steps] == [float(loss) for loss in single_attack.loss_steps]
+        assert attack.psnr_steps == single_attack.psnr_steps
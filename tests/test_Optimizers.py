@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("cv2")
+pytest.importorskip("tensorflow")
+
+from Attacks.Optimizers import supported_optimizers, normalize_gradient, Momentum
+
+
+def reference_momentum(gradients, alphas, momentum):
+    """
+    Update rule the white box attacks used before the optimizers were pluggable
+    :return: list of the (noise, lookahead) pairs after each step
+    """
+    moving_avg_gradient = 0
+    noise = 0
+    results = []
+    for step, (gradient, alpha) in enumerate(zip(gradients, alphas)):
+        gradient = normalize_gradient(np.array(gradient), 0) * alpha
+        moving_avg_gradient = moving_avg_gradient * momentum + (1 - momentum) * gradient
+        noise = noise + moving_avg_gradient / (1 - momentum ** (1 + step))
+        results.append((noise, moving_avg_gradient))
+    return results
+
+
+@pytest.mark.parametrize("momentum", [0.5, 0.9])
+def test_momentum_matches_the_previous_update_rule(momentum):
+    randomState = np.random.RandomState(0)
+    gradients = [randomState.randn(40, 30) * scale for scale in (1, 1e-3, 50, 2, 0.1)]
+    gradients.insert(2, np.zeros((40, 30)))
+    alphas = [5, 4.5, 4, 3.5, 3, 2.5]
+
+    optimizer = Momentum(momentum)
+    assert optimizer.lookahead() == 0
+
+    noise = np.zeros((40, 30))
+    for step, ((expected_noise, expected_velocity), gradient, alpha) in enumerate(
+            zip(reference_momentum(gradients, alphas, momentum), gradients, alphas)):
+        noise += optimizer.step(gradient.copy(), alpha, step)
+
+        assert np.allclose(noise, expected_noise, rtol=1e-12, atol=1e-12)
+        assert np.allclose(optimizer.lookahead(), expected_velocity, rtol=1e-12, atol=1e-12)
+
+
+def test_momentum_without_nesterov_does_not_look_ahead():
+    optimizer = Momentum(0.5, nesterov=False)
+    optimizer.step(np.ones((4, 4)), 1, 0)
+    assert optimizer.lookahead() == 0
+
+
+def test_normalize_gradient():
+    gradient = np.random.RandomState(0).randn(60, 50)
+    gradient[30, 25] = -10
+
+    normalized = normalize_gradient(gradient.copy(), 17)
+    assert normalized[30, 25] == -1
+    assert np.all(normalized[:17] == 0) and np.all(normalized[-17:] == 0)
+    assert np.all(normalized[:, :17] == 0) and np.all(normalized[:, -17:] == 0)
+    assert np.allclose(normalized[17:-17, 17:-17], gradient[17:-17, 17:-17] / 10)
+
+    assert np.all(normalize_gradient(np.zeros((40, 40))) == 0)
+
+
+@pytest.mark.parametrize("name", sorted(supported_optimizers))
+def test_restored_state_keeps_the_checkpoint_dtype(name):
+    randomState = np.random.RandomState(0)
+    gradients = [randomState.randn(40, 30).astype(np.float32) for _ in range(4)]
+
+    optimizer = supported_optimizers[name]()
+    for step, gradient in enumerate(gradients[:2]):
+        optimizer.step(gradient, 0.5, step)
+
+    # checkpoints store the state as float32
+    state = {key: np.array(value, dtype=np.float32) for key, value in optimizer.get_state().items()}
+
+    restored = supported_optimizers[name]()
+    restored.set_state(state)
+    for key, value in restored.get_state().items():
+        assert value.dtype == np.float32
+        assert value is not state[key]
+
+    for step, gradient in enumerate(gradients[2:], start=2):
+        expected = np.array(optimizer.step(gradient, 0.5, step))
+        update = restored.step(gradient, 0.5, step)
+        assert update.dtype == np.float32
+        assert np.array_equal(update, expected)
+
+    for value in restored.get_state().values():
+        assert value.dtype == np.float32
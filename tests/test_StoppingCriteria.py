@@ -0,0 +1,132 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("cv2")
+pytest.importorskip("tensorflow")
+
+from Attacks.BaseIterativeAttack import BaseIterativeAttack
+from Attacks.StoppingCriteria import LossPlateau, PsnrFloor, WallClockBudget, DetectorScoreReached
+
+
+def fake_attack(**kwargs):
+    logs = []
+    attack = SimpleNamespace(loss_steps=[9999], psnr_steps=[999], step_counter=0, loop_start_time=datetime.now(),
+                             write_to_logs=lambda message, force_print=True: logs.append(message), logs=logs)
+    attack.__dict__.update(kwargs)
+    return attack
+
+
+def test_loss_plateau():
+    criterion = LossPlateau(window=3, min_improvement=0.1)
+
+    # the first element of loss_steps is a placeholder and it is ignored
+    assert criterion.should_stop(fake_attack(loss_steps=[0, 10, 9, 8]), None) is None
+    assert criterion.should_stop(fake_attack(loss_steps=[0, 10, 9, 8, 5]), None) is None
+    assert criterion.should_stop(fake_attack(loss_steps=[0, 10, 9.5, 9.7, 9.2]), None) is not None
+
+    # the best loss of the window is compared with the best loss before it
+    assert criterion.should_stop(fake_attack(loss_steps=[0, 10, 5, 20, 20, 4.9]), None) is not None
+    assert criterion.should_stop(fake_attack(loss_steps=[0, 10, 5, 20, 20, 4]), None) is None
+
+
+def test_psnr_floor():
+    criterion = PsnrFloor(35)
+
+    assert criterion.should_stop(fake_attack(psnr_steps=[999]), None) is None
+    assert criterion.should_stop(fake_attack(psnr_steps=[999, 40, 36]), None) is None
+    assert criterion.should_stop(fake_attack(psnr_steps=[999, 40, 34.5]), None) is not None
+
+
+def test_wall_clock_budget():
+    criterion = WallClockBudget(60)
+
+    assert criterion.should_stop(fake_attack(loop_start_time=datetime.now()), None) is None
+    assert criterion.should_stop(fake_attack(loop_start_time=datetime.now() - timedelta(seconds=61)), None) is not None
+
+
+def test_detector_score_is_computed_every_interval_steps():
+    calls = []
+
+    def score_function(attack, attacked_image):
+        calls.append(attack.step_counter)
+        return 1 - attack.step_counter / 10
+
+    criterion = DetectorScoreReached(0.35, interval=3, score_function=score_function)
+
+    reasons = [criterion.should_stop(fake_attack(step_counter=step), None) for step in range(9)]
+
+    assert calls == [2, 5, 8]
+    assert reasons[:8] == [None] * 8
+    assert reasons[8] is not None
+    assert criterion.last_score == pytest.approx(0.2)
+
+
+def test_detector_score_higher_is_better():
+    criterion = DetectorScoreReached(0.5, interval=1, score_function=lambda attack, image: 0.6,
+                                     lower_is_better=False)
+    assert criterion.should_stop(fake_attack(), None) is not None
+
+    criterion = DetectorScoreReached(0.5, interval=1, score_function=lambda attack, image: 0.6)
+    assert criterion.should_stop(fake_attack(), None) is None
+
+
+def test_detector_score_defaults_to_the_score_of_the_attack():
+    criterion = DetectorScoreReached(0.5, interval=1)
+    attack = fake_attack(detector_score=lambda attacked_image: 0.25)
+
+    assert criterion.should_stop(attack, None) is not None
+    assert criterion.last_score == 0.25
+
+
+def test_attack_pipeline_rejects_a_target_score_the_attack_can_not_compute(monkeypatch):
+    import attack_image
+
+    class ScoredAttack(BaseIterativeAttack):
+        def detector_score(self, attacked_image):
+            return 0
+
+    class UnscoredAttack(BaseIterativeAttack):
+        pass
+
+    def read_arguments(dataset_root):
+        raise AssertionError("the attack should not start")
+
+    for attack in (ScoredAttack, UnscoredAttack):
+        monkeypatch.setattr(attack, "read_arguments", staticmethod(read_arguments))
+
+    monkeypatch.setattr(attack_image, "families_of_attacks", {"Family": {"scored": ScoredAttack,
+                                                                         "unscored": UnscoredAttack}})
+
+    with pytest.raises(ValueError, match="UnscoredAttack"):
+        attack_image.attack_pipeline(0, 1, stopping_criteria=[DetectorScoreReached(0.5)])
+
+    # all the attacks of the family in sequence
+    with pytest.raises(ValueError, match="UnscoredAttack"):
+        attack_image.attack_pipeline(0, 2, stopping_criteria=[DetectorScoreReached(0.5)])
+
+    # a custom score function does not need the score of the attack
+    with pytest.raises(AssertionError):
+        attack_image.attack_pipeline(0, 1, stopping_criteria=[DetectorScoreReached(0.5, score_function=min)])
+
+    with pytest.raises(AssertionError):
+        attack_image.attack_pipeline(0, 0, stopping_criteria=[DetectorScoreReached(0.5)])
+
+
+def test_wall_clock_budget_does_not_count_the_pre_attack_operations(make_noiseprint_attack):
+    attack = make_noiseprint_attack(2)
+
+    target_representation_times = []
+    compute_target_representation = attack._compute_target_representation
+
+    def timed_compute_target_representation(*args, **kwargs):
+        target_representation = compute_target_representation(*args, **kwargs)
+        target_representation_times.append(datetime.now())
+        return target_representation
+
+    attack._compute_target_representation = timed_compute_target_representation
+    attack.execute()
+
+    assert len(target_representation_times) == 1
+    assert attack.start_time <= target_representation_times[0] <= attack.loop_start_time
@@ -0,0 +1,55 @@
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip("cv2")
+pytest.importorskip("tensorflow")
+
+from Attacks.BaseWhiteBoxAttack import BaseWhiteBoxAttack
+from Attacks.TargetRepresentationCache import TargetRepresentationCache, files_signature
+
+
+def test_make_key_depends_on_content_and_parameters():
+    image, mask = np.random.RandomState(0).rand(2, 30, 40)
+
+    key = TargetRepresentationCache.make_key([image, mask], attack="A", quality=101)
+
+    assert key == TargetRepresentationCache.make_key([image.copy(), mask.copy()], quality=101, attack="A")
+    assert key != TargetRepresentationCache.make_key([image, mask], attack="B", quality=101)
+    assert key != TargetRepresentationCache.make_key([image, mask], attack="A", quality=90)
+    assert key != TargetRepresentationCache.make_key([mask, image], attack="A", quality=101)
+    assert key != TargetRepresentationCache.make_key([image, mask], attack="A", quality=np.array(101))
+
+
+def test_entries_are_stored_as_npy_files(tmp_path):
+    value = np.random.RandomState(0).rand(20, 30).astype(np.float32)
+
+    cache = TargetRepresentationCache(str(tmp_path))
+    cache.put("a", value)
+
+    cached = cache.get("a")
+    cached[:] = 0
+    np.testing.assert_array_equal(cache.get("a"), value)
+
+    cached = TargetRepresentationCache(str(tmp_path)).get("a")
+    assert cached.dtype == np.float32
+    np.testing.assert_array_equal(cached, value)
+    np.testing.assert_array_equal(np.load(os.path.join(str(tmp_path), "a.npy")), value)
+
+
+def test_files_signature_changes_when_a_file_is_replaced(tmp_path):
+    folder = tmp_path / "weights"
+    folder.mkdir()
+    (folder / "model.bin").write_bytes(b"1234")
+
+    signature = files_signature(str(folder))
+    assert signature == files_signature(str(folder / "model.bin"))
+
+    (folder / "model.bin").write_bytes(b"12345")
+    assert files_signature(str(folder)) != signature
+    assert files_signature(str(tmp_path / "missing")) == ""
+
+
+def test_attacks_do_not_cache_by_default():
+    assert BaseWhiteBoxAttack.target_representation_cache is None
@@ -0,0 +1,77 @@
+import os
+
+import numpy as np
+
+from Ulitities.io.cache import TwoTierCache, size_of
+
+
+def test_size_of_nested_values():
+    value = (np.zeros(10), {'a': np.zeros((2, 3), np.float32), 'b': 1.0}, [np.zeros(4, bool)])
+    assert size_of(value) == 80 + 24 + 64 + 4
+
+
+def test_entries_are_kept_in_memory_up_to_the_budget():
+    cache = TwoTierCache(max_bytes=200)
+    cache.put_entry("a", np.zeros(10))
+    cache.put_entry("b", np.zeros(10))
+    cache.get_entry("a")
+    cache.put_entry("c", np.zeros(10))
+
+    assert cache.get_entry("b") is None
+    assert cache.get_entry("a") is not None and cache.get_entry("c") is not None
+
+    # entries larger than the budget are not kept
+    cache.put_entry("d", np.zeros(100))
+    assert cache.get_entry("d") is None
+    assert cache.get_entry("a") is not None
+
+    cache.clear()
+    assert cache.get_entry("a") is None
+
+
+def test_disk_folder_is_created_with_the_first_entry(tmp_path):
+    folder = str(tmp_path / "cache")
+    cache = TwoTierCache(cache_dir=folder)
+    assert not os.path.exists(folder)
+
+    cache.put_entry("a", {'value': np.arange(5)})
+    cache.clear()
+
+    np.testing.assert_array_equal(cache.get_entry("a")['value'], np.arange(5))
+    assert os.listdir(folder) == ["a.pkl"]
+
+
+def test_unreadable_files_are_misses(tmp_path):
+    cache = TwoTierCache(cache_dir=str(tmp_path))
+    with open(os.path.join(str(tmp_path), "a.pkl"), "wb") as file:
+        file.write(b"not a pickle")
+
+    assert cache.get_entry("a") is None
+    assert (cache.hits, cache.misses) == (0, 1)
+
+
+class TextCache(TwoTierCache):
+    extension = ".txt"
+
+    def _size(self, entry):
+        return len(entry)
+
+    def _read(self, file):
+        return file.read().decode()
+
+    def _write(self, file, entry):
+        file.write(entry.encode())
+
+
+def test_subclasses_define_the_serialization(tmp_path):
+    cache = TextCache(max_bytes=5, cache_dir=str(tmp_path), max_disk_bytes=8)
+    cache.put_entry("a", "abcd")
+    os.utime(os.path.join(str(tmp_path), "a.txt"), (0, 0))
+    cache.put_entry("b", "efgh")
+
+    # "a" has been evicted from memory by the size of "b" but it is still on disk
+    assert cache._entries.keys() == {"b"}
+    assert cache.get_entry("a") == "abcd"
+
+    cache.put_entry("c", "ijkl")
+    assert sorted(os.listdir(tmp_path)) == ["a.txt", "c.txt"]
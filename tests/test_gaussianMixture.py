@@ -0,0 +1,82 @@
+import numpy as np
+
+from Detectors.Noiseprint.post_em import EMgu_img
+from Detectors.Noiseprint.utility.gaussianMixture import gm
+
+
+def random_features(dtype, N=2000, dim=8, seed=0):
+    randomState = np.random.RandomState(seed)
+    X = randomState.randn(N, dim) @ randomState.randn(dim, dim)
+    X[:100] += 4
+    return X.astype(dtype)
+
+
+def reference_mahal(X, mu, sigma):
+    # Mahalanobis distances computed with an explicit inverse in float64
+    Xmu = np.asarray(X, dtype=np.float64) - np.asarray(mu, dtype=np.float64)
+    return np.sum(Xmu @ np.linalg.inv(np.asarray(sigma, dtype=np.float64)) * Xmu, axis=1)
+
+
+def fit(X, maxIter=30):
+    gm_data = gm(X.shape[1], [0, ], [2, ], outliersProb=0.01, outliersNlogl=42, dtype=X.dtype)
+    gm_data.setRandomParams(X, regularizer=-1.0, randomState=np.random.RandomState(0))
+    avrLogl, _, _ = gm_data.EM(X, maxIter=maxIter, regularizer=-1.0)
+    return gm_data, avrLogl
+
+
+def test_getNlogl_matches_reference():
+    X = random_features(np.float64)
+    gm_data, _ = fit(X)
+
+    nlogl, mahal = gm_data.getNlogl(X)
+
+    reference = reference_mahal(X, gm_data.mu[0], gm_data.listSigma[0])
+    np.testing.assert_allclose(mahal[:, 0], reference, rtol=1e-10)
+    logDet = np.linalg.slogdet(gm_data.listSigma[0])[1]
+    np.testing.assert_allclose(nlogl[:, 0], 0.5 * (reference + logDet + X.shape[1] * np.log(2 * np.pi)), rtol=1e-10)
+    assert np.all(nlogl[:, 1] == 42)
+
+
+def test_factors_follow_the_covariance():
+    X = random_features(np.float64)
+    gm_data, _ = fit(X)
+    gm_data.getNlogl(X)
+
+    gm_data.setParams(gm_data.mu, [2 * gm_data.listSigma[0], ])
+    _, mahal = gm_data.getNlogl(X)
+
+    np.testing.assert_allclose(mahal[:, 0], reference_mahal(X, gm_data.mu[0], gm_data.listSigma[0]), rtol=1e-10)
+
+
+def test_float32_stays_float32():
+    X = random_features(np.float32)
+    gm_data, _ = fit(X)
+
+    nlogl, mahal = gm_data.getNlogl(X)
+
+    assert gm_data.mu.dtype == np.float32
+    assert gm_data.listSigma[0].dtype == np.float32
+    assert nlogl.dtype == np.float32 and mahal.dtype == np.float32
+
+
+def test_float32_matches_float64():
+    X = random_features(np.float64)
+    gm_data64, avrLogl64 = fit(X)
+    gm_data32, avrLogl32 = fit(X.astype(np.float32))
+
+    np.testing.assert_allclose(avrLogl32, avrLogl64, rtol=1e-4)
+    np.testing.assert_allclose(gm_data32.getNlogl(X.astype(np.float32))[1], gm_data64.getNlogl(X)[1], rtol=1e-3,
+                               atol=1e-3)
+
+
+def test_EMgu_img_runs_in_the_type_of_the_spam():
+    randomState = np.random.RandomState(0)
+    spam = np.abs(randomState.rand(512) + randomState.randn(40, 50, 6) @ randomState.randn(6, 512) * 0.05 +
+                  0.002 * randomState.randn(40, 50, 512)).astype(np.float32)
+    valid = np.ones((40, 50), dtype=bool)
+
+    mahal32, other = EMgu_img(spam, valid, replicates=2)
+    mahal64, _ = EMgu_img(spam.astype(np.float64), valid, replicates=2)
+
+    assert mahal32.dtype == np.float32 and other['L'].dtype == np.float32 and other['mu'].dtype == np.float32
+    assert np.corrcoef(mahal32.flatten(), mahal64.flatten())[0, 1] > 0.9999
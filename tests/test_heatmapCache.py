@@ -0,0 +1,75 @@
+import os
+
+import numpy as np
+
+from Detectors.Noiseprint.heatmapCache import HeatmapCache
+
+
+def entry(seed, shape=(40, 50)):
+    randomState = np.random.RandomState(seed)
+    return randomState.rand(*shape), randomState.rand(*shape) > 0.5, {'avrLogl': float(seed)}
+
+
+def test_make_key_depends_on_content_and_parameters():
+    noiseprint, image = np.random.RandomState(0).rand(2, 30, 40)
+
+    key = HeatmapCache.make_key(noiseprint, image, preset='exact')
+
+    assert key == HeatmapCache.make_key(noiseprint.copy(), image.copy(), preset='exact')
+    assert key != HeatmapCache.make_key(noiseprint, image, preset='fast')
+    assert key != HeatmapCache.make_key(noiseprint.astype(np.float32), image, preset='exact')
+    noiseprint[0, 0] += 1e-6
+    assert key != HeatmapCache.make_key(noiseprint, image, preset='exact')
+
+
+def test_get_returns_copies():
+    cache = HeatmapCache()
+    heatmap, valid, other = entry(0)
+    cache.put("a", heatmap, valid, other)
+
+    cached = cache.get("a")
+    cached[0][:] = 0
+    cached[2]['avrLogl'] = 10
+
+    np.testing.assert_array_equal(cache.get("a")[0], heatmap)
+    assert cache.get("a")[2] == other
+    assert cache.get("b") is None
+    assert (cache.hits, cache.misses) == (3, 1)
+
+
+def test_least_recently_used_entries_are_evicted():
+    # each entry is 40 * 50 * 8 + 40 * 50 + 64 bytes, the budget holds two of them
+    cache = HeatmapCache(max_bytes=2 * (40 * 50 * 9 + 64))
+    for key in "abc":
+        if key == "c":
+            cache.get("a")
+        cache.put(key, *entry(ord(key)))
+
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.get("b") is None
+
+
+def test_disk_tier(tmp_path):
+    cache = HeatmapCache(cache_dir=str(tmp_path))
+    heatmap, valid, other = entry(0)
+    cache.put("a", heatmap, valid, other)
+    cache.clear()
+
+    cached = HeatmapCache(cache_dir=str(tmp_path)).get("a")
+
+    np.testing.assert_array_equal(cached[0], heatmap)
+    np.testing.assert_array_equal(cached[1], valid)
+    assert cached[2] == other
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
+
+
+def test_disk_budget_evicts_the_oldest_files(tmp_path):
+    # each file takes about 33 kB, the budget holds two of them
+    cache = HeatmapCache(cache_dir=str(tmp_path), max_disk_bytes=70000)
+    for index, key in enumerate("abc"):
+        cache.put(key, *entry(index, shape=(60, 60)))
+        os.utime(os.path.join(str(tmp_path), key + ".pkl"), (index, index))
+
+    cache.put("d", *entry(3, shape=(60, 60)))
+
+    assert sorted(os.listdir(tmp_path)) == ["c.pkl", "d.pkl"]
@@ -0,0 +1,80 @@
+import json
+
+import pytest
+
+from Ulitities.io.metrics import MetricsStream, read_metrics
+
+
+@pytest.mark.parametrize("extension", [".jsonl", ".csv"])
+def test_rows_round_trip(tmp_path, extension):
+    path = str(tmp_path / ("metrics" + extension))
+
+    stream = MetricsStream(path, buffer_size=4)
+    for step in range(1, 11):
+        stream.write(step=step, loss=1.0 / step, psnr=40.0 - step, step_time=None)
+    stream.close()
+
+    rows = read_metrics(path)
+    assert [row["step"] for row in rows] == list(range(1, 11))
+    assert [row["loss"] for row in rows] == pytest.approx([1.0 / step for step in range(1, 11)])
+    assert all(row["step_time"] is None for row in rows)
+
+
+def test_rows_are_buffered(tmp_path):
+    path = str(tmp_path / "metrics.jsonl")
+
+    stream = MetricsStream(path, buffer_size=3)
+    stream.write(step=1)
+    stream.write(step=2)
+    assert not (tmp_path / "metrics.jsonl").exists()
+
+    stream.write(step=3)
+    assert len(read_metrics(path)) == 3
+
+    stream.write(step=4)
+    stream.flush()
+    assert [row["step"] for row in read_metrics(path)] == [1, 2, 3, 4]
+
+
+def test_jsonl_rows_keep_their_own_keys(tmp_path):
+    path = str(tmp_path / "metrics.jsonl")
+
+    stream = MetricsStream(path)
+    stream.write(step=1, loss=0.5)
+    stream.write(step=2, note="done")
+    stream.close()
+
+    with open(path) as file:
+        assert [json.loads(line) for line in file] == [{"step": 1, "loss": 0.5}, {"step": 2, "note": "done"}]
+
+
+def test_csv_appends_to_an_existing_file_with_its_columns(tmp_path):
+    path = str(tmp_path / "metrics.csv")
+
+    stream = MetricsStream(path)
+    stream.write(step=1, loss=0.5, psnr=40)
+    stream.close()
+
+    # a resumed attack appends to the same file, following the columns of its header
+    stream = MetricsStream(path)
+    stream.write(psnr=39, step=2, loss=0.25)
+    stream.close()
+
+    with open(path) as file:
+        assert file.read().splitlines() == ["step,loss,psnr", "1,0.5,40", "2,0.25,39"]
+
+    assert read_metrics(path) == [dict(step=1, loss=0.5, psnr=40), dict(step=2, loss=0.25, psnr=39)]
+
+
+def test_csv_extra_columns_keep_the_values_of_later_rows(tmp_path):
+    path = str(tmp_path / "metrics.csv")
+
+    stream = MetricsStream(path, extra_columns=["stop_reason"])
+    stream.write(step=1, loss=0.5)
+    stream.write(step=2, loss=0.25)
+    stream.write(step=2, stop_reason="loss plateau")
+    stream.close()
+
+    rows = read_metrics(path)
+    assert [row["stop_reason"] for row in rows] == [None, None, "loss plateau"]
+    assert rows[-1]["loss"] is None
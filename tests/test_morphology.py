@@ -0,0 +1,69 @@
+import numpy as np
+from scipy.ndimage import maximum_filter, minimum_filter
+from skimage.morphology import binary_opening, disk
+
+from Detectors.Noiseprint.utility.morphology import binaryOpeningDisk, diskRectangles, maxFilter, minFilter
+
+
+def random_bitmap(shape, density, seed=0):
+    return (np.random.RandomState(seed).rand(*shape) < density).astype(np.uint8)
+
+
+def test_maxFilter_matches_scipy():
+    x = np.random.RandomState(0).rand(57, 83).astype(np.float32)
+
+    # small windows are filtered directly, large ones with the van Herk/Gil-Werman algorithm
+    for size in [(1, 1), (3, 5), (9, 9), (11, 7), (35, 35), (61, 101)]:
+        np.testing.assert_array_equal(maxFilter(x, size), maximum_filter(x, size, mode='constant', cval=0))
+
+
+def test_minFilter_matches_scipy():
+    x = random_bitmap((40, 70), 0.9)
+
+    for size in [(3, 3), (7, 1), (13, 21)]:
+        np.testing.assert_array_equal(minFilter(x, size), minimum_filter(x, size, mode='constant', cval=1))
+
+
+def test_diskRectangles_cover_the_disk():
+    for radius in range(1, 8):
+        union = np.zeros((2 * radius + 1, 2 * radius + 1), dtype=bool)
+        for height, width in diskRectangles(radius):
+            union[radius - height // 2:radius + height // 2 + 1, radius - width // 2:radius + width // 2 + 1] = True
+
+        np.testing.assert_array_equal(union, disk(radius).astype(bool))
+
+
+def test_binaryOpeningDisk_matches_skimage():
+    for seed, density in enumerate([0.02, 0.3, 0.7, 0.95]):
+        mask = random_bitmap((64, 96), density, seed)
+        mask[10:30, 20:50] = 1
+
+        for radius in [1, 3, 5]:
+            expected = binary_opening(mask.astype(bool), disk(radius))
+            np.testing.assert_array_equal(binaryOpeningDisk(mask, radius).astype(bool), expected)
+
+
+def test_binaryOpeningDisk_of_an_empty_mask():
+    mask = np.zeros((20, 30), dtype=np.uint8)
+
+    assert not np.any(binaryOpeningDisk(mask, 3))
+
+
+def test_getWeights_matches_skimage_and_scipy():
+    from scipy.ndimage import uniform_filter
+    from Detectors.Noiseprint.post_em import getWeights, win_v, win_z
+
+    randomState = np.random.RandomState(0)
+    img = randomState.rand(120, 150) * 0.9
+    img[30:60, 40:90] = 254.0 / 256
+    res = randomState.randn(120, 150) * 0.1
+    res[70:100, 10:40] = 0
+
+    # formulation of the weights with skimage and scipy filters on boolean bitmaps
+    res_v = uniform_filter(np.square(res), (win_v, win_v)) - np.square(uniform_filter(res, (win_v, win_v)))
+    mm = res_v < 0.005
+    mm[:1, :] = mm[-1:, :] = mm[:, :1] = mm[:, -1:] = True
+    mm = np.logical_or(mm, binary_opening(img > 253.0 / 256, disk(3)))
+    expected = np.logical_not(maximum_filter(mm, (win_z, win_z)))
+
+    np.testing.assert_array_equal(getWeights(img, res), expected)
@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("tensorflow")
+
+from sklearn.metrics import f1_score
+
+from Detectors.Noiseprint.noiseprintEngine import search_threshold
+
+
+def test_search_threshold_is_the_brute_force_optimum():
+    randomState = np.random.RandomState(0)
+    mask = np.zeros((50, 60))
+    mask[20:35, 10:40] = 1
+    heatmap = np.round(mask * 300 + randomState.rand(50, 60) * 600)
+
+    result = search_threshold(heatmap, mask)
+
+    scores = [f1_score(mask.flatten() > 0, heatmap.flatten() > threshold) for threshold in np.unique(heatmap)]
+    assert result['f1'] == pytest.approx(max(scores))
+    assert f1_score(mask.flatten() > 0, heatmap.flatten() > result['threshold']) == pytest.approx(max(scores))
+
+
+@pytest.fixture
+def engine(monkeypatch):
+    from Detectors.Noiseprint import noiseprintEngine
+    from Detectors.Noiseprint.heatmapCache import HeatmapCache
+
+    calls = []
+
+    def post(noiseprint, image, init=None, preset='exact', timeBudget=None, callback=None):
+        calls.append(timeBudget)
+        if callback is not None:
+            callback('stage', {'name': 'em', 'time': 0.0})
+        valid = np.ones((2, 2), dtype=bool)
+        return np.full((2, 2), float(len(calls))), valid, np.array([0, 8]), np.array([0, 8]), image.shape, {}
+
+    monkeypatch.setattr(noiseprintEngine, "noiseprint_blind_post", post)
+    monkeypatch.setattr(noiseprintEngine.NoiseprintEngine, "setup_on_init", False)
+    monkeypatch.setattr(noiseprintEngine.NoiseprintEngine, "heatmap_cache", HeatmapCache())
+
+    engine = noiseprintEngine.NoiseprintEngine()
+    engine.predict = lambda image: np.asarray(image) - 0.5
+    engine.calls = calls
+    return engine
+
+
+def test_detect_caches_the_heatmaps(engine):
+    image = np.random.RandomState(0).rand(16, 16)
+
+    first = engine.detect(image)
+    second = engine.detect(image)
+
+    assert len(engine.calls) == 1
+    np.testing.assert_array_equal(first, second)
+
+
+def test_detect_bypasses_the_cache_with_a_time_budget_or_a_callback(engine):
+    image = np.random.RandomState(0).rand(16, 16)
+    engine.detect(image)
+
+    engine.post_time_budget = 1.0
+    engine.detect(image)
+    engine.detect(image)
+    engine.post_time_budget = None
+
+    events = []
+    engine.post_callback = lambda event, data: events.append(event)
+    engine.detect(image)
+
+    assert engine.calls == [None, 1.0, 1.0, None]
+    assert events == ['stage']
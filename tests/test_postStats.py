@@ -0,0 +1,33 @@
+import numpy as np
+
+from Detectors.Noiseprint.noiseprint_blind import noiseprint_blind_post
+from Detectors.Noiseprint.postStats import PostStatsAggregator
+
+
+def test_aggregator_collects_the_runs_of_noiseprint_blind_post():
+    randomState = np.random.RandomState(0)
+    aggregator = PostStatsAggregator()
+
+    others = []
+    for index in range(2):
+        img = randomState.rand(256, 256) * 0.8
+        res = randomState.randn(256, 256)
+        res[64:160, 64:160] *= 2
+        others.append(noiseprint_blind_post(res, img, preset='preview', callback=aggregator)[5])
+
+    assert [stats is other['stats'] for stats, other in zip(aggregator.runs, others)] == [True, True]
+
+    summary = aggregator.summary()
+    assert summary['runs'] == 2
+    assert set(summary['times']) == {'weights', 'spam', 'pca', 'em', 'scoring'}
+    assert summary['replicates_per_run'] == 2
+    assert len(summary['best_replicate']) == 2
+
+
+def test_aggregator_ignores_the_other_events():
+    aggregator = PostStatsAggregator()
+
+    aggregator('stage', {'name': 'em', 'time': 1.0})
+    aggregator('iteration', {'replicate': 0, 'iteration': 0, 'avrLogl': 0.0})
+
+    assert aggregator.summary() == {'runs': 0}
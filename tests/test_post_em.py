@@ -0,0 +1,66 @@
+import warnings
+
+import numpy as np
+import pytest
+
+from Detectors.Noiseprint.post_em import streamingCov, randomizedEigh, faetReduce
+
+
+def features(spectrum, N=20000, seed=0):
+    """
+    Random features whose covariance has the given eigenvalues (in a random basis) and a non zero mean
+    """
+    randomState = np.random.RandomState(seed)
+    basis, _ = np.linalg.qr(randomState.standard_normal((len(spectrum), len(spectrum))))
+    feat_list = np.matmul(randomState.standard_normal((N, len(spectrum))) * np.sqrt(spectrum), basis.transpose())
+    return (feat_list + 3).astype(np.float32)
+
+
+@pytest.mark.parametrize("chunkSize", [1000, 4096, 50000])
+def test_streamingCov_matches_numpy(chunkSize):
+    feat_list = features(0.8 ** np.arange(32))
+
+    expected = np.cov(feat_list.astype(np.float64), rowvar=False, bias=True)
+
+    np.testing.assert_allclose(streamingCov(feat_list, chunkSize), expected, rtol=0, atol=1e-5 * np.max(expected))
+
+
+def test_randomizedEigh_matches_the_top_eigenpairs():
+    randomState = np.random.RandomState(1)
+    basis, _ = np.linalg.qr(randomState.standard_normal((64, 64)))
+    cov_mtx = np.matmul(basis * 0.7 ** np.arange(64), basis.transpose())
+
+    w, v = randomizedEigh(cov_mtx, 8)
+
+    w_exact, v_exact = np.linalg.eigh(cov_mtx)
+    np.testing.assert_allclose(w, w_exact[::-1][:8], rtol=1e-8)
+    # eigenvectors are defined up to their sign
+    np.testing.assert_allclose(np.abs(np.sum(v * v_exact[:, ::-1][:, :8], axis=0)), 1, rtol=1e-8)
+
+
+def test_randomized_faetReduce_keeps_the_top_components():
+    feat_list = features(0.7 ** np.arange(64))
+    inds = [0, 1, 2, 3]
+
+    v_exact, w_exact = faetReduce(feat_list, inds, chunkSize=4096)
+    # the accuracy guard does not reject the randomized solution
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        v, w = faetReduce(feat_list, inds, randomized=True, checkTol=1e-3)
+
+    assert len(w) == max(inds) + 1
+    np.testing.assert_allclose(w, w_exact[:len(w)], rtol=1e-6)
+    np.testing.assert_allclose(np.abs(np.sum(v * v_exact, axis=0)), 1, rtol=1e-6)
+
+
+def test_flat_spectrum_falls_back_to_the_exact_decomposition():
+    feat_list = features(np.ones(64))
+    inds = [0, 1, 2, 3]
+
+    v_exact, w_exact = faetReduce(feat_list, inds, chunkSize=16384)
+    with pytest.warns(UserWarning, match="randomized PCA not accurate"):
+        v, w = faetReduce(feat_list, inds, randomized=True, checkTol=1e-3)
+
+    assert len(w) == 64
+    np.testing.assert_array_equal(w, w_exact)
+    np.testing.assert_array_equal(v, v_exact)
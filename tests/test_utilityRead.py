@@ -0,0 +1,63 @@
+import numpy as np
+from scipy.interpolate import interp1d
+from sklearn.metrics import f1_score, matthews_corrcoef
+
+from Detectors.Noiseprint.utility.utilityRead import computeF1MCCThresholds, getResizeIndices, resizeMapWithPadding
+
+
+def reference_resize(x, range0, range1, shapeOut):
+    # nearest neighbour resize with two scipy interpolators
+    y = interp1d(range1, x, axis=1, kind='nearest', fill_value='extrapolate', assume_sorted=True, bounds_error=False)
+    y = interp1d(range0, y(np.arange(shapeOut[1])), axis=0, kind='nearest', fill_value='extrapolate',
+                 assume_sorted=True, bounds_error=False)
+    return y(np.arange(shapeOut[0])).astype(x.dtype)
+
+
+def test_resizeMapWithPadding_matches_interp1d():
+    randomState = np.random.RandomState(0)
+
+    # grids of the SPAM maps (the midpoints between samples fall on pixels) and irregular grids
+    grids = [(np.arange(40, 500, 8), np.arange(40, 700, 8), (530, 733)),
+             (np.arange(3, 60, 7), np.arange(0, 90, 5), (64, 91)),
+             (np.sort(randomState.choice(200, 30, replace=False)), np.sort(randomState.choice(150, 20, replace=False)),
+              (210, 150))]
+
+    for range0, range1, shapeOut in grids:
+        x = randomState.rand(range0.size, range1.size).astype(np.float32)
+
+        result = resizeMapWithPadding(x, range0.astype(np.uint16), range1.astype(np.uint16), shapeOut)
+
+        assert result.dtype == x.dtype
+        np.testing.assert_array_equal(result, reference_resize(x, range0, range1, shapeOut))
+
+
+def test_getResizeIndices_are_cached_and_read_only():
+    range0, range1 = tuple(range(40, 200, 8)), tuple(range(40, 300, 8))
+
+    inds0, inds1 = getResizeIndices(range0, range1, (230, 330))
+
+    assert getResizeIndices(range0, range1, (230, 330))[0] is inds0
+    assert not inds0.flags.writeable and not inds1.flags.writeable
+
+
+def brute_force_metrics(values, gt, threshold):
+    pred = values.flatten() > threshold
+    gt = gt.flatten() > 0
+    return f1_score(gt, pred, zero_division=0), matthews_corrcoef(gt, pred)
+
+
+def test_computeF1MCCThresholds_matches_brute_force():
+    randomState = np.random.RandomState(0)
+    gt = np.zeros((30, 40))
+    gt[10:20, 5:25] = 1
+    # quantized values, so that there are ties across the ground truth classes
+    values = np.round(gt * 2 + randomState.randn(30, 40) * 1.5, 1)
+
+    f1, mcc, thresholds = computeF1MCCThresholds(values, gt)
+
+    assert thresholds[0] == -np.inf
+    assert np.all(np.diff(thresholds) > 0)
+    np.testing.assert_array_equal(thresholds[1:], np.unique(values))
+    for index, threshold in enumerate(thresholds):
+        expected_f1, expected_mcc = brute_force_metrics(values, gt, threshold)
+        np.testing.assert_allclose([f1[index], mcc[index]], [expected_f1, expected_mcc], atol=1e-12)